@@ -1,16 +1,57 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Blueprint, current_app, render_template, request, jsonify, g, Response, stream_with_context
+import numpy as np
 import pandas as pd
+import collections
+import contextlib
 import datetime
+import hashlib
+import hmac
+import logging
+import math
 import os
-
-app = Flask(__name__)
+import threading
+import time
+
+import archive
+import constraints
+import eta
+import geo
+import keys
+import kpi
+import rotation
+import metrics
+import search
+import serialization
+import shards
+import tasks
+import validation
+from fragments import FragmentCache
+from persistence import WriteBehindPersister
+from history import Command, History, HistoryConflict
+from jobs import JobRunner, JobStore
+from profiler import profiler
+from sandbox import Sandbox, SandboxStore
+from app_logging import configure_logging, get_logger
+
+# Reference point for the startup times reported in /metrics (after the library imports)
+IMPORT_STARTED = time.perf_counter()
+
+# Routes and request hooks; registered on the application by create_app()
+bp = Blueprint('mobility', __name__)
+
+logger = get_logger('app')
+transport_logger = get_logger('transport')
 
 # Get the directory where this script is located
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Directory holding the CSV data files, overridable for benchmarks and tooling
+DATA_DIR = os.environ.get('MOBILITY_DATA_DIR', BASE_DIR)
 
 
 class Stop:
     registry = {}
+    # Stop key (2 * shipment key, + 1 for the delivery) -> Stop
+    table = keys.ObjectArray()
 
     def __init__(self, shipment_obj, stop_type):
         """
@@ -28,11 +69,14 @@ class Stop:
         self.shipment = shipment_obj
         self.Type = stop_type
         self.ID = f"{shipment_obj.Shipment_ID}_{stop_type}"
-        self.Sequence = 0  # Default sequence, will be set when added to transport
+        self.key = keys.stop_key(shipment_obj.key, stop_type)
+        self._sequence = 0  # Default sequence, will be set when added to transport
+        self._sequence_owner = None  # StopSequence this stop currently belongs to
 
         if self.ID in Stop.registry:
             raise ValueError(f"Stop with ID '{self.ID}' already exists.")
         Stop.registry[self.ID] = self
+        Stop.table.bind(self.key, self)
 
         # Inherit additional attributes from the Shipment object
         self.Transport = shipment_obj.Transport
@@ -67,6 +111,22 @@ class Stop:
             self.Country = shipment_obj.Delivery_Country
             self.Instructions = shipment_obj.Customer_Reference
 
+    @property
+    def Sequence(self):
+        # Sequence numbers are assigned lazily after adds/removes, see StopSequence
+        owner = self._sequence_owner
+        if owner is not None and owner.needs_renumber:
+            owner.renumber()
+        return self._sequence
+
+    @Sequence.setter
+    def Sequence(self, value):
+        self._sequence = value
+
+    @property
+    def Shipment_ID(self):
+        return self.shipment.Shipment_ID
+
     @classmethod
     def get_by_id(cls, stop_id):
         """
@@ -77,15 +137,165 @@ class Stop:
     def __repr__(self):
         return f"<Stop(ID='{self.ID}', Type='{self.Type}', City='{self.City}', Date='{self.Date}')>"
 
+class StopSequence:
+    """
+    Ordered stops of a transport as a doubly linked list keyed by stop key (see keys.py).
+
+    Appending and removing a stop are O(1), and so are the first/last stop
+    lookups (Stops[0] / Stops[-1]) used by the list views. Sequence numbers
+    are not rewritten on every change; the sequence is marked for renumbering
+    and the numbers are assigned in one pass the next time they are read.
+    The list order is the source of truth: Sequence is always the 1-based
+    position in the list, so reordering means relinking the list.
+    """
+
+    def __init__(self, stops=()):
+        self._stops = {}
+        self._next = {}
+        self._prev = {}
+        self._head = None
+        self._tail = None
+        self.needs_renumber = False
+        for stop in stops:
+            self.append(stop)
+
+    def append(self, stop):
+        key = stop.key
+        if key in self._stops:
+            raise ValueError(f"Stop '{stop.ID}' is already in this transport.")
+        self._stops[key] = stop
+        self._prev[key] = self._tail
+        self._next[key] = None
+        if self._tail is None:
+            self._head = key
+        else:
+            self._next[self._tail] = key
+        self._tail = key
+        stop._sequence_owner = self
+        self.needs_renumber = True
+
+    def remove(self, stop):
+        """Unlinks a stop; returns False if it is not part of the sequence."""
+        key = stop.key
+        if self._stops.get(key) is not stop:
+            return False
+        prev_key = self._prev.pop(key)
+        next_key = self._next.pop(key)
+        del self._stops[key]
+        if prev_key is None:
+            self._head = next_key
+        else:
+            self._next[prev_key] = next_key
+        if next_key is None:
+            self._tail = prev_key
+        else:
+            self._prev[next_key] = prev_key
+        stop._sequence_owner = None
+        self.needs_renumber = True
+        return True
+
+    def reorder(self, stop_ids):
+        """
+        Relinks the stops in the given order and renumbers them, in one O(n) pass.
+
+        Args:
+            stop_ids (list): Every stop ID of the sequence exactly once.
+        """
+        stops = [Stop.registry.get(stop_id) for stop_id in stop_ids]
+        if any(stop is None for stop in stops):
+            raise ValueError("New order must contain every stop of the transport exactly once.")
+        self._relink([stop.key for stop in stops])
+
+    def _relink(self, order):
+        if len(order) != len(self._stops) or set(order) != self._stops.keys():
+            raise ValueError("New order must contain every stop of the transport exactly once.")
+        prev_key = None
+        for idx, key in enumerate(order, start=1):
+            self._prev[key] = prev_key
+            if prev_key is not None:
+                self._next[prev_key] = key
+            self._stops[key]._sequence = idx
+            prev_key = key
+        if prev_key is not None:
+            self._next[prev_key] = None
+        self._head = order[0] if order else None
+        self._tail = prev_key
+        self.needs_renumber = False
+
+    def move(self, stop, sequence):
+        """Moves a stop to a 1-based position; the stops in between shift by one."""
+        order = [key for key in self._keys() if key != stop.key]
+        order.insert(sequence - 1, stop.key)
+        self._relink(order)
+
+    def ids(self):
+        return [stop.ID for stop in self._iter_stops()]
+
+    def renumber(self):
+        self.needs_renumber = False
+        for idx, stop in enumerate(self._iter_stops(), start=1):
+            stop._sequence = idx
+
+    def _keys(self):
+        key = self._head
+        while key is not None:
+            yield key
+            key = self._next[key]
+
+    def _iter_stops(self):
+        key = self._head
+        while key is not None:
+            yield self._stops[key]
+            key = self._next[key]
+
+    def __iter__(self):
+        if self.needs_renumber:
+            self.renumber()
+        return self._iter_stops()
+
+    def __len__(self):
+        return len(self._stops)
+
+    def __contains__(self, stop):
+        return self._stops.get(stop.key) is stop
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self)[index]
+        if index == 0 and self._head is not None:
+            return self._stops[self._head]
+        if index == -1 and self._tail is not None:
+            return self._stops[self._tail]
+        return list(self)[index]
+
+    def __repr__(self):
+        return repr(list(self))
+
+def _as_date(value):
+    """Converts a date string, Timestamp or date to a datetime.date."""
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    if isinstance(value, str):
+        try:
+            return datetime.date.fromisoformat(value)
+        except ValueError:
+            pass
+    return pd.to_datetime(value).date()
+
 # Define the Shipment class
 class Shipment:
-    registry = {}
+    registry = shards.ShardedRegistry('Department')
+    # Shipment_ID <-> integer key, and the Shipment of each key
+    key_table = keys.KeyTable()
 
     def __init__(self, Shipment_ID, Transport, Department, Pickup_time, Pickup_date, Delivery_time, Delivery_date,
                  Collection_Name, Collection_City, Collection_Address, Collection_Postal_Code, Collection_Country,
                  Delivery_Name, Delivery_City, Delivery_Address, Delivery_Postal_Code, Delivery_Country,
                  Weight, Volume, Ldm, Content, Units, Unit_type, Hazardous, Cost,
-                 Finance_Department="", Incoterm="", Customer="", Loading_Instructions="", Customer_Reference="", Additional_Information="", Services=[]):
+                 Finance_Department="", Incoterm="", Customer="", Loading_Instructions="", Customer_Reference="", Additional_Information="", Services=[],
+                 min_temperature=-99.0, max_temperature=99.0):
         self.Shipment_ID = Shipment_ID
         self.Transport = Transport
         self.Department = Department
@@ -118,7 +328,11 @@ class Shipment:
         self.Customer_Reference = Customer_Reference
         self.Additional_Information = Additional_Information
         self.Services = Services
+        # Required temperature range; -99/99 means no requirement
+        self.min_temperature = min_temperature
+        self.max_temperature = max_temperature
 
+        self.key = Shipment.key_table.intern(Shipment_ID)
         Shipment.registry[Shipment_ID] = self
 
         # Generate stops upon initialization
@@ -127,30 +341,46 @@ class Shipment:
             pickup_stop = Stop(self, 'P')
             self.stops.append(pickup_stop)
         except ValueError as e:
-            print(f"Warning: Could not create pickup stop for shipment {self.Shipment_ID}: {e}")
+            logger.warning("Could not create pickup stop for shipment %s: %s", self.Shipment_ID, e)
 
         try:
             delivery_stop = Stop(self, 'D')
             self.stops.append(delivery_stop)
         except ValueError as e:
-            print(f"Warning: Could not create delivery stop for shipment {self.Shipment_ID}: {e}")
+            logger.warning("Could not create delivery stop for shipment %s: %s", self.Shipment_ID, e)
 
     @classmethod
     def get_by_id(cls, shipment_id):
         return cls.registry.get(shipment_id)
 
+    @classmethod
+    def get_by_key(cls, key):
+        return cls.key_table.get(key)
+
     def __repr__(self):
         return f"<Shipment(Shipment_ID='{self.Shipment_ID}', Department='{self.Department}', Transport='{self.Transport}')>"
 
 class Transport:
-    registry = {}
+    registry = shards.ShardedRegistry('Department')
+    # Transport_ID <-> integer key, and the registered Transport of each key
+    key_table = keys.KeyTable()
 
     def __init__(self, Transport_ID, department, shipments_list, Pickup_date, Delivery_date, Weight, Volume, Ldm, Cost):
         if Transport_ID in Transport.registry:
             raise ValueError(f"Transport with ID '{Transport_ID}' already exists.")
         self.Transport_ID = Transport_ID
+        self.key = Transport.key_table.intern(Transport_ID)
         self.Department = department
-        self.Shipments = shipments_list
+        # Shipment keys as an insertion-ordered set (dict keys) for O(1) membership and removal
+        self._shipments = dict.fromkeys(Shipment.key_table.intern(shipment_id) for shipment_id in shipments_list)
+        # Counted multisets of pickup/delivery dates, so the earliest pickup and latest
+        # delivery can be kept up to date when shipments are removed
+        self._pickup_dates = collections.Counter()
+        self._delivery_dates = collections.Counter()
+        for shipment_key in self._shipments:
+            shipment_obj = Shipment.get_by_key(shipment_key)
+            if shipment_obj:
+                self._count_dates(shipment_obj, 1)
         self.Pickup_date = Pickup_date
         self.Delivery_date = Delivery_date
         self.Weight = Weight
@@ -170,112 +400,222 @@ class Transport:
         self.Sheet = 1
 
         # Collect all Stop objects from the associated Shipments
-        self.Stops = []
+        self._stops = StopSequence()
 
         Transport.registry[self.Transport_ID] = self
 
+    @property
+    def Shipments(self):
+        external = Shipment.key_table.external
+        return [external(key) for key in self._shipments]
+
+    @property
+    def Stops(self):
+        return self._stops
+
+    @Stops.setter
+    def Stops(self, stops):
+        for stop in self._stops:
+            stop._sequence_owner = None
+        self._stops = StopSequence(stops)
+
+    def has_shipments(self):
+        return bool(self._shipments)
+
+    def has_shipment(self, shipment_id):
+        key = Shipment.key_table.key(shipment_id)
+        return key is not None and key in self._shipments
+
+    def _count_dates(self, shipment_obj, delta):
+        try:
+            pickup = _as_date(shipment_obj.Pickup_date)
+            delivery = _as_date(shipment_obj.Delivery_date)
+        except (ValueError, TypeError) as e:
+            transport_logger.warning("Date error: %s", e)
+            return
+        for counter, date in ((self._pickup_dates, pickup), (self._delivery_dates, delivery)):
+            counter[date] += delta
+            if counter[date] <= 0:
+                del counter[date]
+
+    def _refresh_dates(self):
+        # The multisets hold one key per distinct date, typically a handful of days
+        if self._pickup_dates:
+            self.Pickup_date = min(self._pickup_dates)
+        if self._delivery_dates:
+            self.Delivery_date = max(self._delivery_dates)
+
+    def add_shipments(self, shipment_objs):
+        """
+        Adds shipments with their pickup and delivery stops and updates the running totals.
+
+        Runs in O(k) for k added shipments, independent of the transport size.
+
+        Args:
+            shipment_objs (list): Shipment objects not yet part of this transport.
+
+        Returns:
+            list: IDs of the shipments that were added.
+        """
+        added = []
+        for shipment_obj in shipment_objs:
+            if shipment_obj.key in self._shipments:
+                continue
+            self._shipments[shipment_obj.key] = None
+            self.Weight += shipment_obj.Weight
+            self.Volume += shipment_obj.Volume
+            self.Ldm += shipment_obj.Ldm
+            self.Cost += shipment_obj.Cost
+            self._count_dates(shipment_obj, 1)
+            # 'P' type before 'D' type
+            for stop in shipment_obj.stops:
+                self._stops.append(stop)
+            shipment_obj.Transport = self.Transport_ID
+            added.append(shipment_obj.Shipment_ID)
+        self._refresh_dates()
+        if added:
+            Transport.registry.notify(self.Transport_ID)
+        for shipment_id in added:
+            Shipment.registry.notify(shipment_id)
+        return added
+
+    def remove_shipments(self, shipment_objs):
+        """
+        Removes shipments and their stops and updates the running totals.
+
+        Runs in O(k) for k removed shipments, independent of the transport size.
+
+        Args:
+            shipment_objs (list): Shipment objects to remove; ones not on this transport are skipped.
+
+        Returns:
+            list: IDs of the shipments that were removed.
+        """
+        removed = []
+        for shipment_obj in shipment_objs:
+            if shipment_obj.key not in self._shipments:
+                continue
+            del self._shipments[shipment_obj.key]
+            self.Weight -= shipment_obj.Weight
+            self.Volume -= shipment_obj.Volume
+            self.Ldm -= shipment_obj.Ldm
+            self.Cost -= shipment_obj.Cost
+            self._count_dates(shipment_obj, -1)
+            for stop in shipment_obj.stops:
+                self._stops.remove(stop)
+            shipment_obj.Transport = None
+            removed.append(shipment_obj.Shipment_ID)
+        self._refresh_dates()
+        if removed:
+            Transport.registry.notify(self.Transport_ID)
+        for shipment_id in removed:
+            Shipment.registry.notify(shipment_id)
+        return removed
+
     @classmethod
     def get_by_id(cls, Transport_ID):
         return cls.registry.get(Transport_ID)
 
+    @classmethod
+    def get_by_key(cls, key):
+        return cls.key_table.get(key)
+
     def __repr__(self):
         return f"<Transport(ID='{self.Transport_ID}', Department='{self.Department}', Shipments={self.Shipments}, Weight={self.Weight}, Volume={self.Volume}, Ldm={self.Ldm}, status={self.Status}, vehicle={self.Vehicle}, Haulier={self.Haulier}, Driver={self.Driver}, Trailer={self.Trailer}, Cost={self.Cost}, Sheet={self.Sheet})>"
 
+def _bind_key(table):
+    # Keeps a KeyTable's key -> object array in step with a registry, including removals and undo
+    def listener(external_id, obj):
+        key = table.intern(external_id)
+        if obj is None:
+            table.unbind(key)
+        else:
+            table.bind(key, obj)
+    return listener
+
+Shipment.registry.subscribe(_bind_key(Shipment.key_table))
+Transport.registry.subscribe(_bind_key(Transport.key_table))
+
+# Transports by day of their Pickup_date, for the date filters of the list views; a transport moves
+# to another day when adding or removing shipments changes its Pickup_date (registry.notify())
+transport_dates = shards.DateIndex('Pickup_date', 'Department', day=_as_date)
+Transport.registry.subscribe(transport_dates)
+
 # Global counter
 department_sequence_counters = {}
+# Per-department locks; operations on different departments run concurrently
+department_locks = shards.ShardLocks()
+# Guards the allocation of Transport IDs, which are unique over all departments
+transport_ids_lock = threading.Lock()
 
 def Transport_create(list_of_shipments_df):
+    """
+    Creates a transport from shipments that are not on a transport yet.
+
+    Callers that also write the shipments table hold the department locks of the shipments
+    around this call and that write (see _shipment_departments()), so that no other request
+    can plan the same shipments in between.
+    """
     if list_of_shipments_df.empty:
         raise ValueError("Input DataFrame is empty. Cannot create a Transport object.")
 
-    # Check if any shipments are already assigned
-    assigned_shipments = list_of_shipments_df[list_of_shipments_df['Transport'].notnull() & (list_of_shipments_df['Transport'] != '')]
-    if not assigned_shipments.empty:
-        raise ValueError("Can't create transport due to a selected shipment already being tied to a transport")
-
     # Get department from the first shipment
     department = list_of_shipments_df.iloc[0]['Department']
 
     # Get a list of Shipment_IDs for the Transport object
     Shipment_IDs = list_of_shipments_df['Shipment_ID'].tolist()
 
-    # Calculate Pickup_date (earliest date) and Delivery_date (latest date)
-    try:
-        earliest_pickup_date = pd.to_datetime(list_of_shipments_df['Pickup_date']).min().date()
-        latest_delivery_date = pd.to_datetime(list_of_shipments_df['Delivery_date']).max().date()
-    except Exception as e:
-        print(f"Date error: {e}")
-        earliest_pickup_date = datetime.date.today()
-        latest_delivery_date = datetime.date.today()
-
-    # Calculate combined Weight, Volume, and Ldm
-    total_weight = list_of_shipments_df['Weight'].sum()
-    total_volume = list_of_shipments_df['Volume'].sum()
-    total_ldm = list_of_shipments_df['Ldm'].sum()
-    total_cost = list_of_shipments_df['Cost'].sum()
-
-    # Collect stops from shipments, 'P' type before 'D' type
-    transport_stops = []
-    sequence = 1
-    for shipment_id in Shipment_IDs:
-        pickup_stop_id = f"{shipment_id}_P"
-        delivery_stop_id = f"{shipment_id}_D"
-
-        pickup_stop_obj = Stop.get_by_id(pickup_stop_id)
-        delivery_stop_obj = Stop.get_by_id(delivery_stop_id)
-
-        if pickup_stop_obj:
-            pickup_stop_obj.Sequence = sequence
-            transport_stops.append(pickup_stop_obj)
-            sequence += 1
-        if delivery_stop_obj:
-            delivery_stop_obj.Sequence = sequence
-            transport_stops.append(delivery_stop_obj)
-            sequence += 1
-
-    # Ensure the department has an entry in the sequence counter
-    if department not in department_sequence_counters:
-        department_sequence_counters[department] = 0
-
-    # Generate a unique sequential Transport ID
-    Transport_ID = None
-    max_sequence_value = 9999
-
-    while True:
-        department_sequence_counters[department] += 1
-        sequence_num = department_sequence_counters[department]
-
-        if sequence_num > max_sequence_value:
-            raise ValueError(f"Exceeded maximum sequential IDs ({max_sequence_value}) for department '{department}'.")
-
-        formatted_sequence = f"{sequence_num:04d}"
-        proposed_id = f"TOUR01-{formatted_sequence}"
-
-        if Transport.get_by_id(proposed_id) is None:
-            Transport_ID = proposed_id
-            break
-
-    # Create the Transport object
-    new_transport = Transport(
-        Transport_ID,
-        department,
-        Shipment_IDs,
-        earliest_pickup_date,
-        latest_delivery_date,
-        total_weight,
-        total_volume,
-        total_ldm,
-        total_cost
-    )
-
-    # Update the Transport_ID for each shipment object
-    new_transport.Stops = transport_stops
-    for Shipment_ID in Shipment_IDs:
-        shipment_obj = Shipment.get_by_id(Shipment_ID)
-        if shipment_obj:
-            shipment_obj.Transport = new_transport.Transport_ID
-
-    print(f"Department set to {department} and Created Transport object with ID: {new_transport.Transport_ID}")
+    with department_locks.hold([department]):
+        # Check if any shipments are already assigned; the Shipment objects are checked as well,
+        # since the selected rows may have been read before another request planned them
+        shipment_objs = [Shipment.get_by_id(shipment_id) for shipment_id in Shipment_IDs]
+        assigned_shipments = list_of_shipments_df[list_of_shipments_df['Transport'].notnull() & (list_of_shipments_df['Transport'] != '')]
+        if not assigned_shipments.empty or not all(_is_unassigned(s.Transport) for s in shipment_objs if s):
+            raise ValueError("Can't create transport due to a selected shipment already being tied to a transport")
+
+        # Transport IDs are global while the counters are per department; one lock over all
+        # departments keeps two departments from taking the same ID
+        with transport_ids_lock:
+            # Ensure the department has an entry in the sequence counter
+            if department not in department_sequence_counters:
+                department_sequence_counters[department] = 0
+
+            # Generate a unique sequential Transport ID
+            Transport_ID = None
+            max_sequence_value = 9999
+
+            while True:
+                department_sequence_counters[department] += 1
+                sequence_num = department_sequence_counters[department]
+
+                if sequence_num > max_sequence_value:
+                    raise ValueError(f"Exceeded maximum sequential IDs ({max_sequence_value}) for department '{department}'.")
+
+                formatted_sequence = f"{sequence_num:04d}"
+                proposed_id = f"TOUR01-{formatted_sequence}"
+
+                # Archived transports keep their IDs
+                if Transport.get_by_id(proposed_id) is None and not transport_archive.has_transport(proposed_id):
+                    Transport_ID = proposed_id
+                    break
+
+            # Create the Transport object; it is registered under its ID before the lock is released
+            new_transport = Transport(
+                Transport_ID,
+                department,
+                [],
+                datetime.date.today(),
+                datetime.date.today(),
+                0,
+                0,
+                0,
+                0
+            )
+        # Totals, dates and stops ('P' type before 'D' type) are accumulated from the Shipment objects
+        new_transport.add_shipments([shipment_obj for shipment_obj in shipment_objs if shipment_obj])
+
+    transport_logger.info("Created transport", extra={'transport_id': new_transport.Transport_ID, 'department': department,
+                                                      'shipments': len(Shipment_IDs)})
     return new_transport
 
 def Transport_add(transport_id, list_of_shipments_df):
@@ -286,49 +626,19 @@ def Transport_add(transport_id, list_of_shipments_df):
     # Filter shipments that have Transport set to None or empty
     available_shipments = list_of_shipments_df[list_of_shipments_df['Transport'].isnull() | (list_of_shipments_df['Transport'] == '')]
     if available_shipments.empty:
-        print("No available shipments to add.")
+        transport_logger.info("No available shipments to add", extra={'transport_id': transport_id})
         return transport_obj
 
-    # Add shipment IDs to the transport's Shipments list
-    new_shipment_ids = available_shipments['Shipment_ID'].tolist()
-    transport_obj.Shipments.extend(new_shipment_ids)
-
-    # Update totals
-    transport_obj.Weight += available_shipments['Weight'].sum()
-    transport_obj.Volume += available_shipments['Volume'].sum()
-    transport_obj.Ldm += available_shipments['Ldm'].sum()
-    transport_obj.Cost += available_shipments['Cost'].sum()
-
-    # Update Pickup_date and Delivery_date if necessary
-    earliest_pickup = pd.to_datetime(available_shipments['Pickup_date']).min().date()
-    latest_delivery = pd.to_datetime(available_shipments['Delivery_date']).max().date()
-    if earliest_pickup < transport_obj.Pickup_date:
-        transport_obj.Pickup_date = earliest_pickup
-    if latest_delivery > transport_obj.Delivery_date:
-        transport_obj.Delivery_date = latest_delivery
-
-    # Collect stops
-    for shipment_id in new_shipment_ids:
-        pickup_stop_id = f"{shipment_id}_P"
-        delivery_stop_id = f"{shipment_id}_D"
-        pickup_stop_obj = Stop.get_by_id(pickup_stop_id)
-        delivery_stop_obj = Stop.get_by_id(delivery_stop_id)
-        if pickup_stop_obj:
-            transport_obj.Stops.append(pickup_stop_obj)
-        if delivery_stop_obj:
-            transport_obj.Stops.append(delivery_stop_obj)
-    
-    # Update sequence numbers for all stops
-    for idx, stop in enumerate(transport_obj.Stops, start=1):
-        stop.Sequence = idx
+    # Append shipments and their stops; totals and dates are updated incrementally. Shipments
+    # planned on another transport since the rows were read are left where they are.
+    with department_locks.hold([transport_obj.Department]):
+        shipment_objs = [Shipment.get_by_id(shipment_id) for shipment_id in available_shipments['Shipment_ID']]
+        new_shipment_ids = transport_obj.add_shipments([shipment_obj for shipment_obj in shipment_objs
+                                                        if shipment_obj and _is_unassigned(shipment_obj.Transport)])
 
-    # Update shipment objects
-    for shipment_id in new_shipment_ids:
-        shipment_obj = Shipment.get_by_id(shipment_id)
-        if shipment_obj:
-            shipment_obj.Transport = transport_obj.Transport_ID
-
-    print(f"Added shipments {new_shipment_ids} to transport {transport_obj.Transport_ID}")
+    transport_logger.info("Added shipments to transport", extra={'transport_id': transport_obj.Transport_ID,
+                                                                 'shipments': len(new_shipment_ids)})
+    transport_logger.debug("Added shipments %s to transport %s", new_shipment_ids, transport_obj.Transport_ID)
     return transport_obj
 
 def Transport_remove(shipment_ids):
@@ -341,6 +651,7 @@ def Transport_remove(shipment_ids):
     
     # Get the transport ID from the shipments and verify all have the same transport
     transport_id = None
+    shipment_objs = []
     for shipment_id in shipment_ids:
         shipment_obj = Shipment.get_by_id(shipment_id)
         if not shipment_obj:
@@ -353,154 +664,564 @@ def Transport_remove(shipment_ids):
         else:
             if shipment_obj.Transport != transport_id:
                 raise ValueError(f"All shipments must be assigned to the same transport. Found '{shipment_obj.Transport}' and '{transport_id}'.")
+        shipment_objs.append(shipment_obj)
     
     # Get the transport object
     transport = Transport.get_by_id(transport_id)
     if not transport:
         raise ValueError(f"Transport '{transport_id}' not found.")
 
-    removed_count = 0
-    for shipment_id in shipment_ids:
-        if shipment_id not in transport.Shipments:
-            continue
+    # Unlink the shipments and their stops; totals, dates and sequence numbers are updated incrementally
+    with department_locks.hold([transport.Department]):
+        removed_count = len(transport.remove_shipments(shipment_objs))
 
-        # Retrieve the corresponding Shipment object before removing its ID from transport.Shipments
-        shipment_to_remove = Shipment.get_by_id(shipment_id)
+    if removed_count > 0:
+        transport_logger.info("Removed shipments from transport", extra={'transport_id': transport_id,
+                                                                         'shipments': removed_count})
+        transport_logger.debug("Updated Transport '%s' details: Weight=%s, Volume=%s, Ldm=%s, Cost=%s, Stops=%r",
+                               transport_id, transport.Weight, transport.Volume, transport.Ldm, transport.Cost, transport.Stops)
+    
+    return transport
 
-        # Remove the shipment_id from the Transport object's Shipments list.
-        transport.Shipments.remove(shipment_id)
+# Quarantine warning rows (e.g. delivery before pickup) as well, instead of only reporting them
+STRICT_VALIDATION = os.environ.get('MOBILITY_STRICT_VALIDATION', '0') == '1'
+# Table name -> validation report of its last load
+load_reports = {}
 
-        if shipment_to_remove:
-            # Set its Transport attribute to None
-            shipment_to_remove.Transport = None
+def load_shipments(data_dir, skip_ids=None):
+    """
+    Reads df_shipments.csv and creates the Shipment (and Stop) objects, except for the
+    shipments in `skip_ids` (those already loaded, when picking up ingested rows).
+    """
+    # Reference columns are read as object so IDs can be assigned into empty (all-NaN) columns
+    shipments_df = pd.read_csv(os.path.join(data_dir, 'df_shipments.csv'), dtype={'Transport': object})
+    # Rows breaking the schema rules are left out and listed in /admin/quarantine. The whole file is
+    # validated, also when only new rows are picked up, so the report keeps covering the rows loaded
+    # before (and quarantined ones are not counted twice) and its line numbers stay those of the file.
+    shipments_df, report = validation.validate_shipments(shipments_df, strict=STRICT_VALIDATION)
+    load_reports['shipments'] = report
+    if skip_ids is not None:
+        shipments_df = shipments_df[~shipments_df['Shipment_ID'].isin(skip_ids)].reset_index(drop=True)
+    # Archived shipments stay in the file but are no longer part of the planning state
+    archived = transport_archive.shipment_ids()
+    if archived:
+        shipments_df = shipments_df[~shipments_df['Shipment_ID'].isin(archived)].reset_index(drop=True)
+    QUARANTINED_ROWS.set(report['quarantined'], 'shipments')
+    logger.log(logging.WARNING if report['quarantined'] else logging.INFO, "Validated shipments",
+               extra={key: report[key] for key in ('checked', 'loaded', 'quarantined', 'warnings')})
+    # Convert postal codes to integers to avoid decimal display
+    # Strip spaces first before converting
+    if 'Collection_Postal_Code' in shipments_df.columns:
+        shipments_df['Collection_Postal_Code'] = shipments_df['Collection_Postal_Code'].astype(str).str.replace(' ', '', regex=False)
+        shipments_df['Collection_Postal_Code'] = pd.to_numeric(shipments_df['Collection_Postal_Code'], errors='coerce').fillna(0).astype(int)
+    if 'Delivery_Postal_Code' in shipments_df.columns:
+        shipments_df['Delivery_Postal_Code'] = shipments_df['Delivery_Postal_Code'].astype(str).str.replace(' ', '', regex=False)
+        shipments_df['Delivery_Postal_Code'] = pd.to_numeric(shipments_df['Delivery_Postal_Code'], errors='coerce').fillna(0).astype(int)
+
+    # Initialize Shipment objects
+    for _, row in shipments_df.iterrows():
+        Shipment(
+            row['Shipment_ID'], row['Transport'], row['Department'], row['Pickup_time'], row['Pickup_date'],
+            row['Delivery_time'], row['Delivery_date'], row['Collection_Name'], row['Collection_City'],
+            row['Collection_Address'], row['Collection_Postal_Code'], row['Collection_Country'],
+            row['Delivery_Name'], row['Delivery_City'], row['Delivery_Address'], row['Delivery_Postal_Code'],
+            row['Delivery_Country'], row['Weight'], row['Volume'], row['Ldm'],
+            row['Content'], row['Units'], row['Unit_type'], row['Hazardous'], row['Cost'],
+            row.get('Finance_Department', ''), row.get('Incoterm', ''), row.get('Customer', ''),
+            row.get('Loading_Instructions', ''), row.get('Customer_Reference', ''), 
+            row.get('Additional_Information', ''), row.get('Services', []),
+            row.get('min_temperature', -99.0), row.get('max_temperature', 99.0)
+        )
+    return shipments_df
+
+def load_trucks(data_dir):
+    trucks_df = pd.read_csv(os.path.join(data_dir, 'df_trucks.csv'), dtype={'Transport': object, 'Trailer': object, 'Last_transport': object})
+    if 'Sheet' not in trucks_df.columns:
+        trucks_df['Sheet'] = 1
+    # Generate random times between 06:00 and 20:00 for each truck
+    if 'Time' not in trucks_df.columns or trucks_df['Time'].isnull().any():
+        import random
+        def generate_random_time():
+            hour = random.randint(6, 19)
+            minute = random.choice([0, 15, 30, 45])
+            return f"{hour:02d}:{minute:02d}"
+        trucks_df['Time'] = [generate_random_time() for _ in range(len(trucks_df))]
+    # Generate random dates for current week (weekdays only)
+    if 'Date' not in trucks_df.columns or trucks_df['Date'].isnull().any():
+        import random
+        today = datetime.date.today()
+        # Find Monday of current week
+        monday = today - datetime.timedelta(days=today.weekday())
+        # Generate list of weekdays (Mon-Fri) for current week
+        weekdays = [monday + datetime.timedelta(days=i) for i in range(5)]
+        trucks_df['Date'] = [random.choice(weekdays) for _ in range(len(trucks_df))]
+    return trucks_df
+
+def load_trailers(data_dir):
+    return pd.read_csv(os.path.join(data_dir, 'df_trailers.csv'), dtype={'Transport': object})
+
+def load_trailer_types(data_dir):
+    # License plate -> (Type, Sub_type), for looking up trailer capacity limits
+    trailers_df = load_trailers(data_dir)
+    return dict(zip(trailers_df['License_plate'], zip(trailers_df['Type'], trailers_df['Sub_type'])))
+
+class Datasets:
+    """
+    The data files, each loaded on first access.
 
-            # Subtract the Weight, Volume, and Ldm of the removed Shipment object
-            transport.Weight -= shipment_to_remove.Weight
-            transport.Volume -= shipment_to_remove.Volume
-            transport.Ldm -= shipment_to_remove.Ldm
-            transport.Cost -= shipment_to_remove.Cost
+    Importing the module reads nothing; a table is loaded the first time it is
+    used, or ahead of time by the warm-up thread started in create_app().
+    Each table has its own lock, so a request needing a table that is still
+    being loaded waits for that load instead of starting a second one. The same
+    lock serializes the writes to a loaded table (see writing()).
+    """
+    LOADERS = collections.OrderedDict([
+        ('shipments', load_shipments),
+        ('trucks', load_trucks),
+        ('trailers', load_trailers),
+        ('trailer_types', load_trailer_types),
+    ])
+
+    # Tables with a Department column, indexed per department for shard()
+    PARTITIONED = ('shipments', 'trucks', 'trailers')
+    # Tables bucketed by day of a date column for window(); the column must not change in place
+    DATED = {'shipments': 'Pickup_date'}
+
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+        self._tables = {}
+        self._locks = {name: threading.RLock() for name in self.LOADERS}
+        self._partitions = {name: shards.FramePartition('Department') for name in self.PARTITIONED}
+        self._date_partitions = {name: shards.DatePartition(column, 'Department') for name, column in self.DATED.items()}
+        self.ready = threading.Event()
+
+    def get(self, name):
+        table = self._tables.get(name)
+        if table is None:
+            with self._locks[name]:
+                table = self._tables.get(name)
+                if table is None:
+                    start = time.perf_counter()
+                    table = self.LOADERS[name](self.data_dir)
+                    self._tables[name] = table
+                    seconds = time.perf_counter() - start
+                    DATASET_LOAD_SECONDS.set(seconds, name)
+                    logger.info("Loaded dataset", extra={'table': name, 'seconds': round(seconds, 3)})
+        return table
+
+    def shard(self, name, department):
+        """
+        Returns the rows of one department of a table, or the whole table for 'ALL' or ''.
+        Like the full table, the result must be copied before it is modified.
+        """
+        table = self.get(name)
+        if not department or department == 'ALL':
+            return table
+        return self._partitions[name].shard(table, department)
 
-            # Identify the specific Stop objects to be removed using their unique IDs
-            stops_to_remove_objs = []
-            pickup_stop_id = f"{shipment_id}_P"
-            delivery_stop_id = f"{shipment_id}_D"
+    def window(self, name, department, start_date, end_date):
+        """
+        Returns the rows of a department (or all for 'ALL' or '') dated from start_date to end_date,
+        taken from the day buckets inside the window only. Like shard(), copy before modifying.
+        """
+        group = None if not department or department == 'ALL' else department
+        return self._date_partitions[name].window(self.get(name), group, start_date, end_date)
 
-            pickup_stop_obj = Stop.get_by_id(pickup_stop_id)
-            delivery_stop_obj = Stop.get_by_id(delivery_stop_id)
+    def replace(self, name, table):
+        """Swaps a loaded table for a new frame, e.g. one with rows taken out."""
+        with self._locks[name]:
+            self._tables[name] = table
 
-            if pickup_stop_obj:
-                stops_to_remove_objs.append(pickup_stop_obj)
-            if delivery_stop_obj:
-                stops_to_remove_objs.append(delivery_stop_obj)
+    @contextlib.contextmanager
+    def writing(self, name):
+        """
+        Holds the lock of a table while it is changed in place, and yields the table.
 
-            # Create a new list of stops, excluding the identified Stop objects
-            new_stops = []
-            for stop in transport.Stops:
-                # Check if the current stop object is one of the specific objects we want to remove
-                if stop not in stops_to_remove_objs:
-                    new_stops.append(stop)
-            transport.Stops = new_stops
+        replace() takes the same lock, so a write cannot land on a frame that is being
+        swapped out; building the replacement from the current frame happens inside
+        writing() as well. Callers holding department locks take them first.
+        """
+        self.get(name)
+        with self._locks[name]:
+            yield self._tables[name]
+
+    def copy(self, name):
+        """Returns a copy of a table taken between writes, never half way through one."""
+        with self.writing(name) as table:
+            return table.copy()
+
+    def is_loaded(self, name):
+        return name in self._tables
+
+    def load_all(self):
+        for name in self.LOADERS:
+            self.get(name)
+        self.ready.set()
+
+    @property
+    def shipments(self):
+        return self.get('shipments')
+
+    @property
+    def trucks(self):
+        return self.get('trucks')
+
+    @property
+    def trailers(self):
+        return self.get('trailers')
+
+    @property
+    def trailer_types(self):
+        return self.get('trailer_types')
+
+DATASET_LOAD_SECONDS = metrics.registry.gauge(
+    'mobility_dataset_load_seconds', 'Time taken to load each data file.', ('table',))
+QUARANTINED_ROWS = metrics.registry.gauge(
+    'mobility_quarantined_rows', 'Rows left out of the last load of a table by validation.', ('table',))
+STARTUP_SECONDS = metrics.registry.gauge(
+    'mobility_startup_seconds', 'Time from module import until the app accepts requests (phase=app) '
+    'and until all data is loaded (phase=warm_up).', ('phase',))
+
+datasets = Datasets(DATA_DIR)
+
+def _archive_path(data_dir):
+    return os.environ.get('MOBILITY_ARCHIVE_DB') or os.path.join(data_dir, 'archive.sqlite3')
+
+# Handled transports and their shipments, moved out of the live state (see archive_handled_transports)
+transport_archive = archive.TransportArchive(_archive_path(DATA_DIR))
+
+# Endpoints that do not read the planning data, answered while the data is still loading
+DATA_FREE_ENDPOINTS = {'static', 'mobility.index', 'mobility.metrics_endpoint', 'mobility.persistence_status',
+                       'mobility.list_profiles', 'mobility.get_profile', 'mobility.configure_profiles',
+                       'mobility.history_audit', 'mobility.quarantine_report',
+                       'mobility.archived_transports', 'mobility.archived_transport'}
+
+@bp.before_app_request
+def require_datasets():
+    # The object registries (Shipment, Transport, Stop) are filled by the shipment load, so a
+    # request waits for all tables rather than only the ones it reads from a DataFrame
+    if not datasets.ready.is_set() and request.endpoint not in DATA_FREE_ENDPOINTS:
+        with metrics.time_stage(_route_label(), 'load'):
+            datasets.load_all()
+
+# Truck updates are written behind the request by a background thread
+persister = WriteBehindPersister(
+    durability=os.environ.get('MOBILITY_PERSIST_MODE', 'async'),
+    interval=float(os.environ.get('MOBILITY_PERSIST_INTERVAL', '1.0')),
+    on_flush=lambda table, seconds: metrics.PERSIST_FLUSH_LATENCY.observe(seconds, table),
+    on_error=lambda table, e: (metrics.PERSIST_ERRORS.inc(table),
+                               logger.error("Could not write table %s: %s", table, e)),
+)
+metrics.registry.gauge('mobility_persist_queue_depth', 'Changes marked dirty but not yet written.',
+                       callback=lambda: persister.queue_depth)
+metrics.registry.gauge('mobility_persist_last_flush_seconds', 'Duration of the most recent table write.',
+                       callback=lambda: persister.last_flush_seconds)
+
+def department_transports(department, window=None):
+    """
+    Returns the transports of a department (all transports for 'ALL' or ''), in creation order.
 
-        removed_count += 1
-    
-    # Update sequence numbers for all remaining stops
-    for idx, stop in enumerate(transport.Stops, start=1):
-        stop.Sequence = idx
+    Args:
+        window (tuple, optional): (start, end) dates; only transports with a Pickup_date in it
+            are returned, looked up in the day buckets of transport_dates.
+    """
+    if window is not None:
+        return transport_dates.window(None if not department or department == 'ALL' else department, *window)
+    if not department or department == 'ALL':
+        return list(Transport.registry.values())
+    return list(Transport.registry.shard(department).values())
 
-    if removed_count > 0:
-        print(f"Successfully removed {removed_count} shipment(s) from Transport '{transport_id}'.")
-        print(f"Updated Transport '{transport_id}' details: Weight={transport.Weight}, Volume={transport.Volume}, Ldm={transport.Ldm}, Cost={transport.Cost}, Stops={transport.Stops}")
-    
-    return transport
+def date_window(date_range_days, start_date_str):
+    """
+    Returns the (start, end) dates of a list view's date filter: from start_date (default today)
+    to start_date + date_range_days, or backwards for a negative number of days.
+    None when no valid filter is given, in which case the view is not filtered by date.
+    """
+    if not date_range_days:
+        return None
+    try:
+        days = int(date_range_days)
+        start_date = pd.to_datetime(start_date_str).date() if start_date_str else datetime.date.today()
+        end_date = start_date + datetime.timedelta(days=days)
+    except (ValueError, TypeError, OverflowError):
+        return None
+    return min(start_date, end_date), max(start_date, end_date)
+
+def _route_label():
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+def track_stage(stage):
+    """
+    Times a stage (filter, to_dict, search, ...) of the current request.
+    """
+    return metrics.time_stage(_route_label(), stage)
+
+def begin_stage(stage):
+    """
+    Starts timing a stage of the current request that spans several statements of a view, without
+    wrapping them in a with-block. The stage ends at end_stage(), the next begin_stage() or at the
+    end of the request.
+    """
+    end_stage()
+    g.stage = (stage, time.perf_counter())
+
+def end_stage():
+    current = g.pop('stage', None)
+    if current is not None:
+        stage, start = current
+        metrics.STAGE_LATENCY.observe(time.perf_counter() - start, _route_label(), stage)
+
+def track_rows(step, rows):
+    """
+    Records how many rows remain after a filter step of the current request.
+    """
+    metrics.observe_rows(_route_label(), step, rows)
+
+def _fragments():
+    # Rendered list rows of the current app, reused while the row's values are unchanged
+    return current_app.extensions['fragments']
+
+# Machine readable variants of the list views (?format=...)
+LIST_FORMATS = ('json', 'columnar')
+
+def json_body(payload, status=200):
+    """
+    Encodes a payload with the serialization layer; use for large responses instead of jsonify.
+    """
+    return Response(serialization.dumps(payload), status=status, mimetype='application/json')
 
-# Load data
-shipments_df = pd.read_csv(os.path.join(BASE_DIR, 'df_shipments.csv'))
-# Convert postal codes to integers to avoid decimal display
-# Strip spaces first before converting
-if 'Collection_Postal_Code' in shipments_df.columns:
-    shipments_df['Collection_Postal_Code'] = shipments_df['Collection_Postal_Code'].astype(str).str.replace(' ', '', regex=False)
-    shipments_df['Collection_Postal_Code'] = pd.to_numeric(shipments_df['Collection_Postal_Code'], errors='coerce').fillna(0).astype(int)
-if 'Delivery_Postal_Code' in shipments_df.columns:
-    shipments_df['Delivery_Postal_Code'] = shipments_df['Delivery_Postal_Code'].astype(str).str.replace(' ', '', regex=False)
-    shipments_df['Delivery_Postal_Code'] = pd.to_numeric(shipments_df['Delivery_Postal_Code'], errors='coerce').fillna(0).astype(int)
-trucks_df = pd.read_csv(os.path.join(BASE_DIR, 'df_trucks.csv'))
-if 'Sheet' not in trucks_df.columns:
-    trucks_df['Sheet'] = 1
-# Generate random times between 06:00 and 20:00 for each truck
-if 'Time' not in trucks_df.columns or trucks_df['Time'].isnull().any():
-    import random
-    def generate_random_time():
-        hour = random.randint(6, 19)
-        minute = random.choice([0, 15, 30, 45])
-        return f"{hour:02d}:{minute:02d}"
-    trucks_df['Time'] = [generate_random_time() for _ in range(len(trucks_df))]
-# Generate random dates for current week (weekdays only)
-if 'Date' not in trucks_df.columns or trucks_df['Date'].isnull().any():
-    import random
-    today = datetime.date.today()
-    # Find Monday of current week
-    monday = today - datetime.timedelta(days=today.weekday())
-    # Generate list of weekdays (Mon-Fri) for current week
-    weekdays = [monday + datetime.timedelta(days=i) for i in range(5)]
-    trucks_df['Date'] = [random.choice(weekdays) for _ in range(len(trucks_df))]
-trailers_df = pd.read_csv(os.path.join(BASE_DIR, 'df_trailers.csv'))
-
-# Combine trucks and trailers as transports
-transports_df = trucks_df.copy()
-
-# Initialize Shipment objects
-for _, row in shipments_df.iterrows():
-    Shipment(
-        row['Shipment_ID'], row['Transport'], row['Department'], row['Pickup_time'], row['Pickup_date'],
-        row['Delivery_time'], row['Delivery_date'], row['Collection_Name'], row['Collection_City'],
-        row['Collection_Address'], row['Collection_Postal_Code'], row['Collection_Country'],
-        row['Delivery_Name'], row['Delivery_City'], row['Delivery_Address'], row['Delivery_Postal_Code'],
-        row['Delivery_Country'], row['Weight'], row['Volume'], row['Ldm'],
-        row['Content'], row['Units'], row['Unit_type'], row['Hazardous'], row['Cost'],
-        row.get('Finance_Department', ''), row.get('Incoterm', ''), row.get('Customer', ''),
-        row.get('Loading_Instructions', ''), row.get('Customer_Reference', ''), 
-        row.get('Additional_Information', ''), row.get('Services', [])
-    )
-
-@app.route('/')
+def list_response(output_format, frame=None, rows=None):
+    """
+    Returns list rows as JSON records or in the columnar layout, from a DataFrame or a list of dicts.
+    """
+    if frame is not None:
+        if output_format == 'columnar':
+            return json_body(serialization.columnar(frame))
+        return json_body(list(serialization.iter_records(frame)))
+    if output_format == 'columnar':
+        fields = list(rows[0]) if rows else []
+        return json_body({'fields': fields, 'columns': [[row[f] for row in rows] for f in fields]})
+    return json_body(rows)
+
+@bp.after_app_request
+def compress_response(response):
+    if (response.is_streamed or response.direct_passthrough or 'Content-Encoding' in response.headers
+            or not (response.mimetype == 'application/json' or response.mimetype.startswith('text/'))):
+        return response
+    body, encoding = serialization.compress(response.get_data(), request.headers.get('Accept-Encoding', ''))
+    if encoding:
+        response.set_data(body)
+        response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+    return response
+
+# Template output is sent in chunks of this many template events (roughly one per row)
+STREAM_BUFFER_ROWS = 100
+
+def stream_page(template_name, **context):
+    """
+    Streams a page to the client while it is rendered, instead of building it in memory first.
+    List rows should be passed as generators (see FragmentCache.rows), so they are rendered
+    only as the stream reaches them. The full render time is recorded as the 'stream' stage; the
+    request latency and profile are completed once the last chunk is sent (see record_response_status).
+    """
+    route = _route_label()
+    current_app.update_template_context(context)
+    stream = current_app.jinja_env.get_template(template_name).stream(context)
+    stream.enable_buffering(STREAM_BUFFER_ROWS)
+
+    def generate():
+        with metrics.time_stage(route, 'stream'):
+            yield from stream
+    return Response(stream_with_context(generate()), mimetype='text/html')
+
+@bp.before_app_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    metrics.REQUESTS_IN_FLIGHT.inc()
+
+def _complete_request(start, active, route, method, url, status):
+    metrics.REQUESTS_IN_FLIGHT.inc(amount=-1)
+    labels = (route, method, str(status))
+    metrics.REQUEST_LATENCY.observe(time.perf_counter() - start, *labels)
+    metrics.REQUESTS_TOTAL.inc(*labels)
+    if active is not None:
+        profiler.stop(active, route, method, url, status)
+
+@bp.after_app_request
+def record_response_status(response):
+    # A view returning early (e.g. an error response) leaves its last stage open
+    end_stage()
+    if response.is_streamed and 'request_start' in g:
+        # The body of a streamed page (stream_page) is rendered while it is sent, after this hook;
+        # complete the latency and the profile when the server closes the response instead
+        state = (g.pop('request_start'), g.pop('profile', None), _route_label(), request.method,
+                 request.full_path, response.status_code)
+        response.call_on_close(lambda: _complete_request(*state))
+    else:
+        g.response_status = response.status_code
+    return response
+
+@bp.before_app_request
+def start_request_profile():
+    trigger = profiler.trigger_for(request.headers, request.args)
+    # Explicit opt-in from a client is only honoured for admins
+    if trigger in ('header', 'query') and not _admin_authorized():
+        trigger = None
+    if trigger:
+        g.profile = profiler.start(trigger)
+
+@bp.after_app_request
+def announce_request_profile(response):
+    # The profile is stored under this ID once the response is complete
+    active = g.get('profile')
+    if active is not None:
+        response.headers['X-Profile-Id'] = str(active.id)
+    return response
+
+@bp.teardown_app_request
+def finish_request(exc):
+    # Streamed responses were handed to call_on_close; their request context is also torn down a
+    # second time when the stream ends, so only complete what is still pending
+    start = g.pop('request_start', None)
+    if start is None:
+        return
+    status = 500 if exc is not None else g.pop('response_status', 500)
+    _complete_request(start, g.pop('profile', None), _route_label(), request.method, request.full_path, status)
+
+def _admin_authorized():
+    """
+    Whether the request may use the admin endpoints and ask for a profile: it has to send
+    MOBILITY_ADMIN_TOKEN as X-Admin-Token. Without a configured token they are closed, unless
+    MOBILITY_ADMIN_OPEN=1 opens them to everyone (local development).
+    """
+    token = os.environ.get('MOBILITY_ADMIN_TOKEN')
+    if not token:
+        return os.environ.get('MOBILITY_ADMIN_OPEN', '0') == '1'
+    return request.headers.get('X-Admin-Token') == token
+
+@bp.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.registry.render(), content_type=metrics.CONTENT_TYPE)
+
+@bp.route('/admin/persistence')
+def persistence_status():
+    if not _admin_authorized():
+        return jsonify({'error': 'Admin token required'}), 403
+    return jsonify(persister.stats())
+
+@bp.route('/admin/quarantine')
+def quarantine_report():
+    """
+    Rows left out of the last load for breaking a validation rule, and rows kept with a warning.
+    """
+    if not _admin_authorized():
+        return jsonify({'error': 'Admin token required'}), 403
+    return jsonify(load_reports)
+
+@bp.route('/admin/profiles')
+def list_profiles():
+    if not _admin_authorized():
+        return jsonify({'error': 'Admin token required'}), 403
+    return jsonify({
+        'sample_rate': profiler.sample_rate,
+        'capacity': profiler.capacity,
+        'profiles': profiler.list()
+    })
+
+@bp.route('/admin/profiles/<int:profile_id>')
+def get_profile(profile_id):
+    """
+    Returns a stored profile as a pstats text report, or with ?format=pstats as a
+    binary file loadable with pstats/snakeviz.
+    """
+    if not _admin_authorized():
+        return jsonify({'error': 'Admin token required'}), 403
+    record = profiler.get(profile_id)
+    if not record:
+        return jsonify({'error': 'Profile not found'}), 404
+    if request.args.get('format') == 'pstats':
+        return Response(record.stats, mimetype='application/octet-stream',
+                        headers={'Content-Disposition': f'attachment; filename=profile_{record.id}.prof'})
+    sort_by = request.args.get('sort', 'cumulative')
+    try:
+        limit = int(request.args.get('limit', 60))
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    try:
+        report = record.report(sort_by, limit)
+    except KeyError:
+        return jsonify({'error': f'Invalid sort key {sort_by}'}), 400
+    return Response(report, mimetype='text/plain')
+
+@bp.route('/admin/profiles/config', methods=['POST'])
+def configure_profiles():
+    if not _admin_authorized():
+        return jsonify({'error': 'Admin token required'}), 403
+    data = request.get_json() or {}
+    try:
+        sample_rate = float(data.get('sample_rate', profiler.sample_rate))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'sample_rate must be a number'}), 400
+    if not 0 <= sample_rate <= 1:
+        return jsonify({'error': 'sample_rate must be between 0 and 1'}), 400
+    profiler.sample_rate = sample_rate
+    if data.get('clear'):
+        profiler.clear()
+    return jsonify({'success': True, 'sample_rate': profiler.sample_rate})
+
+@bp.route('/')
 def index():
     return render_template('index.html')
 
-@app.route('/shipments')
+@bp.route('/shipments')
 def shipments():
-    # Start with the full dataframe
-    filtered_df = shipments_df.copy()
-    
-    # Apply department filter (defaults to KDEGR)
+    begin_stage('filter')
+    # Start with the rows of the department (defaults to KDEGR) inside the date range, from
+    # start_date to start_date + X days (negative values go backwards). Defaults to 0 days
+    # (only today); only the day partitions inside the range are read.
     department = request.args.get('department', 'KDEGR').strip()
-    if department and department != 'ALL':
-        filtered_df = filtered_df[filtered_df['Department'] == department]
+    window = date_window(request.args.get('date_range_days', '0').strip(),
+                         request.args.get('start_date', '').strip())
+    collection_pc = request.args.get('collection_pc', '').strip()
+    delivery_pc = request.args.get('delivery_pc', '').strip()
+    # A postal code filter matching no row keeps all rows, so it depends on the rows it is given:
+    # with one, the filters see the whole department as before and the date range is applied last
+    window_last = window is not None and bool(collection_pc or delivery_pc)
+    if window is not None and not window_last:
+        filtered_df = datasets.window('shipments', department, *window).copy()
+        track_rows('date_range', len(filtered_df))
+    else:
+        filtered_df = datasets.shard('shipments', department).copy()
+        track_rows('department', len(filtered_df))
     
     # Apply unassigned filter by default, unless explicitly set to 'all'
     filter_param = request.args.get('filter', 'unassigned')
     filter_unassigned = filter_param == 'unassigned'
     if filter_unassigned:
         filtered_df = filtered_df[filtered_df['Transport'].isnull() | (filtered_df['Transport'] == '')]
+        track_rows('unassigned', len(filtered_df))
     
     # Apply search filters
     shipment_id = request.args.get('shipment_id', '').strip()
     if shipment_id:
         filtered_df = filtered_df[filtered_df['Shipment_ID'].str.contains(shipment_id, case=False, na=False)]
+        track_rows('shipment_id', len(filtered_df))
     
     # Parse postal code ranges with optional country codes
     # Supports: "BE:2700-3500", "NL:1000-2000,BE:2700-3500", "BE", or "2700-3500"
     def parse_pc_ranges(pc_string, column_name, country_column_name):
         if not pc_string:
             return filtered_df
-        
+    
         ranges = pc_string.split(',')
         mask = pd.Series([False] * len(filtered_df), index=filtered_df.index)
-        
+    
         for range_str in ranges:
             range_str = range_str.strip()
             country_code = None
             postal_range = None
-            
+        
             # Check if country code is specified (e.g., "BE:2700-3500" or just "BE")
             if ':' in range_str:
                 parts = range_str.split(':', 1)
@@ -513,12 +1234,12 @@ def shipments():
                     postal_range = None
                 else:
                     postal_range = range_str
-            
+        
             # Build country mask
             country_mask = pd.Series([True] * len(filtered_df), index=filtered_df.index)
             if country_code:
                 country_mask = (filtered_df[country_column_name].str.upper() == country_code)
-            
+        
             # Parse postal code range
             if postal_range and '-' in postal_range:
                 parts = postal_range.split('-')
@@ -535,62 +1256,46 @@ def shipments():
             elif country_code and not postal_range:
                 # Just country code without postal code range
                 mask |= country_mask
-        
+    
         return filtered_df[mask] if mask.any() else filtered_df
     
-    collection_pc = request.args.get('collection_pc', '').strip()
     if collection_pc:
         filtered_df = parse_pc_ranges(collection_pc, 'Collection_Postal_Code', 'Collection_Country')
+        track_rows('collection_pc', len(filtered_df))
     
-    delivery_pc = request.args.get('delivery_pc', '').strip()
     if delivery_pc:
         filtered_df = parse_pc_ranges(delivery_pc, 'Delivery_Postal_Code', 'Delivery_Country')
+        track_rows('delivery_pc', len(filtered_df))
+
+    if window_last:
+        # The day partitions only select the rows; matched by Shipment_ID, which is unique and
+        # stays valid if the table is swapped in between (archiving)
+        window_ids = datasets.window('shipments', department, *window)['Shipment_ID']
+        filtered_df = filtered_df[filtered_df['Shipment_ID'].isin(window_ids)]
+        track_rows('date_range', len(filtered_df))
+    end_stage()
     
-    # Apply date range filter (from start_date to start_date + X days, negative values go backwards)
-    # Default to 0 days if not specified (show only today)
-    date_range_days = request.args.get('date_range_days', '0').strip()
-    start_date_str = request.args.get('start_date', '').strip()
-    
-    if date_range_days:
-        try:
-            days = int(date_range_days)
-            if start_date_str:
-                start_date = pd.to_datetime(start_date_str).date()
-            else:
-                start_date = datetime.date.today()
-            
-            if days >= 0:
-                # Positive range: from start_date to start_date + days
-                end_date = start_date + datetime.timedelta(days=days)
-                filtered_df = filtered_df[
-                    (pd.to_datetime(filtered_df['Pickup_date']).dt.date >= start_date) &
-                    (pd.to_datetime(filtered_df['Pickup_date']).dt.date <= end_date)
-                ]
-            else:
-                # Negative range: from start_date + days to start_date
-                end_date = start_date
-                start_date = start_date + datetime.timedelta(days=days)
-                filtered_df = filtered_df[
-                    (pd.to_datetime(filtered_df['Pickup_date']).dt.date >= start_date) &
-                    (pd.to_datetime(filtered_df['Pickup_date']).dt.date <= end_date)
-                ]
-        except ValueError:
-            pass
+    output_format = request.args.get('format', 'html')
+    if output_format in LIST_FORMATS:
+        with track_stage('to_dict'):
+            return list_response(output_format, frame=filtered_df)
     
-    shipments_list = filtered_df.to_dict('records')
+    with track_stage('to_dict'):
+        # Rows are built from the column arrays while the page streams
+        shipments_list = serialization.iter_records(filtered_df)
     today_date = datetime.date.today().strftime('%Y-%m-%d')
-    return render_template('shipments.html', shipments=shipments_list, filter_unassigned=filter_unassigned, today_date=today_date)
+    rows = _fragments().rows('shipment_row.html', shipments_list, 'Shipment_ID')
+    return stream_page('shipments.html', shipments=rows, filter_unassigned=filter_unassigned, today_date=today_date)
 
-@app.route('/transports')
+@bp.route('/transports')
 def transports():
-    # Start with all transports
-    all_transports = list(Transport.registry.values())
-    filtered_transports = all_transports.copy()
-    
-    # Apply department filter (defaults to KDEGR)
+    begin_stage('filter')
+    # Start with the transports of the department (defaults to KDEGR), limited to the
+    # date range when one is given
     department = request.args.get('department', 'KDEGR').strip()
-    if department and department != 'ALL':
-        filtered_transports = [t for t in filtered_transports if t.Department == department]
+    window = date_window(request.args.get('date_range_days', '').strip(),
+                         request.args.get('start_date', '').strip())
+    filtered_transports = department_transports(department, window)
     
     # Apply search filters
     transport_id = request.args.get('transport_id', '').strip()
@@ -604,20 +1309,20 @@ def transports():
             return True
         if pc_value is None:
             return False
-        
+    
         # Convert pc_value to int if it's a string, stripping spaces first
         try:
             pc_value_str = str(pc_value).replace(' ', '')
             pc_value_int = int(pc_value_str)
         except (ValueError, TypeError):
             return False
-        
+    
         ranges = pc_string.split(',')
         for range_str in ranges:
             range_str = range_str.strip()
             country_code = None
             postal_range = None
-            
+        
             # Check if country code is specified (e.g., "BE:2700-3500" or just "BE")
             if ':' in range_str:
                 parts = range_str.split(':', 1)
@@ -630,15 +1335,15 @@ def transports():
                     postal_range = None
                 else:
                     postal_range = range_str
-            
+        
             # Check country match
             country_matches = True
             if country_code:
                 country_matches = (country_value and country_value.upper() == country_code)
-            
+        
             if not country_matches:
                 continue
-            
+        
             # Parse postal code range
             if postal_range and '-' in postal_range:
                 parts = postal_range.split('-')
@@ -670,31 +1375,9 @@ def transports():
                                   t.Stops[-1].Postal_Code if t.Stops else None,
                                   t.Stops[-1].Country if t.Stops else None,
                                   delivery_pc)]
+    track_rows('transports', len(filtered_transports))
     
-    # Apply date range filter
-    date_range_days = request.args.get('date_range_days', '').strip()
-    start_date_str = request.args.get('start_date', '').strip()
-    
-    if date_range_days:
-        try:
-            days = int(date_range_days)
-            if start_date_str:
-                start_date = pd.to_datetime(start_date_str).date()
-            else:
-                start_date = datetime.date.today()
-            
-            if days >= 0:
-                end_date = start_date + datetime.timedelta(days=days)
-                filtered_transports = [t for t in filtered_transports 
-                                      if hasattr(t, 'Pickup_date') and start_date <= t.Pickup_date <= end_date]
-            else:
-                end_date = start_date
-                start_date = start_date + datetime.timedelta(days=days)
-                filtered_transports = [t for t in filtered_transports 
-                                      if hasattr(t, 'Pickup_date') and start_date <= t.Pickup_date <= end_date]
-        except (ValueError, AttributeError, TypeError):
-            pass
-    
+    begin_stage('to_dict')
     # Prepare transport data with additional stop information
     transports_list = []
     for transport in filtered_transports:
@@ -716,14 +1399,20 @@ def transports():
             'last_delivery_postal': last_stop.shipment.Delivery_Postal_Code if last_stop else ''
         }
         transports_list.append(transport_data)
+    end_stage()
+    
+    output_format = request.args.get('format', 'html')
+    if output_format in LIST_FORMATS:
+        return list_response(output_format, rows=transports_list)
     
     today_date = datetime.date.today().strftime('%Y-%m-%d')
-    return render_template('transports.html', transports=transports_list, today_date=today_date)
+    rows = _fragments().rows('transport_row.html', transports_list, 'Transport_ID')
+    return stream_page('transports.html', transports=rows, today_date=today_date)
 
-@app.route('/details/<type>/<id>')
+@bp.route('/details/<type>/<id>')
 def details(type, id):
     if type == 'shipment':
-        shipment = shipments_df[shipments_df['Shipment_ID'] == id].to_dict('records')[0]
+        shipment = datasets.shipments[datasets.shipments['Shipment_ID'] == id].to_dict('records')[0]
         # Create stops
         stops = [
             {
@@ -754,61 +1443,1028 @@ def details(type, id):
         else:
             return "Transport not found", 404
 
-@app.route('/create_transport', methods=['POST'])
+def shipment_columns(shipment_objs):
+    """
+    Builds the column arrays used by the constraint engine from Shipment objects.
+    """
+    def column(name, default):
+        values = np.array([getattr(s, name, default) for s in shipment_objs], dtype=float)
+        values[np.isnan(values)] = default
+        return values
+    return {
+        'Weight': column('Weight', 0.0),
+        'Ldm': column('Ldm', 0.0),
+        'Volume': column('Volume', 0.0),
+        'Hazardous': np.array([s.Hazardous is True or s.Hazardous == 'True' for s in shipment_objs], dtype=bool),
+        'min_temperature': column('min_temperature', -99.0),
+        'max_temperature': column('max_temperature', 99.0),
+    }
+
+def trailer_spec(trailer):
+    """
+    Returns the (Type, Sub_type) of a trailer plate, or (ANY_TRAILER, None) when no trailer is set.
+    """
+    if not trailer:
+        return constraints.ANY_TRAILER, None
+    return datasets.trailer_types.get(trailer, (constraints.ANY_TRAILER, None))
+
+def validate_shipments(shipment_objs, trailer=''):
+    """
+    Checks a shipment set against the limits of a trailer (or any trailer type if none is set).
+    """
+    if not shipment_objs:
+        return []
+    trailer_type, sub_type = trailer_spec(trailer)
+    return constraints.engine.check(shipment_columns(shipment_objs), trailer_type, sub_type)
+
+def validate_transports(transports):
+    """
+    Checks many transports in one vectorized pass; returns {Transport_ID: violations}.
+    """
+    shipment_objs = []
+    group_index = []
+    for position, transport in enumerate(transports):
+        for shipment_id in transport.Shipments:
+            shipment_obj = Shipment.get_by_id(shipment_id)
+            if shipment_obj:
+                shipment_objs.append(shipment_obj)
+                group_index.append(position)
+    violations = constraints.engine.check_groups(
+        group_index, shipment_columns(shipment_objs), [trailer_spec(t.Trailer) for t in transports])
+    return {transports[position].Transport_ID: found for position, found in violations.items()}
+
+def transport_violations(transport):
+    return validate_shipments([s for s in map(Shipment.get_by_id, transport.Shipments) if s], transport.Trailer)
+
+@bp.route('/validate', methods=['POST'])
+def validate():
+    """
+    Dry-run check of a candidate shipment set, e.g. while dragging shipments onto a transport.
+    Accepts 'shipments', an optional 'transport_id' whose shipments are included and an
+    optional 'trailer' overriding the transport's trailer.
+    """
+    data = request.get_json() or {}
+    shipment_ids = list(data.get('shipments', []))
+    trailer = data.get('trailer')
+    transport_id = data.get('transport_id')
+    if transport_id:
+        transport = Transport.get_by_id(transport_id)
+        if not transport:
+            return jsonify({'error': 'Transport not found'}), 404
+        shipment_ids = transport.Shipments + [sid for sid in shipment_ids if not transport.has_shipment(sid)]
+        if trailer is None:
+            trailer = transport.Trailer
+    shipment_objs = [Shipment.get_by_id(sid) for sid in shipment_ids]
+    missing = [sid for sid, obj in zip(shipment_ids, shipment_objs) if obj is None]
+    if missing:
+        return jsonify({'error': f'Shipments not found: {missing}'}), 404
+    violations = validate_shipments(shipment_objs, trailer or '')
+    return jsonify({'valid': not violations, 'violations': violations})
+
+@bp.route('/validate/department/<department>')
+def validate_department(department):
+    """
+    Checks all Planning transports of a department against their trailers in one pass.
+    """
+    transports = [t for t in department_transports(department) if t.Status == 'Planning']
+    violations = validate_transports(transports)
+    return jsonify({'checked': len(transports), 'violations': violations})
+
+# Type-ahead search over shipments and transports, ranked by these fields in order
+SHIPMENT_SEARCH_FIELDS = ('Shipment_ID', 'Customer_Reference', 'Customer', 'Collection_Name', 'Delivery_Name',
+                          'Collection_City', 'Delivery_City', 'Collection_Address', 'Delivery_Address')
+TRANSPORT_SEARCH_FIELDS = ('Transport_ID', 'Vehicle', 'Trailer', 'Driver', 'Haulier')
+SEARCH_LIMIT = 50
+search_index = search.TrigramIndex()
+# The index is built on the first search; until then registry changes are not tracked
+search_index_built = threading.Event()
+search_index_lock = threading.Lock()
+metrics.registry.gauge('mobility_search_documents', 'Shipments and transports in the search index.',
+                       callback=lambda: len(search_index))
+
+def index_shipment(shipment_id, shipment_obj):
+    if not search_index_built.is_set():
+        return
+    if shipment_obj is None:
+        search_index.remove('shipment', shipment_id)
+    else:
+        search_index.add('shipment', shipment_id, {f: getattr(shipment_obj, f) for f in SHIPMENT_SEARCH_FIELDS},
+                         group=shipment_obj.Department)
+
+def index_transport(transport_id, transport):
+    """
+    Updates the search entry of a transport. Changes to its vehicle, trailer, driver or haulier
+    arrive through Transport.registry.notify().
+    """
+    if not search_index_built.is_set() or not transport_id:
+        return
+    if transport is None:
+        search_index.remove('transport', transport_id)
+    else:
+        search_index.add('transport', transport_id, {f: getattr(transport, f) for f in TRANSPORT_SEARCH_FIELDS},
+                         group=transport.Department)
+
+# Creation and removal of objects (ingest, new transports, undo/redo) reach the index through the registries
+Shipment.registry.subscribe(index_shipment)
+Transport.registry.subscribe(index_transport)
+
+def build_search_index():
+    with search_index_lock:
+        if search_index_built.is_set():
+            return
+        # Set first, so objects registered while the index is built are not missed
+        search_index_built.set()
+        for shipment_id, shipment_obj in list(Shipment.registry.items()):
+            index_shipment(shipment_id, shipment_obj)
+        for transport_id, transport in list(Transport.registry.items()):
+            index_transport(transport_id, transport)
+
+def _search_result(result):
+    if result['kind'] == 'shipment':
+        obj = Shipment.get_by_id(result['id'])
+        extra = {'transport': None if obj is None or _is_unassigned(obj.Transport) else obj.Transport,
+                 'customer': None if obj is None else _text(obj.Customer)}
+    else:
+        obj = Transport.get_by_id(result['id'])
+        extra = {'status': None if obj is None else obj.Status, 'vehicle': None if obj is None else obj.Vehicle}
+    return {
+        'kind': result['kind'],
+        'id': result['id'],
+        'department': result['group'],
+        'field': result['field'],
+        'value': None if obj is None else _text(getattr(obj, result['field'])),
+        'match': result['match'],
+        **extra,
+    }
+
+@bp.route('/search')
+def search_endpoint():
+    """
+    Type-ahead search over shipment IDs, customers, references, names, cities and addresses,
+    and over transport IDs and their vehicle, trailer, driver and haulier.
+
+    Query parameters: q, limit (default 10), kind ('shipment' or 'transport') and department.
+    """
+    query = request.args.get('q', '').strip()
+    kind = request.args.get('kind', '').strip()
+    department = request.args.get('department', '').strip()
+    try:
+        limit = min(max(int(request.args.get('limit', '10')), 1), SEARCH_LIMIT)
+    except ValueError:
+        return jsonify({'error': 'limit must be a number'}), 400
+    if kind and kind not in ('shipment', 'transport'):
+        return jsonify({'error': "kind must be 'shipment' or 'transport'"}), 400
+    if not search_index_built.is_set():
+        with track_stage('index'):
+            build_search_index()
+    with track_stage('search'):
+        results = search_index.search(query, limit=limit, kinds=[kind] if kind else None,
+                                      group=None if department in ('', 'ALL') else department)
+    return jsonify({'query': query, 'results': [_search_result(result) for result in results]})
+
+# Insertion recommendations: where an unassigned shipment fits best into an open transport.
+# Costs are in km of detour; the other criteria are converted with these weights.
+RECOMMEND_RADIUS_KM = 150.0
+RECOMMEND_WINDOW_DAYS = 1
+RECOMMEND_LIMIT = 20
+DAY_PENALTY_KM = 100.0          # per day the shipment lies outside the transport's dates
+TIME_WINDOW_PENALTY_KM = 250.0  # per stop that cannot be served in its time window at that position
+SLACK_PENALTY_KM = 50.0         # at an empty trailer after insertion, falling to 0 at a full one
+# Open transports by the approximate locations of their stops, built on the first recommendation
+transport_locations = geo.GridIndex(cell_degrees=0.5)
+transport_locations_built = threading.Event()
+transport_locations_lock = threading.Lock()
+
+def _stop_location(stop):
+    return geo.locate(stop.Country, stop.Postal_Code)
+
+def locate_transport(transport_id, transport):
+    if not transport_locations_built.is_set():
+        return
+    # The grid holds transport keys
+    key = Transport.key_table.intern(transport_id)
+    if transport is None or transport.Status != 'Planning':
+        transport_locations.remove(key)
+    else:
+        transport_locations.put(key, [_stop_location(stop) for stop in transport.Stops])
+
+# Shipments added or removed reach the grid through Transport.registry.notify()
+Transport.registry.subscribe(locate_transport)
+
+def build_transport_locations():
+    with transport_locations_lock:
+        if transport_locations_built.is_set():
+            return
+        transport_locations_built.set()
+        for transport_id, transport in list(Transport.registry.items()):
+            locate_transport(transport_id, transport)
+
+def _stop_window(date, time_window):
+    """
+    Returns (earliest, latest) of a stop as (date, minutes) tuples, from a 'HH:MM-HH:MM' window.
+    """
+    try:
+        day = _as_date(date)
+    except (ValueError, TypeError):
+        return None
+    start, end = 0, 24 * 60
+    if isinstance(time_window, str) and '-' in time_window:
+        try:
+            parts = [int(h) * 60 + int(m) for h, m in (part.strip().split(':') for part in time_window.split('-', 1))]
+            start, end = parts[0], max(parts)
+        except ValueError:
+            pass
+    return (day, start), (day, end)
+
+def _window_penalties(windows, window):
+    """
+    Penalty per gap of a route for a stop with `window`: it conflicts with the stop before it
+    when that stop cannot be served until after this window closes, and with the stop after
+    it when that stop's window closes before this one opens.
+    """
+    penalties = []
+    for gap in range(len(windows) + 1):
+        before = windows[gap - 1] if gap > 0 else None
+        after = windows[gap] if gap < len(windows) else None
+        conflicts = 0
+        if window is not None:
+            if before is not None and before[0] > window[1]:
+                conflicts += 1
+            if after is not None and window[0] > after[1]:
+                conflicts += 1
+        penalties.append(TIME_WINDOW_PENALTY_KM * conflicts)
+    return penalties
+
+def _days_outside(transport, shipment_obj):
+    pickup = _as_date(shipment_obj.Pickup_date)
+    delivery = _as_date(shipment_obj.Delivery_date)
+    start, end = _as_date(transport.Pickup_date), _as_date(transport.Delivery_date)
+    return max((start - pickup).days, 0) + max((delivery - end).days, 0)
+
+def fits_transport(transport, shipment_obj):
+    """
+    Checks that a transport can take a shipment without breaking a rule of its trailer
+    (or of every trailer type when no trailer is set).
+    """
+    shipment_objs = [Shipment.get_by_id(sid) for sid in transport.Shipments]
+    return not validate_shipments([s for s in shipment_objs if s] + [shipment_obj], transport.Trailer)
+
+def score_insertion(transport, shipment_obj, pickup, delivery):
+    """
+    Scores adding a shipment to a transport (lower is better); see fits_transport() for the rules.
+    """
+    stops = list(transport.Stops)
+    route = [_stop_location(stop) for stop in stops]
+    windows = [_stop_window(stop.Date, stop.Time) for stop in stops]
+    pickup_penalties = _window_penalties(windows, _stop_window(shipment_obj.Pickup_date, shipment_obj.Pickup_time))
+    delivery_penalties = _window_penalties(windows, _stop_window(shipment_obj.Delivery_date, shipment_obj.Delivery_time))
+    cost, pickup_gap, delivery_gap = geo.cheapest_insertion(route, pickup, delivery, pickup_penalties, delivery_penalties)
+    # The time window penalties are part of the cost; report the distance and the conflicts separately
+    penalty = pickup_penalties[pickup_gap] + delivery_penalties[delivery_gap]
+    detour = cost - penalty
+    time_window_conflicts = int(round(penalty / TIME_WINDOW_PENALTY_KM))
+
+    trailer_type, sub_type = trailer_spec(transport.Trailer)
+    remaining = {}
+    for field, limit in (('Weight', 'max_weight'), ('Ldm', 'max_ldm'), ('Volume', 'max_volume')):
+        capacity = constraints.engine.capacity(limit, trailer_type, sub_type)
+        remaining[field] = round(capacity - getattr(transport, field) - getattr(shipment_obj, field), 3)
+    ldm_capacity = constraints.engine.capacity('max_ldm', trailer_type, sub_type)
+    slack = max(remaining['Ldm'], 0.0) / ldm_capacity if ldm_capacity else 0.0
+    days_outside = _days_outside(transport, shipment_obj)
+    score = cost + DAY_PENALTY_KM * days_outside + SLACK_PENALTY_KM * slack
+    return {
+        'transport_id': transport.Transport_ID,
+        'score': round(score, 1),
+        'detour_km': round(detour, 1),
+        # Sequence numbers (1-based) the new stops would get
+        'pickup_sequence': pickup_gap + 1,
+        'delivery_sequence': delivery_gap + 2,
+        'days_outside': days_outside,
+        'time_window_conflicts': time_window_conflicts,
+        'remaining': remaining,
+        'stops': len(stops),
+    }
+
+def recommend_transports(shipment_obj, limit=5, radius_km=RECOMMEND_RADIUS_KM, window_days=RECOMMEND_WINDOW_DAYS):
+    """
+    Ranks the open (Planning) transports of the shipment's department by the cost of adding it.
+
+    Only transports with a stop within `radius_km` of the shipment's pickup or delivery and
+    whose dates are within `window_days` of the shipment's are scored. The full trailer rules
+    are checked afterwards, best score first, until `limit` transports that fit are found.
+
+    Returns:
+        tuple: (best recommendations first, number of transports scored)
+    """
+    pickup = geo.locate(shipment_obj.Collection_Country, shipment_obj.Collection_Postal_Code)
+    delivery = geo.locate(shipment_obj.Delivery_Country, shipment_obj.Delivery_Postal_Code)
+    nearby = transport_locations.near(pickup, radius_km) | transport_locations.near(delivery, radius_km)
+    scored = []
+    for transport_key in nearby:
+        transport = Transport.get_by_key(transport_key)
+        if (transport is None or transport.Department != shipment_obj.Department
+                or transport.Status != 'Planning' or not transport.has_shipments()):
+            continue
+        if _days_outside(transport, shipment_obj) > window_days:
+            continue
+        # Totals over the largest trailer rule out what can never fit before the full check
+        if any(getattr(transport, field) + getattr(shipment_obj, field) > constraints.engine.capacity(limit_name)
+               for field, limit_name in (('Weight', 'max_weight'), ('Ldm', 'max_ldm'), ('Volume', 'max_volume'))):
+            continue
+        scored.append((score_insertion(transport, shipment_obj, pickup, delivery), transport))
+    scored.sort(key=lambda item: (item[0]['score'], item[0]['transport_id']))
+    results = []
+    for result, transport in scored:
+        if len(results) == limit:
+            break
+        if fits_transport(transport, shipment_obj):
+            results.append(result)
+    return results, len(scored)
+
+@bp.route('/recommend_transport', methods=['POST'])
+def recommend_transport():
+    """
+    Suggests existing Planning transports for unassigned shipments, cheapest insertion first.
+
+    Body: {'shipments': [...], 'limit': 5, 'radius_km': 150, 'window_days': 1}. Every shipment
+    is scored on its own; recommendations for a batch do not account for each other.
+    """
+    data = request.get_json(silent=True) or {}
+    shipment_ids = data.get('shipments') or ([data['shipment']] if data.get('shipment') else [])
+    if not shipment_ids:
+        return jsonify({'error': 'No shipments provided'}), 400
+    try:
+        limit = min(max(int(data.get('limit', 5)), 1), RECOMMEND_LIMIT)
+        radius_km = float(data.get('radius_km', RECOMMEND_RADIUS_KM))
+        window_days = int(data.get('window_days', RECOMMEND_WINDOW_DAYS))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'limit, radius_km and window_days must be numbers'}), 400
+    if not math.isfinite(radius_km) or radius_km < 0:
+        return jsonify({'error': 'radius_km must be a positive number'}), 400
+
+    if not transport_locations_built.is_set():
+        with track_stage('index'):
+            build_transport_locations()
+    recommendations = {}
+    errors = {}
+    with track_stage('recommend'):
+        for shipment_id in shipment_ids:
+            shipment_obj = Shipment.get_by_id(shipment_id)
+            if shipment_obj is None:
+                errors[shipment_id] = 'Shipment not found'
+            elif not _is_unassigned(shipment_obj.Transport):
+                errors[shipment_id] = f"Shipment is already on transport {shipment_obj.Transport}"
+            else:
+                results, checked = recommend_transports(shipment_obj, limit, radius_km, window_days)
+                recommendations[shipment_id] = {'candidates_checked': checked, 'transports': results}
+    return jsonify({'recommendations': recommendations, 'errors': errors})
+
+# Utilization KPIs per department and pickup day, materialized in kpi_table. The table is built on
+# the first /kpi request (or by the warm-up thread); afterwards the registry listeners keep it up to date.
+kpi_table = kpi.KpiTable()
+kpi_built = threading.Event()
+kpi_lock = threading.Lock()
+metrics.registry.gauge('mobility_kpi_cells', 'Department/day cells of the materialized KPI table.',
+                       callback=lambda: len(kpi_table))
+
+def _kpi_day(value):
+    try:
+        return _as_date(value)
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+def _kpi_amount(value):
+    # Sale_cost comes from the request body as given; anything that is not a number counts as 0
+    try:
+        amount = float(value)
+    except (ValueError, TypeError):
+        return 0.0
+    return amount if math.isfinite(amount) else 0.0
+
+def kpi_shipment(shipment_id, shipment_obj):
+    """
+    Counts a shipment on its pickup day, as planned while it is on a live transport. Adding and
+    removing shipments notifies just those shipments, so a change costs O(k) for k shipments.
+    """
+    if not kpi_built.is_set():
+        return
+    contributions = None
+    if shipment_obj is not None:
+        planned = Transport.get_by_id(shipment_obj.Transport) is not None
+        contributions = [((shipment_obj.Department, _kpi_day(shipment_obj.Pickup_date)),
+                          {'shipments': 1, 'planned_shipments': int(planned)})]
+    kpi_table.update('shipment', shipment_id, contributions)
+
+def kpi_transport(transport_id, transport):
+    """
+    Recounts a transport: its totals go to the day of its Pickup_date. Its shipments count as
+    planned through kpi_shipment(), so the recount does not depend on the transport's size.
+    """
+    if not kpi_built.is_set() or not transport_id:
+        return
+    if transport is None:
+        kpi_table.update('transport', transport_id, None)
+        return
+    trailer_type, sub_type = trailer_spec(transport.Trailer)
+    contributions = [((transport.Department, _kpi_day(transport.Pickup_date)), {
+        'transports': 1,
+        'planning_transports': int(transport.Status == 'Planning'),
+        'handled_transports': int(transport.Status == 'Handled'),
+        'weight': _kpi_amount(transport.Weight),
+        'weight_capacity': constraints.engine.capacity('max_weight', trailer_type, sub_type),
+        'ldm': _kpi_amount(transport.Ldm),
+        'ldm_capacity': constraints.engine.capacity('max_ldm', trailer_type, sub_type),
+        'cost': _kpi_amount(transport.Cost),
+        'sale_cost': _kpi_amount(transport.Sale_cost) if transport.Sale else 0.0,
+        'haulier_cost': _kpi_amount(transport.Haulier_cost),
+    })]
+    kpi_table.update('transport', transport_id, contributions)
+
+# Every planning change reaches the table through the registries (see Transport.registry.notify())
+Shipment.registry.subscribe(kpi_shipment)
+Transport.registry.subscribe(kpi_transport)
+
+def build_kpis():
+    with kpi_lock:
+        if kpi_built.is_set():
+            return
+        # Set first, so objects registered while the table is built are not missed
+        kpi_built.set()
+        for shipment_id, shipment_obj in list(Shipment.registry.items()):
+            kpi_shipment(shipment_id, shipment_obj)
+        for transport_id, transport in list(Transport.registry.items()):
+            kpi_transport(transport_id, transport)
+
+def _kpi_row(totals):
+    amounts = ('transports', 'planning_transports', 'handled_transports', 'shipments', 'planned_shipments',
+               'weight', 'weight_capacity', 'ldm', 'ldm_capacity', 'cost', 'sale_cost', 'haulier_cost')
+    row = {name: round(totals.get(name, 0), 2) for name in amounts}
+    for name in ('transports', 'planning_transports', 'handled_transports', 'shipments', 'planned_shipments'):
+        row[name] = int(row[name])
+    row['unassigned_shipments'] = row['shipments'] - row['planned_shipments']
+    row['weight_utilization'] = round(row['weight'] / row['weight_capacity'], 4) if row['weight_capacity'] else 0.0
+    row['ldm_utilization'] = round(row['ldm'] / row['ldm_capacity'], 4) if row['ldm_capacity'] else 0.0
+    return row
+
+@bp.route('/kpi')
+def kpi_endpoint():
+    """
+    Utilization KPIs per department and pickup day, read from the materialized table.
+
+    Query parameters: department (default 'ALL'), and start_date/date_range_days as in the
+    list views; without date_range_days all days are returned. The response has a row per
+    department and day and the totals over those rows.
+    """
+    department = request.args.get('department', 'ALL').strip()
+    window = date_window(request.args.get('date_range_days', '').strip(), request.args.get('start_date', '').strip())
+    if not kpi_built.is_set():
+        with track_stage('index'):
+            build_kpis()
+    start, end = window if window is not None else (None, None)
+    cells = kpi_table.cells(None if department in ('', 'ALL') else department, start, end)
+    totals = {}
+    for _, _, cell in cells:
+        for name, value in cell.items():
+            totals[name] = totals.get(name, 0) + value
+    return jsonify({
+        'department': department or 'ALL',
+        'start_date': None if start is None else start.isoformat(),
+        'end_date': None if end is None else end.isoformat(),
+        'days': [{'department': dept, 'date': None if day is None else day.isoformat(), **_kpi_row(cell)}
+                 for dept, day, cell in cells],
+        'totals': _kpi_row(totals),
+    })
+
+# Background jobs; the snapshot functions run under the department lock, the apply
+# functions in this process once the worker has finished
+def _jobs():
+    return current_app.extensions['jobs']
+
+# Job databases already recovered by this process; recovering again (a second create_app()) would
+# fail the live jobs of the first app's runner
+_recovered_job_stores = set()
+
+def _optimize_stops_snapshot(department, params):
+    snapshot = []
+    for transport in department_transports(department):
+        if transport.Status != 'Planning' or len(transport.Stops) < 3:
+            continue
+        # Stops by key; the apply step maps the new order back to stop IDs
+        snapshot.append({'transport_id': transport.Transport_ID, 'stops': [
+            {'id': stop.key, 'type': stop.Type, 'pickup': keys.stop_key(stop.shipment.key, 'P'),
+             'point': _stop_location(stop)}
+            for stop in transport.Stops]})
+    return snapshot
+
+def _optimize_stops_apply(department, owner):
+    def apply(result):
+        applied, conflicts = [], []
+        with department_locks.hold([department]):
+            for change in result['changes']:
+                transport = Transport.get_by_id(change['transport_id'])
+                stops = [Stop.table.get(key) for key in change['before'] + change['after']]
+                # Only transports whose stops are unchanged since the snapshot are re-sequenced; a
+                # stop unbound in between (archiving, sandbox rebind) no longer resolves and conflicts
+                if not transport or any(stop is None for stop in stops):
+                    conflicts.append(change['transport_id'])
+                    continue
+                before = [stop.ID for stop in stops[:len(change['before'])]]
+                after = [stop.ID for stop in stops[len(change['before']):]]
+                if _stop_order(transport) != before:
+                    conflicts.append(change['transport_id'])
+                    continue
+                transport.Stops.reorder(after)
+                record_stop_order(transport, before,
+                                  f"Optimized stop order of {change['transport_id']} "
+                                  f"({change['before_km']} -> {change['after_km']} km)", user=owner)
+                applied.append(dict(change, before=before, after=after))
+        return {'transports': result['transports'], 'applied': applied, 'conflicts': conflicts}
+    return apply
+
+def _consolidate_snapshot(department, params):
+    frame = datasets.shard('shipments', department)
+    frame = frame[frame['Transport'].isnull() | (frame['Transport'] == '')]
+    if params.get('pickup_date'):
+        frame = frame[frame['Pickup_date'].astype(str) == str(params['pickup_date'])]
+    snapshot = []
+    for shipment_id in frame['Shipment_ID']:
+        shipment_obj = Shipment.get_by_id(shipment_id)
+        if shipment_obj is None:
+            continue
+        columns = shipment_columns([shipment_obj])
+        snapshot.append({
+            'id': shipment_id,
+            'pickup_date': str(shipment_obj.Pickup_date),
+            'delivery_point': geo.locate(shipment_obj.Delivery_Country, shipment_obj.Delivery_Postal_Code),
+            **{name: columns[name][0].item() for name in constraints.COLUMNS},
+        })
+    return snapshot
+
+def _consolidate_apply(department, owner):
+    def apply(result):
+        created, conflicts = [], []
+        with department_locks.hold([department]):
+            for group in result['groups']:
+                shipment_objs = [Shipment.get_by_id(sid) for sid in group]
+                # Shipments planned by someone else meanwhile are left alone, with the rest of their group
+                if not all(s is not None and _is_unassigned(s.Transport) for s in shipment_objs):
+                    conflicts.append(group)
+                    continue
+                selected_df = datasets.shipments[datasets.shipments['Shipment_ID'].isin(group)]
+                transport = Transport_create(selected_df)
+                _set_shipments_transport(group, transport.Transport_ID)
+                record_transport_creation(transport, user=owner)
+                created.append({'transport_id': transport.Transport_ID, 'shipments': group})
+        return {'shipments': result['shipments'], 'created': created, 'conflicts': conflicts}
+    return apply
+
+def _ingest_dir():
+    # Directory the dump files of ingest jobs are read from (default: dumps/ in the app's data
+    # directory); jobs name files inside it only
+    return os.environ.get('MOBILITY_INGEST_DIR') or os.path.join(datasets.data_dir, 'dumps')
+
+def _ingest_snapshot(department, params):
+    files = params.get('files')
+    if not files or not isinstance(files, list):
+        raise ValueError('params.files must list the dump files to ingest')
+    root = os.path.realpath(_ingest_dir())
+    paths = []
+    for name in files:
+        path = os.path.realpath(os.path.join(root, str(name)))
+        if os.path.commonpath([root, path]) != root or not os.path.isfile(path):
+            raise ValueError(f"No dump file {name} in the ingest directory")
+        paths.append(path)
+    return {'paths': paths, 'data_dir': datasets.data_dir}
+
+def _ingest_apply(department, owner):
+    def apply(result):
+        # The worker merged the dumps into df_shipments.csv; load the rows that are new to the
+        # planning state. The shipments table is replaced as a whole, as when archiving.
+        with department_locks.hold(_all_departments() | {department}), datasets.writing('shipments') as frame:
+            added = load_shipments(datasets.data_dir, skip_ids=set(frame['Shipment_ID']))
+            if len(added):
+                datasets.replace('shipments', pd.concat([frame, added], ignore_index=True))
+        logger.info("Loaded ingested shipments", extra={'department': department, 'shipments': len(added)})
+        return dict(result, loaded=len(added))
+    return apply
+
+# kind -> (snapshot(department, params), task run in a worker, apply factory(department, owner))
+JOB_KINDS = {
+    'optimize_stops': (_optimize_stops_snapshot, tasks.optimize_stops, _optimize_stops_apply),
+    'consolidate': (_consolidate_snapshot, tasks.consolidate, _consolidate_apply),
+    'ingest': (_ingest_snapshot, tasks.ingest_dumps, _ingest_apply),
+}
+
+@bp.route('/jobs', methods=['GET', 'POST'])
+def jobs_collection():
+    """
+    GET lists jobs (optionally ?status= and ?mine=1); POST starts one:
+    {'kind': 'optimize_stops' | 'consolidate' | 'ingest', 'department': ..., 'params': {...}}.
+    An ingest job takes {'files': [...]}, dump files in MOBILITY_INGEST_DIR, and assigns their
+    shipments to the department.
+    """
+    if request.method == 'GET':
+        owner = _current_user() if request.args.get('mine') else None
+        return jsonify({'jobs': _jobs().store.list(owner=owner, status=request.args.get('status') or None)})
+
+    data = request.get_json(silent=True) or {}
+    kind = data.get('kind')
+    department = (data.get('department') or '').strip()
+    params = data.get('params') or {}
+    if kind not in JOB_KINDS:
+        return jsonify({'error': f"kind must be one of {', '.join(JOB_KINDS)}"}), 400
+    if not department or department == 'ALL':
+        return jsonify({'error': 'A department is required'}), 400
+    if not isinstance(params, dict):
+        return jsonify({'error': 'params must be an object'}), 400
+    snapshot_fn, task, apply_factory = JOB_KINDS[kind]
+    owner = _current_user()
+    # A consistent view of the department: no planning change can interleave while it is copied
+    with department_locks.hold([department]):
+        try:
+            snapshot = snapshot_fn(department, params)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+    job_id = _jobs().submit(kind, task, {**params, 'department': department}, snapshot,
+                            apply=apply_factory(department, owner), owner=owner)
+    logger.info("Started job", extra={'job': job_id, 'kind': kind, 'department': department, 'owner': owner})
+    return jsonify({'job': _jobs().store.get(job_id)}), 202
+
+@bp.route('/jobs/<job_id>', methods=['GET', 'DELETE'])
+def job_detail(job_id):
+    """
+    GET returns the status and progress of a job; DELETE cancels it.
+    """
+    runner = _jobs()
+    if request.method == 'DELETE':
+        if not runner.cancel(job_id):
+            job = runner.store.get(job_id)
+            if job is None:
+                return jsonify({'error': 'Job not found'}), 404
+            return jsonify({'error': f"Job has already {job['status']}", 'job': job}), 409
+    job = runner.store.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify({'job': job})
+
+@bp.route('/jobs/<job_id>/result')
+def job_result(job_id):
+    job = _jobs().store.get(job_id, with_result=True)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if job['status'] != 'succeeded':
+        return jsonify({'error': f"Job is {job['status']}", 'job': {k: v for k, v in job.items() if k != 'result'}}), 409
+    return json_body({'job_id': job_id, 'result': job['result']})
+
+# Undo/redo log of planning operations per user (X-User header), doubling as the audit trail
+audit_logger = get_logger('audit')
+history = History(
+    depth=int(os.environ.get('MOBILITY_HISTORY_DEPTH', '50') or 50),
+    audit_capacity=int(os.environ.get('MOBILITY_AUDIT_CAPACITY', '1000') or 1000),
+    on_event=lambda entry: audit_logger.info("Planning change", extra=entry),
+)
+
+def _current_user():
+    """
+    The user whose history a planning change goes to, from the X-User header. The header is only
+    believed with X-User-Signature, the hex HMAC-SHA256 of the user name under MOBILITY_USER_SECRET,
+    or without a configured secret when MOBILITY_TRUST_USER_HEADER=1 (behind a proxy that sets it,
+    or local development). Otherwise the request is 'anonymous'.
+    """
+    user = request.headers.get('X-User', '')
+    if not user:
+        return 'anonymous'
+    secret = os.environ.get('MOBILITY_USER_SECRET')
+    if not secret:
+        return user if os.environ.get('MOBILITY_TRUST_USER_HEADER', '0') == '1' else 'anonymous'
+    signature = hmac.new(secret.encode(), user.encode(), hashlib.sha256).hexdigest()
+    return user if hmac.compare_digest(signature, request.headers.get('X-User-Signature', '')) else 'anonymous'
+
+def record_command(action, description, undo, redo, tables=(), user=None):
+    """
+    Records an applied planning operation for the current user (or `user`, outside a
+    request) so it can be undone.
+    """
+    return history.record(user or _current_user(), Command(action, description, undo, redo, tables))
+
+def _shipment_departments(shipment_ids, *transports):
+    """
+    Departments whose locks cover planning the given shipments (and transports): creating or
+    changing a transport, checking the shipments are free and writing the shipments table happen
+    under these locks as one step.
+    """
+    departments = {shipment_obj.Department for shipment_obj in map(Shipment.get_by_id, shipment_ids) if shipment_obj}
+    return departments | {transport.Department for transport in transports if transport}
+
+def _all_departments():
+    """Departments of all transports and shipments, for operations holding every department lock."""
+    return set(Transport.registry.shards()) | set(datasets.shipments['Department'].dropna().unique())
+
+def _set_shipments_transport(shipment_ids, transport_id):
+    with datasets.writing('shipments') as frame:
+        frame.loc[frame['Shipment_ID'].isin(list(shipment_ids)), 'Transport'] = transport_id
+
+def _stop_order(transport):
+    return transport.Stops.ids()
+
+def _restore_stop_order(transport, order):
+    transport.Stops.reorder(order)
+
+def _shipment_commands(transport_id, shipment_ids, stops_before, stops_after):
+    """
+    Returns (take_off, put_on) callables moving shipments off and back onto a transport,
+    each restoring the stop order that belongs to the resulting state.
+    """
+    def take_off():
+        transport = Transport.get_by_id(transport_id)
+        if not transport or not all(transport.has_shipment(sid) for sid in shipment_ids):
+            raise HistoryConflict(f"Shipments are no longer on transport {transport_id}.")
+        transport.remove_shipments([Shipment.get_by_id(sid) for sid in shipment_ids])
+        _set_shipments_transport(shipment_ids, None)
+        _restore_stop_order(transport, stops_before)
+
+    def put_on():
+        transport = Transport.get_by_id(transport_id)
+        shipment_objs = [Shipment.get_by_id(sid) for sid in shipment_ids]
+        if not transport or not all(_is_unassigned(s.Transport) for s in shipment_objs):
+            raise HistoryConflict(f"Shipments are no longer free to go on transport {transport_id}.")
+        transport.add_shipments(shipment_objs)
+        _set_shipments_transport(shipment_ids, transport_id)
+        _restore_stop_order(transport, stops_after)
+
+    return take_off, put_on
+
+def _assignment_state(transport_id, license_plates):
+    """
+    Vehicle/trailer fields of a transport and the Transport/Trailer of trucks, for undoing assignments.
+    """
+    transport = Transport.get_by_id(transport_id) if transport_id else None
+    state = {'transport': None, 'trucks': {}}
+    if transport:
+        state['transport'] = {f: getattr(transport, f) for f in ('Vehicle', 'Driver', 'Haulier', 'Trailer')}
+    for license_plate in license_plates:
+        if license_plate:
+            record = _truck_record(license_plate)
+            if record is not None:
+                # Empty cells are NaN, which never compares equal; None stands for them
+                state['trucks'][license_plate] = {f: None if _is_unassigned(record[f]) else record[f]
+                                                  for f in ('Transport', 'Trailer')}
+    return state
+
+def _assignment_commands(transport_id, license_plates, before, after):
+    """
+    Returns (undo, redo) callables switching between two assignment states.
+    """
+    def switch(expected, target):
+        def apply():
+            if _assignment_state(transport_id, license_plates) != expected:
+                raise HistoryConflict("Assignment has been changed since.")
+            if target['transport'] is not None:
+                transport = Transport.get_by_id(transport_id)
+                for field, value in target['transport'].items():
+                    setattr(transport, field, value)
+                Transport.registry.notify(transport_id)
+            with datasets.writing('trucks') as trucks:
+                for license_plate, fields in target['trucks'].items():
+                    truck_mask = trucks['License_plate'] == license_plate
+                    for field, value in fields.items():
+                        trucks.loc[truck_mask, field] = value
+        return apply
+    return switch(after, before), switch(before, after)
+
+def record_assignment(action, description, transport_id, license_plates, before):
+    undo, redo = _assignment_commands(transport_id, license_plates, before,
+                                      _assignment_state(transport_id, license_plates))
+    record_command(action, description, undo, redo, tables=('trucks',))
+    # Search index and KPIs follow the new vehicle and trailer
+    Transport.registry.notify(transport_id)
+
+def _planning_state(transport_ids, shipment_ids, license_plates):
+    """
+    Shipments, stop order and vehicle fields of transports (None for one that does not exist),
+    the transport of shipments and the Transport/Trailer of trucks, for undoing a batch of changes.
+    """
+    state = {'transports': {}, 'shipments': {}, 'trucks': _assignment_state(None, license_plates)['trucks']}
+    for transport_id in transport_ids:
+        transport = Transport.get_by_id(transport_id)
+        state['transports'][transport_id] = None if transport is None else dict(
+            {f: getattr(transport, f) for f in ('Vehicle', 'Driver', 'Haulier', 'Trailer')},
+            # Shipments as a set: putting them back restores the stop order, not the order they were added in
+            Shipments=frozenset(transport.Shipments), Stops=_stop_order(transport))
+    for shipment_id in shipment_ids:
+        shipment_obj = Shipment.get_by_id(shipment_id)
+        state['shipments'][shipment_id] = (
+            None if shipment_obj is None or _is_unassigned(shipment_obj.Transport) else shipment_obj.Transport)
+    return state
+
+def _planning_commands(before, after, transports):
+    """
+    Returns (undo, redo) callables switching between two states of _planning_state().
+    `transports` holds the Transport objects of IDs that do not exist in one of the states.
+    """
+    def switch(expected, target):
+        def apply():
+            if _planning_state(expected['transports'], expected['shipments'], expected['trucks']) != expected:
+                raise HistoryConflict("Planning has been changed since.")
+            # Shipments leave their transports first, so they are free for their target transports
+            for transport_id, state in expected['transports'].items():
+                if state is not None:
+                    keep = (target['transports'][transport_id] or {}).get('Shipments', frozenset())
+                    Transport.get_by_id(transport_id).remove_shipments(
+                        [Shipment.get_by_id(sid) for sid in state['Shipments'] if sid not in keep])
+            for transport_id, state in target['transports'].items():
+                if state is None:
+                    if expected['transports'][transport_id] is not None:
+                        del Transport.registry[transport_id]
+                    continue
+                if expected['transports'][transport_id] is None:
+                    Transport.registry[transport_id] = transports[transport_id]
+                transport = Transport.get_by_id(transport_id)
+                transport.add_shipments([Shipment.get_by_id(sid) for sid in state['Shipments']
+                                         if not transport.has_shipment(sid)])
+                _restore_stop_order(transport, state['Stops'])
+                for field in ('Vehicle', 'Driver', 'Haulier', 'Trailer'):
+                    setattr(transport, field, state[field])
+                Transport.registry.notify(transport_id)
+            for transport_id in set(target['shipments'].values()):
+                _set_shipments_transport([sid for sid, value in target['shipments'].items() if value == transport_id],
+                                         transport_id)
+            with datasets.writing('trucks') as trucks:
+                for license_plate, fields in target['trucks'].items():
+                    truck_mask = trucks['License_plate'] == license_plate
+                    for field, value in fields.items():
+                        trucks.loc[truck_mask, field] = value
+        return apply
+    return switch(after, before), switch(before, after)
+
+def record_stop_order(transport, stops_before, description, user=None):
+    transport_id = transport.Transport_ID
+    stops_after = _stop_order(transport)
+
+    def switch(expected, target):
+        def apply():
+            current = Transport.get_by_id(transport_id)
+            if not current or _stop_order(current) != expected:
+                raise HistoryConflict(f"Stops of {transport_id} have been changed since.")
+            _restore_stop_order(current, target)
+        return apply
+    record_command('reorder_stops', description, switch(stops_after, stops_before), switch(stops_before, stops_after),
+                   user=user)
+
+def record_transport_creation(transport, user=None):
+    transport_id = transport.Transport_ID
+    shipment_ids = transport.Shipments
+    take_off, put_on = _shipment_commands(transport_id, shipment_ids, [], _stop_order(transport))
+
+    def undo():
+        if transport.Vehicle:
+            raise HistoryConflict(f"Transport {transport_id} has been assigned to a truck since.")
+        take_off()
+        del Transport.registry[transport_id]
+
+    def redo():
+        if Transport.get_by_id(transport_id):
+            raise HistoryConflict(f"Transport ID {transport_id} has been taken since.")
+        Transport.registry[transport_id] = transport
+        try:
+            put_on()
+        except HistoryConflict:
+            del Transport.registry[transport_id]
+            raise
+    record_command('create_transport', f"Created {transport_id} with {len(shipment_ids)} shipment(s)", undo, redo,
+                   user=user)
+
+def _replay_history(method):
+    data = request.get_json(silent=True) or {}
+    try:
+        steps = int(data.get('steps', 1))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'steps must be an integer'}), 400
+    if steps < 1:
+        return jsonify({'success': False, 'error': 'steps must be at least 1'}), 400
+    try:
+        # The commands change transports of any department. Their locks are taken before the
+        # history lock, in the same order as recording a change made under department locks.
+        with department_locks.hold(_all_departments()):
+            commands = getattr(history, method)(_current_user(), steps)
+    except HistoryConflict as e:
+        return jsonify({'success': False, 'error': str(e)}), 409
+    except Exception as e:
+        logger.exception("Error in %s: %s", method, e)
+        return jsonify({'success': False, 'error': str(e)}), 500
+    # A batch writes each touched table once
+    for table in set().union(*(command.tables for command in commands)):
+        persister.mark_dirty(table)
+    return jsonify({'success': True, method: [command.summary() for command in commands]})
+
+@bp.route('/history')
+def history_stacks():
+    return jsonify(history.stacks(_current_user()))
+
+@bp.route('/history/undo', methods=['POST'])
+def history_undo():
+    """
+    Undoes the current user's last 'steps' (default 1) planning operations as one batch.
+    """
+    return _replay_history('undo')
+
+@bp.route('/history/redo', methods=['POST'])
+def history_redo():
+    return _replay_history('redo')
+
+@bp.route('/history/audit')
+def history_audit():
+    if not _admin_authorized():
+        return jsonify({'error': 'Admin token required'}), 403
+    try:
+        limit = int(request.args.get('limit', 100))
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    return jsonify({'entries': history.audit(request.args.get('user') or None, limit)})
+
+@bp.route('/create_transport', methods=['POST'])
 def create_transport():
     try:
         data = request.get_json()
         shipment_ids = data['shipments']
-        print("Creating transport for", shipment_ids)
-        selected_df = shipments_df[shipments_df['Shipment_ID'].isin(shipment_ids)]
-        print("Selected df shape", selected_df.shape)
-        transport = Transport_create(selected_df)
-        print("Transport created", transport.Transport_ID)
-        # Update shipments_df
-        for sid in shipment_ids:
-            shipments_df.loc[shipments_df['Shipment_ID'] == sid, 'Transport'] = transport.Transport_ID
-        return jsonify({'message': f'Transport {transport.Transport_ID} created'})
+        logger.debug("Creating transport for %s", shipment_ids)
+        with department_locks.hold(_shipment_departments(shipment_ids)):
+            selected_df = datasets.shipments[datasets.shipments['Shipment_ID'].isin(shipment_ids)]
+            logger.debug("Selected df shape %s", selected_df.shape)
+            violations = validate_shipments([s for s in map(Shipment.get_by_id, selected_df['Shipment_ID']) if s])
+            if violations and data.get('strict'):
+                return jsonify({'message': 'Shipments violate trailer constraints', 'violations': violations}), 409
+            transport = Transport_create(selected_df)
+            # Update the shipments table
+            _set_shipments_transport(transport.Shipments, transport.Transport_ID)
+        record_transport_creation(transport)
+        return jsonify({'message': f'Transport {transport.Transport_ID} created', 'violations': violations})
     except Exception as e:
-        print("Error:", e)
+        logger.exception("Error in create_transport: %s", e)
         return jsonify({'message': f'Error: {str(e)}'}), 500
 
-@app.route('/add_shipment', methods=['POST'])
+@bp.route('/add_shipment', methods=['POST'])
 def add_shipment():
     try:
         data = request.get_json()
         transport_id = data['transport']
         shipment_ids = data['shipments']
-        selected_df = shipments_df[shipments_df['Shipment_ID'].isin(shipment_ids)]
-        transport = Transport_add(transport_id, selected_df)
+        existing = Transport.get_by_id(transport_id)
+        with department_locks.hold(_shipment_departments(shipment_ids, existing)):
+            selected_df = datasets.shipments[datasets.shipments['Shipment_ID'].isin(shipment_ids)]
+            shipments_before = set(existing.Shipments) if existing else set()
+            stops_before = _stop_order(existing) if existing else []
+            if existing and data.get('strict'):
+                candidate_ids = existing.Shipments + [sid for sid in selected_df['Shipment_ID'] if not existing.has_shipment(sid)]
+                violations = validate_shipments([s for s in map(Shipment.get_by_id, candidate_ids) if s], existing.Trailer)
+                if violations:
+                    return jsonify({'message': 'Shipments violate trailer constraints', 'violations': violations}), 409
+            transport = Transport_add(transport_id, selected_df)
+            added = [sid for sid in transport.Shipments if sid not in shipments_before] if transport else []
+            # Update the shipments table; shipments already on another transport keep theirs
+            _set_shipments_transport(added, transport_id)
+            stops_after = _stop_order(transport) if transport else []
         if transport:
-            # Update shipments_df
-            for sid in shipment_ids:
-                shipments_df.loc[shipments_df['Shipment_ID'] == sid, 'Transport'] = transport.Transport_ID
-            return jsonify({'message': f'Shipments added to transport {transport.Transport_ID}'})
+            if added:
+                take_off, put_on = _shipment_commands(transport.Transport_ID, added, stops_before, stops_after)
+                record_command('add_shipment', f"Added {len(added)} shipment(s) to {transport.Transport_ID}",
+                               take_off, put_on)
+            violations = transport_violations(transport)
+            return jsonify({'message': f'Shipments added to transport {transport.Transport_ID}', 'violations': violations})
         else:
             return jsonify({'message': 'Transport not found'}), 404
     except Exception as e:
-        print("Error in add_shipment:", e)
+        logger.exception("Error in add_shipment: %s", e)
         return jsonify({'message': f'Error: {str(e)}'}), 500
 
-@app.route('/remove_shipment', methods=['POST'])
+@bp.route('/remove_shipment', methods=['POST'])
 def remove_shipment():
     try:
         data = request.get_json()
         shipment_ids = data['shipments']
-        transport = Transport_remove(shipment_ids)
+        first = Shipment.get_by_id(shipment_ids[0]) if shipment_ids else None
+        existing = Transport.get_by_id(first.Transport) if first and not _is_unassigned(first.Transport) else None
+        with department_locks.hold(_shipment_departments(shipment_ids, existing)):
+            stops_before = _stop_order(existing) if existing else []
+            transport = Transport_remove(shipment_ids)
+            if transport:
+                # Update the shipments table to set Transport to None for removed shipments
+                _set_shipments_transport(shipment_ids, None)
+                stops_after = _stop_order(transport)
         if transport:
-            # Update shipments_df to set Transport to None for removed shipments
-            for sid in shipment_ids:
-                shipments_df.loc[shipments_df['Shipment_ID'] == sid, 'Transport'] = None
+            removed = list(dict.fromkeys(shipment_ids))
+            take_off, put_on = _shipment_commands(transport.Transport_ID, removed, stops_after, stops_before)
+            record_command('remove_shipment', f"Removed {len(removed)} shipment(s) from {transport.Transport_ID}",
+                           put_on, take_off)
             return jsonify({'message': f'Shipments removed from transport {transport.Transport_ID}'})
         else:
             return jsonify({'message': 'Transport not found'}), 404
     except Exception as e:
-        print("Error in remove_shipment:", e)
+        logger.exception("Error in remove_shipment: %s", e)
         return jsonify({'message': f'Error: {str(e)}'}), 500
 
-@app.route('/sell_shipment_transport', methods=['POST'])
+@bp.route('/sell_shipment_transport', methods=['POST'])
 def sell_shipment_transport():
     try:
         data = request.get_json()
@@ -822,26 +2478,28 @@ def sell_shipment_transport():
             if transport:
                 transport.Sale = True
                 transport.Sale_cost = sale_cost
+                Transport.registry.notify(transport_id)
                 return jsonify({'message': f'Transport {transport_id} marked for sale with cost {sale_cost}'})
             else:
                 return jsonify({'message': 'Transport not found'}), 404
         elif shipment_ids:
             # Create a transport from shipments and set Sale = True
-            selected_df = shipments_df[shipments_df['Shipment_ID'].isin(shipment_ids)]
-            transport = Transport_create(selected_df)
-            transport.Sale = True
-            transport.Sale_cost = sale_cost
-            # Update shipments_df
-            for sid in shipment_ids:
-                shipments_df.loc[shipments_df['Shipment_ID'] == sid, 'Transport'] = transport.Transport_ID
+            with department_locks.hold(_shipment_departments(shipment_ids)):
+                selected_df = datasets.shipments[datasets.shipments['Shipment_ID'].isin(shipment_ids)]
+                transport = Transport_create(selected_df)
+                transport.Sale = True
+                transport.Sale_cost = sale_cost
+                Transport.registry.notify(transport.Transport_ID)
+                # Update the shipments table
+                _set_shipments_transport(transport.Shipments, transport.Transport_ID)
             return jsonify({'message': f'Transport {transport.Transport_ID} created and marked for sale with cost {sale_cost}'})
         else:
             return jsonify({'message': 'No shipments or transport selected'}), 400
     except Exception as e:
-        print("Error in sell_shipment_transport:", e)
+        logger.exception("Error in sell_shipment_transport: %s", e)
         return jsonify({'message': f'Error: {str(e)}'}), 500
 
-@app.route('/get_transport_info')
+@bp.route('/get_transport_info')
 def get_transport_info():
     transport_id = request.args.get('transport_id', '')
     if transport_id:
@@ -853,35 +2511,24 @@ def get_transport_info():
             })
     return jsonify({'error': 'Transport not found'}), 404
 
-@app.route('/planning')
+@bp.route('/planning')
 def planning():
     # Get filter parameters
     department = request.args.get('department', 'KDEGR').strip()
     start_date_str = request.args.get('start_date', '').strip()
     date_range_days = request.args.get('date_range_days', '0').strip()
     
+    window = date_window(date_range_days, start_date_str)
+    
+    begin_stage('filter')
     # Filter trucks by department
-    if department and department != 'ALL':
-        filtered_trucks_df = trucks_df[trucks_df['Department'] == department].copy()
-    else:
-        filtered_trucks_df = trucks_df.copy()
+    filtered_trucks_df = datasets.shard('trucks', department).copy()
     
-    # Apply date range filter to trucks
-    if date_range_days:
+    # Apply date range filter to trucks; their Date changes in place (transfer_truck), so
+    # the small trucks table is filtered directly rather than partitioned
+    if window is not None:
         try:
-            days = int(date_range_days)
-            if start_date_str:
-                start_date = pd.to_datetime(start_date_str).date()
-            else:
-                start_date = datetime.date.today()
-            
-            if days >= 0:
-                end_date = start_date + datetime.timedelta(days=days)
-            else:
-                end_date = start_date
-                start_date = start_date + datetime.timedelta(days=days)
-            
-            # Filter trucks by date range
+            start_date, end_date = window
             filtered_trucks_df['Date'] = pd.to_datetime(filtered_trucks_df['Date']).dt.date
             filtered_trucks_df = filtered_trucks_df[
                 (filtered_trucks_df['Date'] >= start_date) & 
@@ -896,39 +2543,19 @@ def planning():
         (filtered_trucks_df['Transport'] == '')
     ]
     
-    trucks_list = filtered_trucks_df.to_dict('records')
-    
-    # Start with all transports
-    all_transports = list(Transport.registry.values())
-    filtered_transports = all_transports.copy()
+    end_stage()
+    track_rows('trucks', len(filtered_trucks_df))
+    with track_stage('to_dict'):
+        trucks_list = filtered_trucks_df.to_dict('records')
     
-    # Apply department filter
-    if department and department != 'ALL':
-        filtered_transports = [t for t in filtered_transports if t.Department == department]
+    begin_stage('filter')
+    # Start with the transports of the department inside the date range
+    filtered_transports = department_transports(department, window)
     
     # Filter to only show transports with status "Planning"
     filtered_transports = [t for t in filtered_transports if t.Status == 'Planning']
-    
-    # Apply date range filter to transports
-    if date_range_days:
-        try:
-            days = int(date_range_days)
-            if start_date_str:
-                start_date = pd.to_datetime(start_date_str).date()
-            else:
-                start_date = datetime.date.today()
-            
-            if days >= 0:
-                end_date = start_date + datetime.timedelta(days=days)
-                filtered_transports = [t for t in filtered_transports 
-                                      if hasattr(t, 'Pickup_date') and start_date <= t.Pickup_date <= end_date]
-            else:
-                end_date = start_date
-                start_date = start_date + datetime.timedelta(days=days)
-                filtered_transports = [t for t in filtered_transports 
-                                      if hasattr(t, 'Pickup_date') and start_date <= t.Pickup_date <= end_date]
-        except (ValueError, AttributeError, TypeError):
-            pass
+    track_rows('transports', len(filtered_transports))
+    end_stage()
     
     # Combine transports and trucks into a single table
     combined_list = []
@@ -983,7 +2610,7 @@ def planning():
                     location_str = location_raw
             else:
                 location_str = location_raw
-        
+    
         combined_item = {
             'Type': 'Truck',
             'ID': truck.get('License_plate', ''),
@@ -1010,74 +2637,61 @@ def planning():
     open_pool_filter = request.args.get('open_pool', 'false').lower() == 'true'
     if open_pool_filter:
         # When checked: show all trailers with Open_pool == True (ignore department)
-        available_trailers = trailers_df[
-            trailers_df['Open_pool'] == True
+        available_trailers = datasets.trailers[
+            datasets.trailers['Open_pool'] == True
         ]
     else:
         # When unchecked: show trailers from filtered department with Open_pool == False
-        if department and department != 'ALL':
-            available_trailers = trailers_df[
-                (trailers_df['Department'] == department) & 
-                (trailers_df['Open_pool'] == False)
-            ]
-        else:
-            available_trailers = trailers_df[
-                trailers_df['Open_pool'] == False
-            ]
+        department_trailers = datasets.shard('trailers', department)
+        available_trailers = department_trailers[department_trailers['Open_pool'] == False]
     
     # Convert to list of license plates for the template
     trailers_list = available_trailers['License_plate'].tolist()
     
-    return render_template('planning.html', combined_items=combined_list, available_trailers=trailers_list, current_department=department)
+    rows = _fragments().rows('planning_row.html', combined_list, 'ID')
+    return stream_page('planning.html', combined_items=rows, available_trailers=trailers_list, current_department=department)
 
-@app.route('/planning/stops/<type>/<id>')
+TRANSPORT_FIELDS = ('Transport_ID', 'Department', 'Shipments', 'Pickup_date', 'Delivery_date', 'Weight', 'Volume',
+                    'Ldm', 'Cost', 'Status', 'Vehicle', 'Haulier', 'Driver', 'Trailer')
+STOP_FIELDS = ('ID', 'Type', 'Sequence', 'Shipment_ID', 'Country', 'Postal_Code', 'City', 'Name', 'Address',
+               'Date', 'Time', 'Weight', 'Volume', 'Ldm')
+STOP_SUMMARY_FIELDS = ('ID', 'Type', 'Sequence', 'Shipment_ID', 'Country', 'Postal_Code', 'City')
+
+@bp.route('/planning/stops/<type>/<id>')
 def planning_stops(type, id):
     if type == 'transport':
         transport = Transport.get_by_id(id)
         if transport:
-            # Return full transport overview data
-            transport_data = {
-                'Transport_ID': transport.Transport_ID,
-                'Department': transport.Department,
-                'Shipments': transport.Shipments,
-                'Pickup_date': str(transport.Pickup_date) if transport.Pickup_date else '',
-                'Delivery_date': str(transport.Delivery_date) if transport.Delivery_date else '',
-                'Weight': float(transport.Weight) if transport.Weight else 0,
-                'Volume': float(transport.Volume) if transport.Volume else 0,
-                'Ldm': float(transport.Ldm) if transport.Ldm else 0,
-                'Cost': float(transport.Cost) if transport.Cost else 0,
-                'Status': transport.Status,
-                'Vehicle': transport.Vehicle,
-                'Haulier': transport.Haulier,
-                'Driver': transport.Driver,
-                'Trailer': transport.Trailer
-            }
-            
-            # Get stops data
-            stops_data = []
-            if transport.Stops:
-                for stop in transport.Stops:
-                    stops_data.append({
-                        'ID': stop.ID,
-                        'Type': stop.Type,
-                        'Sequence': int(stop.Sequence) if stop.Sequence else 0,
-                        'Shipment_ID': stop.shipment.Shipment_ID if stop.shipment else '',
-                        'Country': stop.Country,
-                        'Postal_Code': int(stop.Postal_Code) if stop.Postal_Code else 0,
-                        'City': stop.City,
-                        'Name': stop.Name,
-                        'Address': stop.Address,
-                        'Date': str(stop.Date) if stop.Date else '',
-                        'Time': stop.Time,
-                        'Weight': float(stop.Weight) if stop.Weight else 0,
-                        'Volume': float(stop.Volume) if stop.Volume else 0,
-                        'Ldm': float(stop.Ldm) if stop.Ldm else 0
-                    })
+            # Return full transport overview data; NumPy and date values are encoded by the JSON provider
+            transport_data = serialization.records([transport], TRANSPORT_FIELDS)[0]
+            stops_data = serialization.records(transport.Stops, STOP_FIELDS)
             
             return jsonify({'transport': transport_data, 'stops': stops_data})
     return jsonify({'transport': None, 'stops': []})
 
-@app.route('/reorder_stops', methods=['POST'])
+def stop_order_violations(stop_ids):
+    """
+    Checks that every pickup stop comes before the delivery stop of the same shipment.
+
+    Returns:
+        list: Violation dicts, empty when the order is valid.
+    """
+    stops = [Stop.get_by_id(stop_id) for stop_id in stop_ids]
+    positions = {stop.key: idx for idx, stop in enumerate(stops) if stop is not None}
+    violations = []
+    for idx, stop in enumerate(stops):
+        if stop is None or stop.Type != 'D':
+            continue
+        pickup_key = keys.stop_key(stop.shipment.key, 'P')
+        if positions.get(pickup_key, -1) > idx:
+            violations.append(constraints.Violation(
+                'precedence', f"Delivery {stop.ID} comes before pickup {Stop.table.get(pickup_key).ID}"))
+    return violations
+
+def _stops_payload(transport):
+    return serialization.records(transport.Stops, STOP_SUMMARY_FIELDS)
+
+@bp.route('/reorder_stops', methods=['POST'])
 def reorder_stops():
     try:
         data = request.get_json()
@@ -1090,58 +2704,213 @@ def reorder_stops():
             return jsonify({'error': 'Transport not found'}), 404
         
         # Find the stop to move
-        stop_to_move = None
-        old_sequence = 0
-        for stop in transport.Stops:
-            if stop.ID == stop_id:
-                stop_to_move = stop
-                old_sequence = stop.Sequence
-                break
-        
-        if not stop_to_move:
+        stop_to_move = Stop.get_by_id(stop_id)
+        if not stop_to_move or stop_to_move not in transport.Stops:
             return jsonify({'error': 'Stop not found'}), 404
         
         # Validate new sequence
         if new_sequence < 1 or new_sequence > len(transport.Stops):
             return jsonify({'error': f'Invalid sequence number. Must be between 1 and {len(transport.Stops)}'}), 400
         
-        # Update sequence numbers without changing positions
-        if new_sequence != old_sequence:
-            # If moving up (increasing sequence number)
-            if new_sequence > old_sequence:
-                # All stops between old and new position shift down by 1
-                for stop in transport.Stops:
-                    if stop.Sequence > old_sequence and stop.Sequence <= new_sequence:
-                        stop.Sequence -= 1
-            # If moving down (decreasing sequence number)
-            else:
-                # All stops between new and old position shift up by 1
-                for stop in transport.Stops:
-                    if stop.Sequence >= new_sequence and stop.Sequence < old_sequence:
-                        stop.Sequence += 1
-            
-            # Set the new sequence for the moved stop
-            stop_to_move.Sequence = new_sequence
+        # Move the stop in the list itself, so Stops[0]/Stops[-1] and Sequence stay consistent
+        with department_locks.hold([transport.Department]):
+            if new_sequence != stop_to_move.Sequence:
+                stops_before = _stop_order(transport)
+                # The same rule as for a bulk reorder: a pickup stays before its delivery
+                order = [other for other in stops_before if other != stop_to_move.ID]
+                order.insert(new_sequence - 1, stop_to_move.ID)
+                violations = stop_order_violations(order)
+                if violations:
+                    return jsonify({'error': 'Pickups must come before their deliveries', 'violations': violations}), 400
+                transport.Stops.move(stop_to_move, new_sequence)
+                record_stop_order(transport, stops_before, f"Moved stop {stop_id} of {transport_id} to {new_sequence}")
         
         # Return updated stops data
-        stops_data = []
-        for stop in transport.Stops:
-            stops_data.append({
-                'ID': stop.ID,
-                'Type': stop.Type,
-                'Sequence': stop.Sequence,
-                'Shipment_ID': stop.shipment.Shipment_ID,
-                'Country': stop.Country,
-                'Postal_Code': stop.Postal_Code,
-                'City': stop.City
-            })
+        return jsonify({'message': 'Stop reordered successfully', 'stops': _stops_payload(transport),
+                        'late_stops': late_stop_ids(transport)})
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/reorder_stops/bulk', methods=['POST'])
+def reorder_stops_bulk():
+    """
+    Replaces the stop order of a transport. 'order' lists every stop ID of the transport
+    once; each pickup has to come before the delivery of the same shipment.
+    """
+    try:
+        data = request.get_json() or {}
+        transport_id = data.get('transport_id')
+        order = list(data.get('order') or [])
+        
+        transport = Transport.get_by_id(transport_id)
+        if not transport:
+            return jsonify({'error': 'Transport not found'}), 404
+        
+        if len(order) != len(transport.Stops) or set(order) != set(transport.Stops.ids()):
+            return jsonify({'error': 'Order must contain every stop of the transport exactly once'}), 400
+        
+        violations = stop_order_violations(order)
+        if violations:
+            return jsonify({'error': 'Pickups must come before their deliveries', 'violations': violations}), 400
+        
+        with department_locks.hold([transport.Department]):
+            stops_before = _stop_order(transport)
+            if order != stops_before:
+                transport.Stops.reorder(order)
+                record_stop_order(transport, stops_before, f"Reordered {len(order)} stops of {transport_id}")
         
-        return jsonify({'message': 'Stop reordered successfully', 'stops': stops_data})
+        return jsonify({'message': 'Stops reordered successfully', 'stops': _stops_payload(transport),
+                        'late_stops': late_stop_ids(transport)})
     
     except Exception as e:
+        logger.exception("Error in reorder_stops_bulk: %s", e)
         return jsonify({'error': str(e)}), 500
 
-@app.route('/update_truck_time', methods=['POST'])
+# Stop ETAs: drive times between the approximate stop locations at an average speed, plus a
+# service time per stop. The last timeline of every transport is kept, so a change only
+# recomputes the stops from the first changed one onwards (see eta.propagate).
+ETA_MODEL = eta.EtaModel(
+    speed_kmh=float(os.environ.get('MOBILITY_ETA_SPEED_KMH', '70') or 70),
+    service_minutes=float(os.environ.get('MOBILITY_ETA_SERVICE_MINUTES', '30') or 30),
+)
+ETA_STOPS = metrics.registry.counter(
+    'mobility_eta_stops_total', 'Stops passed through the ETA engine, recomputed or reused from the last timeline.',
+    ('result',))
+# Transport_ID -> last eta.Timeline
+timelines = {}
+
+def forget_timeline(transport_id, transport):
+    if transport is None:
+        timelines.pop(transport_id, None)
+
+Transport.registry.subscribe(forget_timeline)
+
+def _truck_point(location_raw):
+    """
+    Approximate point of a truck Location: "City, PostalCode, CountryCode" or "DK-9300".
+    """
+    if not isinstance(location_raw, str):
+        return None
+    parts = [p.strip() for p in location_raw.split(',')]
+    if len(parts) == 3:
+        return geo.locate(parts[2], parts[1])
+    parts = location_raw.split('-')
+    if len(parts) == 2:
+        return geo.locate(parts[0].strip(), parts[1].strip())
+    return None
+
+def _truck_location(stop):
+    """
+    Truck Location at a stop, in the form _truck_point() reads: "City, PostalCode, CountryCode",
+    or "CountryCode-PostalCode" when the stop has no usable city.
+    """
+    country = str(stop.Country).strip().upper()
+    # Postal codes are loaded as integers, 0 when missing; restore the leading zeros
+    postal = geo.postal_text(country, stop.Postal_Code or None)
+    city = '' if _is_unassigned(stop.City) else str(stop.City).strip()
+    if city and ',' not in city:
+        return f"{city}, {postal}, {country}"
+    return f"{country}-{postal}"
+
+def _truck_datetime(date, time_text):
+    try:
+        day = _as_date(date)
+        hours, minutes = str(time_text).split('-')[0].strip().split(':')
+        return datetime.datetime.combine(day, datetime.time(int(hours), int(minutes)))
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+def truck_starts(trucks_df):
+    """
+    Returns License_plate -> (point, datetime) the truck is available from, for a set of truck rows.
+    """
+    return {plate: (_truck_point(location), _truck_datetime(date, time_text))
+            for plate, location, date, time_text in zip(trucks_df['License_plate'], trucks_df['Location'],
+                                                        trucks_df['Date'], trucks_df['Time'])}
+
+def _stop_bounds(stop):
+    """
+    Returns the (earliest, latest) datetimes of a stop's time window, (None, None) when its date is unknown.
+    """
+    try:
+        window = _stop_window(stop.Date, stop.Time)
+        if window is None:
+            return None, None
+        (day, start), (_, end) = window
+        midnight = datetime.datetime.combine(day, datetime.time())
+    except (ValueError, TypeError):
+        return None, None
+    return midnight + datetime.timedelta(minutes=start), midnight + datetime.timedelta(minutes=end)
+
+def transport_timeline(transport, start=None):
+    """
+    Computes the stop ETAs of a transport, from its truck's location and Date/Time when it has one.
+
+    Args:
+        start (tuple, optional): (point, datetime) to start from instead of the truck's.
+    """
+    if start is None:
+        start = (None, None)
+        if transport.Vehicle:
+            start = truck_starts(datasets.trucks[datasets.trucks['License_plate'] == transport.Vehicle]).get(
+                transport.Vehicle, start)
+    stops = [(stop.ID, _stop_location(stop), *_stop_bounds(stop)) for stop in transport.Stops]
+    timeline = eta.propagate(ETA_MODEL, start, stops, timelines.get(transport.Transport_ID))
+    timelines[transport.Transport_ID] = timeline
+    ETA_STOPS.inc('reused', amount=timeline.reused)
+    ETA_STOPS.inc('computed', amount=len(stops) - timeline.reused)
+    return timeline
+
+def late_stop_ids(transport):
+    return [stop['id'] for stop in transport_timeline(transport).late_stops]
+
+def _timeline_payload(transport, timeline):
+    stops = []
+    for entry in timeline.stops:
+        stop = Stop.get_by_id(entry['id'])
+        stops.append({**entry, 'type': stop.Type if stop else None, 'city': stop.City if stop else None,
+                      'window': stop.Time if stop else None})
+    return {'transport_id': transport.Transport_ID, 'vehicle': transport.Vehicle, 'status': transport.Status,
+            **timeline.summary(), 'stops': stops}
+
+@bp.route('/timeline/transport/<transport_id>')
+def transport_timeline_endpoint(transport_id):
+    """
+    Arrival, waiting time, departure and lateness of every stop of a transport.
+    """
+    transport = Transport.get_by_id(transport_id)
+    if not transport:
+        return jsonify({'error': 'Transport not found'}), 404
+    return jsonify(_timeline_payload(transport, transport_timeline(transport)))
+
+@bp.route('/timeline/department/<department>')
+def department_timeline(department):
+    """
+    Stop ETAs of a department's Planning transports, for the planning board.
+
+    Query parameters: start_date/date_range_days as in /planning (default today only), and
+    late_only=1 to return only transports with a stop that misses its window.
+    """
+    window = date_window(request.args.get('date_range_days', '0').strip(), request.args.get('start_date', '').strip())
+    late_only = request.args.get('late_only', '').lower() in ('1', 'true')
+    with track_stage('filter'):
+        transports = [t for t in department_transports(department, window) if t.Status == 'Planning']
+    with track_stage('eta'):
+        # Truck starts of the whole department in one pass over its rows
+        starts = truck_starts(datasets.shard('trucks', department))
+        rows = []
+        late_stops = 0
+        for transport in transports:
+            timeline = transport_timeline(transport, starts.get(transport.Vehicle, (None, None)))
+            late_stops += len(timeline.late_stops)
+            if late_only and not timeline.late_stops:
+                continue
+            rows.append(_timeline_payload(transport, timeline))
+    return json_body({'department': department, 'transports': rows, 'checked': len(transports),
+                      'late_stops': late_stops})
+
+@bp.route('/update_truck_time', methods=['POST'])
 def update_truck_time():
     try:
         data = request.json
@@ -1152,22 +2921,22 @@ def update_truck_time():
             return jsonify({'success': False, 'error': 'License plate required'}), 400
         
         # Update in the DataFrame
-        global trucks_df
-        mask = trucks_df['License_plate'] == license_plate
-        if not mask.any():
-            return jsonify({'success': False, 'error': 'Truck not found'}), 404
-        
-        trucks_df.loc[mask, 'Time'] = new_time
+        with datasets.writing('trucks') as trucks:
+            mask = trucks['License_plate'] == license_plate
+            if not mask.any():
+                return jsonify({'success': False, 'error': 'Truck not found'}), 404
+
+            trucks.loc[mask, 'Time'] = new_time
         
-        # Save to CSV
-        trucks_df.to_csv('Backend_Mobility/df_trucks.csv', index=False)
+        # Queue df_trucks.csv for the background writer
+        persister.mark_dirty('trucks')
         
         return jsonify({'success': True})
     
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
-@app.route('/update_transport_time', methods=['POST'])
+@bp.route('/update_transport_time', methods=['POST'])
 def update_transport_time():
     try:
         data = request.json
@@ -1186,12 +2955,40 @@ def update_transport_time():
         if transport.Stops and len(transport.Stops) > 0:
             transport.Stops[0].Time = new_time
         
-        return jsonify({'success': True})
+        return jsonify({'success': True, 'late_stops': late_stop_ids(transport)})
     
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
-@app.route('/assign_transport', methods=['POST'])
+def assign_truck(transport, truck_mask, description=None):
+    """
+    Puts a transport on the truck selected by `truck_mask` and records the assignment for undo.
+    The caller checks that the transport has no vehicle yet and that the truck exists.
+    """
+    transport_id = transport.Transport_ID
+    truck_row = datasets.trucks[truck_mask].iloc[0]
+    truck_id = truck_row['License_plate']
+    before = _assignment_state(transport_id, [truck_id])
+    
+    # Update Transport object (convert pandas types to Python native types)
+    transport.Vehicle = str(truck_row['License_plate']) if pd.notna(truck_row['License_plate']) else ""
+    transport.Driver = str(truck_row['Driver']) if pd.notna(truck_row['Driver']) else ""
+    if transport.Trailer == "":
+        transport.Trailer = str(truck_row['Trailer']) if pd.notna(truck_row['Trailer']) else ""
+    transport.Haulier = str(truck_row['Haulier']) if pd.notna(truck_row['Haulier']) else ""
+    
+    # Update Truck in DataFrame
+    with datasets.writing('trucks') as trucks:
+        trucks.loc[truck_mask, 'Transport'] = transport_id
+        if transport.Trailer != "":
+            trucks.loc[truck_mask, 'Trailer'] = transport.Trailer
+    
+    # Queue df_trucks.csv for the background writer
+    persister.mark_dirty('trucks')
+    record_assignment('assign_transport', description or f"Assigned {transport_id} to truck {truck_id}",
+                      transport_id, [truck_id], before)
+
+@bp.route('/assign_transport', methods=['POST'])
 def assign_transport():
     try:
         data = request.json
@@ -1211,34 +3008,19 @@ def assign_transport():
             return jsonify({'success': False, 'error': 'Transport already has a vehicle assigned'}), 400
         
         # Get truck from DataFrame
-        global trucks_df
-        truck_mask = trucks_df['License_plate'] == truck_id
+        truck_mask = datasets.trucks['License_plate'] == truck_id
         if not truck_mask.any():
             return jsonify({'success': False, 'error': 'Truck not found'}), 404
         
-        truck_row = trucks_df[truck_mask].iloc[0]
-        
-        # Update Transport object (convert pandas types to Python native types)
-        transport.Vehicle = str(truck_row['License_plate']) if pd.notna(truck_row['License_plate']) else ""
-        transport.Driver = str(truck_row['Driver']) if pd.notna(truck_row['Driver']) else ""
-        if transport.Trailer == "":
-            transport.Trailer = str(truck_row['Trailer']) if pd.notna(truck_row['Trailer']) else ""
-        transport.Haulier = str(truck_row['Haulier']) if pd.notna(truck_row['Haulier']) else ""
-        
-        # Update Truck in DataFrame
-        trucks_df.loc[truck_mask, 'Transport'] = transport.Transport_ID
-        if transport.Trailer != "":
-            trucks_df.loc[truck_mask, 'Trailer'] = transport.Trailer
-        
-        # Save to CSV
-        trucks_df.to_csv('Backend_Mobility/df_trucks.csv', index=False)
+        assign_truck(transport, truck_mask)
         
-        return jsonify({'success': True})
+        return jsonify({'success': True, 'violations': transport_violations(transport),
+                        'late_stops': late_stop_ids(transport)})
     
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
-@app.route('/unassign_transport', methods=['POST'])
+@bp.route('/unassign_transport', methods=['POST'])
 def unassign_transport():
     try:
         data = request.json
@@ -1257,6 +3039,7 @@ def unassign_transport():
             return jsonify({'success': False, 'error': 'Transport does not have a vehicle assigned'}), 400
         
         truck_license = transport.Vehicle
+        before = _assignment_state(transport_id, [truck_license])
         
         # Update Transport object
         transport.Vehicle = ""
@@ -1265,21 +3048,23 @@ def unassign_transport():
         transport.Trailer = ""
         
         # Update Truck in DataFrame
-        global trucks_df
-        truck_mask = trucks_df['License_plate'] == truck_license
+        with datasets.writing('trucks') as trucks:
+            truck_mask = trucks['License_plate'] == truck_license
+            if truck_mask.any():
+                trucks.loc[truck_mask, 'Transport'] = ""
+                # Truck trailer is not changed as per the function specification
         if truck_mask.any():
-            trucks_df.loc[truck_mask, 'Transport'] = ""
-            # Truck trailer is not changed as per the function specification
-            
-            # Save to CSV
-            trucks_df.to_csv('Backend_Mobility/df_trucks.csv', index=False)
+            # Queue df_trucks.csv for the background writer
+            persister.mark_dirty('trucks')
+        record_assignment('unassign_transport', f"Unassigned {transport_id} from truck {truck_license}",
+                          transport_id, [truck_license], before)
         
         return jsonify({'success': True})
     
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
-@app.route('/transfer_truck', methods=['POST'])
+@bp.route('/transfer_truck', methods=['POST'])
 def transfer_truck():
     try:
         data = request.json
@@ -1290,7 +3075,7 @@ def transfer_truck():
         if not transport_id:
             return jsonify({'success': False, 'error': 'Transport ID required'}), 400
         
-        if not date or not time:
+        if bool(date) != bool(time):
             return jsonify({'success': False, 'error': 'Date and time are required'}), 400
         
         # Get the transport object
@@ -1302,40 +3087,223 @@ def transfer_truck():
         if transport.Vehicle == "":
             return jsonify({'success': False, 'error': 'No Truck assigned to transport'}), 400
         
+        # Without a date and time the truck is available when it leaves the last stop (ETA)
+        if not date:
+            available = transport_timeline(transport).end
+            if available is None:
+                return jsonify({'success': False, 'error': 'Date and time are required'}), 400
+            date, time = available.date().isoformat(), available.strftime('%H:%M')
+        
         current_license_plate = transport.Vehicle
+        last_stop = transport.Stops[-1] if transport.Stops else None
         
         # Update transport status to "Handled"
         transport.Status = 'Handled'
+        Transport.registry.notify(transport_id)
         
         # Update the truck - save current transport to Last_transport before clearing
-        global trucks_df
-        truck_mask = trucks_df['License_plate'] == current_license_plate
-        if truck_mask.any():
-            # Save current Transport to Last_transport before clearing
-            current_transport = trucks_df.loc[truck_mask, 'Transport'].values[0]
-            if 'Last_transport' not in trucks_df.columns:
-                trucks_df['Last_transport'] = ''
-            trucks_df.loc[truck_mask, 'Last_transport'] = current_transport
-            trucks_df.loc[truck_mask, 'Transport'] = ""
-            trucks_df.loc[truck_mask, 'Date'] = date
-            trucks_df.loc[truck_mask, 'Time'] = time
+        with datasets.writing('trucks') as trucks:
+            truck_mask = trucks['License_plate'] == current_license_plate
+            if truck_mask.any():
+                # Save current Transport to Last_transport before clearing
+                current_transport = trucks.loc[truck_mask, 'Transport'].values[0]
+                if 'Last_transport' not in trucks.columns:
+                    trucks['Last_transport'] = ''
+                trucks.loc[truck_mask, 'Last_transport'] = current_transport
+                trucks.loc[truck_mask, 'Transport'] = ""
+                trucks.loc[truck_mask, 'Date'] = date
+                trucks.loc[truck_mask, 'Time'] = time
+                # The truck continues from the last delivery of the transport
+                if last_stop is not None and not _is_unassigned(last_stop.Country):
+                    trucks.loc[truck_mask, 'Location'] = _truck_location(last_stop)
         
-        # Save to CSV
-        trucks_df.to_csv('Backend_Mobility/df_trucks.csv', index=False)
+        # Queue df_trucks.csv for the background writer
+        persister.mark_dirty('trucks')
         
         return jsonify({'success': True, 'message': f'Transport executed successfully. Truck {current_license_plate} updated to {date} {time}'})
     
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
-@app.route('/update_trailer', methods=['POST'])
+def rotation_plan(department, window):
+    """
+    Chains the department's Planning transports in the date window onto its trucks (see rotation.py).
+    Trucks start from their Location at their Date/Time, or after the transport they are running.
+    """
+    trucks = [{'id': plate, 'point': point, 'available': available}
+              for plate, (point, available) in truck_starts(datasets.shard('trucks', department)).items()]
+    transports = [{'id': transport.Transport_ID, 'truck': transport.Vehicle or None,
+                   'stops': [(stop.ID, _stop_location(stop), *_stop_bounds(stop)) for stop in transport.Stops]}
+                  for transport in department_transports(department, window)
+                  if transport.Status == 'Planning' and transport.has_shipments()]
+    return rotation.plan(ETA_MODEL, trucks, transports)
+
+@bp.route('/rotation/<department>', methods=['GET', 'POST'])
+def rotation_endpoint(department):
+    """
+    Truck rotations of a department over several days: GET returns the plan and a truck-by-day
+    calendar; POST also assigns every idle truck the first transport of its rotation.
+
+    Parameters (query string or JSON body): start_date and date_range_days as in /planning,
+    default a week from today.
+    """
+    if not department or department == 'ALL':
+        return jsonify({'error': 'A department is required'}), 400
+    params = request.args if request.method == 'GET' else (request.get_json(silent=True) or {})
+    window = date_window(str(params.get('date_range_days', '6')).strip(), str(params.get('start_date') or '').strip())
+    if window is None:
+        return jsonify({'error': 'Invalid start_date or date_range_days'}), 400
+    applied = []
+    # The plan is made and applied on one consistent view of the department
+    with department_locks.hold([department]):
+        with track_stage('plan'):
+            result = rotation_plan(department, window)
+        if request.method == 'POST':
+            idle = set(datasets.trucks.loc[datasets.trucks['Transport'].isna() | (datasets.trucks['Transport'] == ''),
+                                           'License_plate'])
+            for truck_id, legs in result['rotations'].items():
+                # Fixed legs come first, so an idle truck's rotation starts with a transport to assign
+                if truck_id not in idle or not legs or legs[0]['fixed']:
+                    continue
+                transport = Transport.get_by_id(legs[0]['transport_id'])
+                if transport is None or transport.Vehicle:
+                    continue
+                assign_truck(transport, datasets.trucks['License_plate'] == truck_id,
+                             f"Assigned {transport.Transport_ID} to truck {truck_id} (rotation)")
+                applied.append({'transport_id': transport.Transport_ID, 'truck': truck_id})
+    return json_body({
+        'department': department,
+        'start_date': window[0].isoformat(),
+        'end_date': window[1].isoformat(),
+        'rotations': result['rotations'],
+        'calendar': rotation.calendar(result['rotations']),
+        'unscheduled': result['unscheduled'],
+        'trucks': result['trucks'],
+        'applied': applied,
+    })
+
+# Handled transports delivered more than this many days ago are moved to the archive
+ARCHIVE_AFTER_DAYS = int(os.environ.get('MOBILITY_ARCHIVE_AFTER_DAYS', '7'))
+# Seconds between two archive runs of the background thread; 0 turns it off
+ARCHIVE_INTERVAL = float(os.environ.get('MOBILITY_ARCHIVE_INTERVAL', '3600'))
+# Transport attributes kept in the archive, besides the stop order
+ARCHIVE_TRANSPORT_FIELDS = ('Transport_ID', 'Department', 'Shipments', 'Pickup_date', 'Delivery_date', 'Weight',
+                            'Volume', 'Ldm', 'Cost', 'Status', 'Vehicle', 'Haulier', 'Driver', 'Trailer',
+                            'Haulier_cost', 'Sale', 'Sale_cost', 'Sheet')
+ARCHIVED_TRANSPORTS = metrics.registry.counter(
+    'mobility_archived_transports_total', 'Handled transports moved to the archive.')
+metrics.registry.gauge('mobility_live_transports', 'Transports in the live registry.',
+                       callback=lambda: len(Transport.registry))
+
+def archive_handled_transports(horizon_days=None, today=None):
+    """
+    Moves handled transports delivered more than `horizon_days` ago, with their shipments and
+    stops, from the live registries and the shipments table to the archive.
+
+    Args:
+        horizon_days (int, optional): Defaults to MOBILITY_ARCHIVE_AFTER_DAYS.
+        today (date, optional): Reference date, default today.
+
+    Returns:
+        dict: Numbers of archived transports and shipments.
+    """
+    horizon_days = ARCHIVE_AFTER_DAYS if horizon_days is None else horizon_days
+    cutoff = (today or datetime.date.today()) - datetime.timedelta(days=horizon_days)
+
+    def due(transport):
+        try:
+            return transport.Status == 'Handled' and _as_date(transport.Delivery_date) <= cutoff
+        except (ValueError, TypeError):
+            return False
+
+    if not any(due(transport) for transport in list(Transport.registry.values())):
+        return {'transports': 0, 'shipments': 0}
+    # The shipments table is replaced as a whole, so no department may be changing it meanwhile
+    with department_locks.hold(_all_departments()), datasets.writing('shipments') as frame:
+        transports = [transport for transport in Transport.registry.values() if due(transport)]
+        shipment_objs = [obj for transport in transports
+                         for obj in map(Shipment.get_by_id, transport.Shipments) if obj is not None]
+        mask = frame['Shipment_ID'].isin([obj.Shipment_ID for obj in shipment_objs])
+        shipment_records = frame[mask].to_dict('records')
+        for record in shipment_records:
+            record['Transport_ID'] = Shipment.get_by_id(record['Shipment_ID']).Transport
+        transport_records = [dict(serialization.records([transport], ARCHIVE_TRANSPORT_FIELDS)[0],
+                                  Stops=transport.Stops.ids()) for transport in transports]
+        transport_archive.store(transport_records, shipment_records)
+
+        for transport in transports:
+            del Transport.registry[transport.Transport_ID]
+        for shipment_obj in shipment_objs:
+            del Shipment.registry[shipment_obj.Shipment_ID]
+            for stop in shipment_obj.stops:
+                Stop.registry.pop(stop.ID, None)
+                Stop.table.unbind(stop.key)
+        datasets.replace('shipments', frame[~mask].reset_index(drop=True))
+
+    ARCHIVED_TRANSPORTS.inc(amount=len(transports))
+    logger.info("Archived handled transports", extra={'transports': len(transports),
+                                                       'shipments': len(shipment_objs), 'cutoff': str(cutoff)})
+    return {'transports': len(transports), 'shipments': len(shipment_objs)}
+
+# The archiving thread of this process; it serves every app, since they share the module state
+_archiver = None
+
+def _archive_periodically():
+    while True:
+        datasets.ready.wait()
+        try:
+            archive_handled_transports()
+        except Exception:
+            logger.exception("Archiving handled transports failed")
+        time.sleep(ARCHIVE_INTERVAL)
+
+@bp.route('/admin/archive', methods=['GET', 'POST'])
+def archive_admin():
+    """
+    GET: size of the archive. POST: archives due transports now; 'horizon_days' overrides the horizon.
+    """
+    if not _admin_authorized():
+        return jsonify({'error': 'Admin token required'}), 403
+    if request.method == 'GET':
+        return jsonify({'archive': transport_archive.stats(), 'live_transports': len(Transport.registry),
+                        'horizon_days': ARCHIVE_AFTER_DAYS})
+    data = request.get_json(silent=True) or {}
+    try:
+        horizon_days = int(data['horizon_days']) if data.get('horizon_days') is not None else None
+    except (TypeError, ValueError):
+        return jsonify({'error': 'horizon_days must be an integer'}), 400
+    return jsonify({'archived': archive_handled_transports(horizon_days), 'archive': transport_archive.stats()})
+
+@bp.route('/archive/transports')
+def archived_transports():
+    """
+    Archived transports, newest delivery first; filtered by department and delivery date range.
+    """
+    try:
+        limit = min(int(request.args.get('limit', 100)), 1000)
+        offset = int(request.args.get('offset', 0))
+    except ValueError:
+        return jsonify({'error': 'limit and offset must be integers'}), 400
+    transports, total = transport_archive.transports(
+        request.args.get('department'), request.args.get('start_date'), request.args.get('end_date'),
+        limit, offset)
+    return jsonify({'transports': transports, 'total': total, 'limit': limit, 'offset': offset})
+
+@bp.route('/archive/transports/<transport_id>')
+def archived_transport(transport_id):
+    transport = transport_archive.transport(transport_id)
+    if transport is None:
+        return jsonify({'error': 'Transport not found in the archive'}), 404
+    return jsonify({'transport': transport})
+
+@bp.route('/update_trailer', methods=['POST'])
 def update_trailer():
-    global trucks_df
     try:
         data = request.json
         item_type = data.get('type')  # 'Transport' or 'Truck'
         item_id = data.get('id')
         new_trailer = data.get('trailer', '')
+        transport = None
         
         if not item_type or not item_id:
             return jsonify({'success': False, 'error': 'Type and ID required'}), 400
@@ -1345,42 +3313,52 @@ def update_trailer():
             transport = Transport.get_by_id(item_id)
             if not transport:
                 return jsonify({'success': False, 'error': 'Transport not found'}), 404
+            assignment = (transport.Transport_ID, [transport.Vehicle])
+            before = _assignment_state(*assignment)
             
             transport.Trailer = new_trailer
             
             # If transport has a vehicle assigned, update the truck's trailer too
             if transport.Vehicle:
-                truck_mask = trucks_df['License_plate'] == transport.Vehicle
+                with datasets.writing('trucks') as trucks:
+                    truck_mask = trucks['License_plate'] == transport.Vehicle
+                    if truck_mask.any():
+                        trucks.loc[truck_mask, 'Trailer'] = new_trailer
                 if truck_mask.any():
-                    trucks_df.loc[truck_mask, 'Trailer'] = new_trailer
-                    trucks_df.to_csv('Backend_Mobility/df_trucks.csv', index=False)
+                    persister.mark_dirty('trucks')
             
         elif item_type == 'Truck':
             # Update Truck in DataFrame
-            mask = trucks_df['License_plate'] == item_id
+            mask = datasets.trucks['License_plate'] == item_id
             if not mask.any():
                 return jsonify({'success': False, 'error': 'Truck not found'}), 404
+            linked = _truck_record(item_id)['Transport']
+            assignment = (linked if Transport.get_by_id(linked) else None, [item_id])
+            before = _assignment_state(*assignment)
             
-            trucks_df.loc[mask, 'Trailer'] = new_trailer
+            with datasets.writing('trucks') as trucks:
+                trucks.loc[mask, 'Trailer'] = new_trailer
+                truck_row = trucks[mask].iloc[0]
             
             # If truck has a transport assigned, update the transport's trailer too
-            truck_row = trucks_df[mask].iloc[0]
             if pd.notna(truck_row['Transport']) and truck_row['Transport'] != '':
                 transport = Transport.get_by_id(truck_row['Transport'])
                 if transport:
                     transport.Trailer = new_trailer
             
-            # Save to CSV
-            trucks_df.to_csv('Backend_Mobility/df_trucks.csv', index=False)
+            # Queue df_trucks.csv for the background writer
+            persister.mark_dirty('trucks')
         else:
             return jsonify({'success': False, 'error': 'Invalid type'}), 400
+        record_assignment('update_trailer', f"Set trailer of {item_type} {item_id} to {new_trailer or 'none'}",
+                          *assignment, before)
         
-        return jsonify({'success': True})
+        return jsonify({'success': True, 'violations': transport_violations(transport) if transport else []})
     
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
-@app.route('/search_trailers', methods=['POST'])
+@bp.route('/search_trailers', methods=['POST'])
 def search_trailers():
     try:
         data = request.json
@@ -1394,20 +3372,13 @@ def search_trailers():
         # Get available trailers based on department filter and open_pool checkbox
         if open_pool_filter:
             # When checked: show all trailers with Open_pool == True (ignore department)
-            available_trailers = trailers_df[
-                trailers_df['Open_pool'] == True
+            available_trailers = datasets.trailers[
+                datasets.trailers['Open_pool'] == True
             ]
         else:
             # When unchecked: show trailers from filtered department with Open_pool == False
-            if department and department != 'ALL':
-                available_trailers = trailers_df[
-                    (trailers_df['Department'] == department) & 
-                    (trailers_df['Open_pool'] == False)
-                ]
-            else:
-                available_trailers = trailers_df[
-                    trailers_df['Open_pool'] == False
-                ]
+            department_trailers = datasets.shard('trailers', department)
+            available_trailers = department_trailers[department_trailers['Open_pool'] == False]
         
         # Search for matching trailers
         matches = available_trailers[
@@ -1419,5 +3390,481 @@ def search_trailers():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+# What-if sandboxes: planning changes on copy-on-write overlays, committed or dropped as a whole
+sandboxes = SandboxStore(
+    capacity=int(os.environ.get('MOBILITY_SANDBOX_CAPACITY', '100') or 100),
+    ttl=float(os.environ.get('MOBILITY_SANDBOX_TTL', '3600') or 3600),
+)
+metrics.registry.gauge('mobility_sandboxes_open', 'Open what-if planning sandboxes.',
+                       callback=lambda: len(sandboxes))
+
+def _is_unassigned(value):
+    return value is None or value != value or value == ''  # None, NaN or empty
+
+def _text(value):
+    return '' if value is None or value != value else str(value)
+
+def _shipment_record(shipment_id):
+    shipment_obj = Shipment.get_by_id(shipment_id)
+    if not shipment_obj:
+        return None
+    return {
+        'Transport': None if _is_unassigned(shipment_obj.Transport) else shipment_obj.Transport,
+        'Department': shipment_obj.Department,
+    }
+
+def _transport_record(transport_id):
+    transport = Transport.get_by_id(transport_id)
+    if not transport:
+        return None
+    return {
+        'Shipments': dict.fromkeys(transport.Shipments),
+        'Department': transport.Department,
+        'Status': transport.Status,
+        'Weight': transport.Weight,
+        'Volume': transport.Volume,
+        'Ldm': transport.Ldm,
+        'Cost': transport.Cost,
+        'Vehicle': transport.Vehicle,
+        'Driver': transport.Driver,
+        'Haulier': transport.Haulier,
+        'Trailer': transport.Trailer,
+    }
+
+def _truck_record(license_plate):
+    truck_mask = datasets.trucks['License_plate'] == license_plate
+    if not truck_mask.any():
+        return None
+    truck_row = datasets.trucks[truck_mask].iloc[0]
+    return {field: _text(truck_row[field]) for field in ('Transport', 'Trailer', 'Driver', 'Haulier')}
+
+def _kpi_contribution(scope):
+    """
+    Returns contribution(table, record) giving the KPI amounts of one record within a department.
+    """
+    def in_scope(record):
+        return scope == 'ALL' or record['Department'] == scope
+
+    def contribution(table, record):
+        if record is None or table == 'trucks' or not in_scope(record):
+            return {}
+        if table == 'shipments':
+            return {'unplanned_shipments': 1 if _is_unassigned(record['Transport']) else 0}
+        if record['Status'] == 'Planning':
+            trailer_type, sub_type = trailer_spec(record['Trailer'])
+            return {
+                'transports': 1,
+                'total_cost': float(record['Cost']),
+                'total_ldm': float(record['Ldm']),
+                'ldm_capacity': constraints.engine.capacity('max_ldm', trailer_type, sub_type),
+            }
+        return {}
+    return contribution
+
+def open_sandbox(session_id, owner, scope):
+    contribution = _kpi_contribution(scope)
+    # KPI totals of the live state, computed once; afterwards only changed records are re-counted
+    totals = {'transports': 0, 'total_cost': 0.0, 'total_ldm': 0.0, 'ldm_capacity': 0.0}
+    for transport in department_transports(scope):
+        for key, value in contribution('transports', _transport_record(transport.Transport_ID)).items():
+            totals[key] += value
+    in_scope = datasets.shard('shipments', scope)
+    totals['unplanned_shipments'] = int((in_scope['Transport'].isnull() | (in_scope['Transport'] == '')).sum())
+    return Sandbox(session_id, owner, scope,
+                   {'shipments': _shipment_record, 'transports': _transport_record, 'trucks': _truck_record},
+                   contribution, totals)
+
+def sandbox_kpis(sandbox):
+    totals = sandbox.kpis.totals
+    capacity = totals['ldm_capacity']
+    return {
+        'transports': totals['transports'],
+        'unplanned_shipments': totals['unplanned_shipments'],
+        'total_cost': round(totals['total_cost'], 2),
+        'total_ldm': round(totals['total_ldm'], 2),
+        'ldm_utilization': round(totals['total_ldm'] / capacity, 4) if capacity else 0.0,
+    }
+
+def _sandbox_transport_view(sandbox, transport_id):
+    record = sandbox.tables['transports'].get(transport_id)
+    shipment_objs = [s for s in map(Shipment.get_by_id, record['Shipments']) if s]
+    return {
+        'transport_id': transport_id,
+        'provisional': sandbox.is_provisional(transport_id),
+        'shipments': list(record['Shipments']),
+        'Weight': record['Weight'],
+        'Volume': record['Volume'],
+        'Ldm': record['Ldm'],
+        'Cost': record['Cost'],
+        'Vehicle': record['Vehicle'],
+        'Trailer': record['Trailer'],
+        'violations': validate_shipments(shipment_objs, record['Trailer']),
+    }
+
+def _sandbox_move(sandbox, shipment_ids, transport_id):
+    """
+    Moves shipments onto a transport of the sandbox (None to unassign them), updating the
+    running totals of the source and target transports.
+    """
+    shipments = sandbox.tables['shipments']
+    transports = sandbox.tables['transports']
+    edited = {}
+
+    def edit(tid):
+        if tid not in edited:
+            edited[tid] = transports.copy(tid)
+        return edited[tid]
+
+    moved = []
+    for shipment_id in shipment_ids:
+        shipment_obj = Shipment.get_by_id(shipment_id)
+        record = shipments.copy(shipment_id)
+        if not shipment_obj or record is None:
+            raise ValueError(f"Shipment '{shipment_id}' not found.")
+        if record['Transport'] == transport_id:
+            continue
+        for tid, sign in ((record['Transport'], -1), (transport_id, 1)):
+            if tid is None:
+                continue
+            transport_record = edit(tid)
+            if sign > 0:
+                transport_record['Shipments'][shipment_id] = None
+            else:
+                transport_record['Shipments'].pop(shipment_id, None)
+            for field in ('Weight', 'Volume', 'Ldm', 'Cost'):
+                transport_record[field] += sign * getattr(shipment_obj, field)
+        record['Transport'] = transport_id
+        shipments.put(shipment_id, record)
+        moved.append(shipment_id)
+    for tid, transport_record in edited.items():
+        transports.put(tid, transport_record)
+    return moved
+
+def _sandbox_create_transport(sandbox, data):
+    shipment_ids = list(data.get('shipments', []))
+    if not shipment_ids:
+        raise ValueError("No shipments selected.")
+    records = [sandbox.tables['shipments'].get(sid) for sid in shipment_ids]
+    for shipment_id, record in zip(shipment_ids, records):
+        if record is None:
+            raise ValueError(f"Shipment '{shipment_id}' not found.")
+        if not _is_unassigned(record['Transport']):
+            raise ValueError("Can't create transport due to a selected shipment already being tied to a transport")
+    transport_id = sandbox.provisional_id()
+    sandbox.tables['transports'].put(transport_id, {
+        'Shipments': {}, 'Department': records[0]['Department'], 'Status': 'Planning',
+        'Weight': 0, 'Volume': 0, 'Ldm': 0, 'Cost': 0,
+        'Vehicle': '', 'Driver': '', 'Haulier': '', 'Trailer': '',
+    })
+    _sandbox_move(sandbox, shipment_ids, transport_id)
+    return transport_id
+
+def _sandbox_add_shipment(sandbox, data):
+    transport_id = data.get('transport')
+    if sandbox.tables['transports'].get(transport_id) is None:
+        raise LookupError('Transport not found')
+    available = [sid for sid in data.get('shipments', [])
+                 if (sandbox.tables['shipments'].get(sid) or {}).get('Transport') is None]
+    _sandbox_move(sandbox, available, transport_id)
+    return transport_id
+
+def _sandbox_remove_shipment(sandbox, data):
+    shipment_ids = list(data.get('shipments', []))
+    if not shipment_ids:
+        raise ValueError("No shipment IDs provided.")
+    transport_ids = {(sandbox.tables['shipments'].get(sid) or {}).get('Transport') for sid in shipment_ids}
+    if None in transport_ids:
+        raise ValueError("All shipments must be assigned to a transport.")
+    if len(transport_ids) > 1:
+        raise ValueError("All shipments must be assigned to the same transport.")
+    _sandbox_move(sandbox, shipment_ids, None)
+    return transport_ids.pop()
+
+def _sandbox_assign_transport(sandbox, data):
+    transport_id = data.get('transport_id')
+    truck_id = data.get('truck_id')
+    transport_record = sandbox.tables['transports'].copy(transport_id)
+    truck_record = sandbox.tables['trucks'].copy(truck_id)
+    if transport_record is None:
+        raise LookupError('Transport not found')
+    if truck_record is None:
+        raise LookupError('Truck not found')
+    if transport_record['Vehicle'] != '':
+        raise ValueError('Transport already has a vehicle assigned')
+    transport_record['Vehicle'] = truck_id
+    transport_record['Driver'] = truck_record['Driver']
+    transport_record['Haulier'] = truck_record['Haulier']
+    if transport_record['Trailer'] == '':
+        transport_record['Trailer'] = truck_record['Trailer']
+    truck_record['Transport'] = transport_id
+    truck_record['Trailer'] = transport_record['Trailer']
+    sandbox.tables['transports'].put(transport_id, transport_record)
+    sandbox.tables['trucks'].put(truck_id, truck_record)
+    return transport_id
+
+def _sandbox_update_trailer(sandbox, data):
+    transport_id = data.get('transport_id')
+    transport_record = sandbox.tables['transports'].copy(transport_id)
+    if transport_record is None:
+        raise LookupError('Transport not found')
+    transport_record['Trailer'] = data.get('trailer', '')
+    sandbox.tables['transports'].put(transport_id, transport_record)
+    if transport_record['Vehicle']:
+        truck_record = sandbox.tables['trucks'].copy(transport_record['Vehicle'])
+        if truck_record is not None:
+            truck_record['Trailer'] = transport_record['Trailer']
+            sandbox.tables['trucks'].put(transport_record['Vehicle'], truck_record)
+    return transport_id
+
+SANDBOX_OPERATIONS = {
+    'create_transport': _sandbox_create_transport,
+    'add_shipment': _sandbox_add_shipment,
+    'remove_shipment': _sandbox_remove_shipment,
+    'assign_transport': _sandbox_assign_transport,
+    'update_trailer': _sandbox_update_trailer,
+}
+
+def commit_sandbox(sandbox):
+    """
+    Applies all changes of a sandbox to the live state.
+
+    Every touched record is first compared with the live state; if anything changed since
+    the sandbox copied it, nothing is applied and the conflicting keys are returned.
+
+    Returns:
+        tuple: (mapping of provisional to real Transport IDs, conflicts)
+    """
+    # Commits touching different departments do not wait for each other
+    departments = {(record or base)['Department'] for name in ('shipments', 'transports')
+                   for _, record, base in sandbox.tables[name].changes()}
+    with department_locks.hold(departments):
+        conflicts = sandbox.conflicts()
+        if conflicts:
+            return {}, conflicts
+
+        changed_transports = list(sandbox.tables['transports'].changes())
+        shipment_changes = {sid: record['Transport'] for sid, record, _ in sandbox.tables['shipments'].changes()}
+        truck_changes = list(sandbox.tables['trucks'].changes())
+        # The commit is undone as one command, from the state of everything it touches
+        existing_ids = [transport_id for transport_id, _, base in changed_transports if base is not None]
+        touched_shipments = set(shipment_changes).union(
+            *(Transport.get_by_id(transport_id).Shipments for transport_id in existing_ids))
+        before = _planning_state(existing_ids, touched_shipments, [plate for plate, _, _ in truck_changes])
+
+        # Shipments leave existing transports first, so they are free for their new transports
+        for transport_id, record, base in changed_transports:
+            if base is not None:
+                transport = Transport.get_by_id(transport_id)
+                transport.remove_shipments([Shipment.get_by_id(sid) for sid in base['Shipments']
+                                            if sid not in record['Shipments']])
+        _set_shipments_transport(shipment_changes, None)
+
+        id_map = {}
+        for transport_id, record, base in changed_transports:
+            if base is None:
+                if not record['Shipments']:
+                    continue
+                selected_df = datasets.shipments[datasets.shipments['Shipment_ID'].isin(list(record['Shipments']))]
+                transport = Transport_create(selected_df)
+                id_map[transport_id] = transport.Transport_ID
+            else:
+                transport = Transport.get_by_id(transport_id)
+                transport.add_shipments([Shipment.get_by_id(sid) for sid in record['Shipments']
+                                         if not transport.has_shipment(sid)])
+            for field in ('Vehicle', 'Driver', 'Haulier', 'Trailer'):
+                setattr(transport, field, record[field])
+            Transport.registry.notify(transport.Transport_ID)
+
+        with datasets.writing('shipments') as frame:
+            mask = frame['Shipment_ID'].isin(list(shipment_changes))
+            frame.loc[mask, 'Transport'] = frame.loc[mask, 'Shipment_ID'].map(
+                lambda sid: id_map.get(shipment_changes[sid], shipment_changes[sid]))
+
+        with datasets.writing('trucks') as trucks:
+            for license_plate, record, _ in truck_changes:
+                truck_mask = trucks['License_plate'] == license_plate
+                trucks.loc[truck_mask, 'Transport'] = id_map.get(record['Transport'], record['Transport'])
+                trucks.loc[truck_mask, 'Trailer'] = record['Trailer']
+        if truck_changes:
+            # Queue df_trucks.csv for the background writer
+            persister.mark_dirty('trucks')
+
+        created = {real_id: Transport.get_by_id(real_id) for real_id in id_map.values()}
+        before['transports'].update(dict.fromkeys(created))
+        after = _planning_state(before['transports'], touched_shipments, before['trucks'])
+        undo, redo = _planning_commands(before, after, created)
+        record_command('commit_sandbox', f"Committed sandbox {sandbox.id} ({len(changed_transports)} transport(s), "
+                                         f"{len(shipment_changes)} shipment(s))", undo, redo, tables=('trucks',))
+
+        logger.info("Committed sandbox", extra={'sandbox': sandbox.id, 'owner': sandbox.owner,
+                                                'transports': len(changed_transports),
+                                                'shipments': len(shipment_changes)})
+        return id_map, {}
+
+@bp.route('/sandbox', methods=['GET', 'POST'])
+def sandbox_sessions():
+    """
+    GET lists the open sandboxes; POST opens a new one. The optional 'department'
+    sets the scope of the KPIs (default 'ALL').
+    """
+    if request.method == 'GET':
+        return jsonify({'sandboxes': sandboxes.list()})
+    data = request.get_json(silent=True) or {}
+    department = data.get('department', 'ALL') or 'ALL'
+    owner = _current_user()
+    try:
+        sandbox = sandboxes.open(lambda session_id: open_sandbox(session_id, owner, department))
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 429
+    return jsonify({'sandbox_id': sandbox.id, 'kpis': sandbox_kpis(sandbox)}), 201
+
+@bp.route('/sandbox/<session_id>', methods=['GET', 'DELETE'])
+def sandbox_session(session_id):
+    """
+    GET shows the KPIs and the changed transports of a sandbox; DELETE drops it.
+    """
+    if request.method == 'DELETE':
+        if not sandboxes.drop(session_id):
+            return jsonify({'error': 'Sandbox not found'}), 404
+        return jsonify({'success': True})
+    sandbox = sandboxes.get(session_id)
+    if not sandbox:
+        return jsonify({'error': 'Sandbox not found'}), 404
+    with sandbox.lock:
+        summary = sandbox.summary()
+        summary['kpis'] = sandbox_kpis(sandbox)
+        summary['transports'] = [_sandbox_transport_view(sandbox, tid)
+                                 for tid, _, _ in sandbox.tables['transports'].changes()]
+    return jsonify(summary)
+
+@bp.route('/sandbox/<session_id>/commit', methods=['POST'])
+def sandbox_commit(session_id):
+    sandbox = sandboxes.get(session_id)
+    if not sandbox:
+        return jsonify({'error': 'Sandbox not found'}), 404
+    with sandbox.lock:
+        try:
+            id_map, conflicts = commit_sandbox(sandbox)
+        except Exception as e:
+            logger.exception("Error in sandbox_commit: %s", e)
+            return jsonify({'error': str(e)}), 500
+        if conflicts:
+            return jsonify({'error': 'Planning changed since the sandbox was opened', 'conflicts': conflicts}), 409
+        sandboxes.drop(session_id)
+    return jsonify({'success': True, 'transports': id_map})
+
+@bp.route('/sandbox/<session_id>/<operation>', methods=['POST'])
+def sandbox_operation(session_id, operation):
+    """
+    Runs a planning operation (create_transport, add_shipment, remove_shipment,
+    assign_transport, update_trailer) inside a sandbox. The request body is the
+    same as for the live endpoint.
+    """
+    sandbox = sandboxes.get(session_id)
+    if not sandbox:
+        return jsonify({'error': 'Sandbox not found'}), 404
+    handler = SANDBOX_OPERATIONS.get(operation)
+    if not handler:
+        return jsonify({'error': f'Unknown operation {operation}'}), 404
+    data = request.get_json(silent=True) or {}
+    with sandbox.lock:
+        try:
+            transport_id = handler(sandbox, data)
+        except KeyError as e:
+            logger.exception("Error in sandbox_operation: %s", e)
+            return jsonify({'error': str(e)}), 500
+        except LookupError as e:
+            return jsonify({'error': str(e)}), 404
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify({
+            'transport': _sandbox_transport_view(sandbox, transport_id),
+            'kpis': sandbox_kpis(sandbox),
+        })
+
+def create_app(data_dir=None, warm_up=None):
+    """
+    Creates the Flask application.
+
+    The data files are not read here: they are loaded by a background thread, so the server
+    accepts connections right away, and a request arriving before the thread has finished
+    loads the table it needs itself (see Datasets).
+
+    Args:
+        data_dir (str, optional): Directory with the CSV files; defaults to MOBILITY_DATA_DIR.
+        warm_up (bool, optional): Load the data in the background; defaults to MOBILITY_WARMUP (on).
+    """
+    global datasets, transport_archive, _archiver
+    configure_logging()
+    if data_dir is not None and data_dir != datasets.data_dir:
+        datasets = Datasets(data_dir)
+        transport_archive = archive.TransportArchive(_archive_path(data_dir))
+    if warm_up is None:
+        warm_up = os.environ.get('MOBILITY_WARMUP', '1').lower() not in ('0', 'false', 'no', 'off')
+
+    app = Flask(__name__)
+    # jsonify() through orjson (when installed), with NumPy and pandas values handled natively
+    app.json = serialization.JSONProvider(app)
+    app.register_blueprint(bp)
+
+    # Rendered list rows, reused while the row's values are unchanged
+    fragments = FragmentCache(app.jinja_env, capacity=int(os.environ.get('MOBILITY_FRAGMENT_CACHE', '50000') or 50000))
+    app.extensions['fragments'] = fragments
+    metrics.registry.gauge('mobility_fragment_cache_rows', 'Rendered list rows held in the fragment cache.',
+                           callback=lambda: len(fragments))
+    metrics.registry.gauge('mobility_fragment_cache_hits', 'Row renders served from the fragment cache.',
+                           callback=lambda: fragments.hits)
+    metrics.registry.gauge('mobility_fragment_cache_misses', 'Row renders that went through Jinja.',
+                           callback=lambda: fragments.misses)
+    metrics.registry.gauge('mobility_datasets_ready', '1 once all data files are loaded.',
+                           callback=lambda: int(datasets.ready.is_set()))
+
+    job_store = JobStore(os.environ.get('MOBILITY_JOBS_DB') or os.path.join(datasets.data_dir, 'jobs.sqlite3'))
+    if os.path.abspath(job_store.path) not in _recovered_job_stores:
+        _recovered_job_stores.add(os.path.abspath(job_store.path))
+        interrupted = job_store.recover()
+        if interrupted:
+            logger.warning("Marked %d interrupted job(s) as failed", interrupted)
+    app.extensions['jobs'] = JobRunner(
+        job_store, workers=int(os.environ.get('MOBILITY_JOB_WORKERS', '') or min(4, os.cpu_count() or 1)),
+        on_finish=lambda job: logger.info("Finished job", extra={'job': job['id'], 'kind': job['kind'],
+                                                                 'status': job['status'], 'error': job['error']}))
+    metrics.registry.gauge('mobility_jobs_running', 'Background jobs queued or running.',
+                           callback=lambda: app.extensions['jobs'].running())
+
+    trucks_path = os.path.join(datasets.data_dir, 'df_trucks.csv')
+    persister.register('trucks', trucks_path, lambda: datasets.copy('trucks'))
+    persister.start()
+
+    if ARCHIVE_INTERVAL > 0 and _archiver is None:
+        _archiver = threading.Thread(target=_archive_periodically, name='mobility-archiver', daemon=True)
+        _archiver.start()
+
+    if warm_up:
+        loading = datasets
+
+        def load():
+            try:
+                loading.load_all()
+                build_search_index()
+                build_kpis()
+            except Exception:
+                logger.exception("Loading the data files failed; requests will retry")
+                return
+            STARTUP_SECONDS.set(time.perf_counter() - IMPORT_STARTED, 'warm_up')
+            logger.info("Data loaded", extra={'seconds': round(time.perf_counter() - IMPORT_STARTED, 3)})
+
+        threading.Thread(target=load, name='mobility-warm-up', daemon=True).start()
+
+    STARTUP_SECONDS.set(time.perf_counter() - IMPORT_STARTED, 'app')
+    return app
+
+def __getattr__(name):
+    # `app.app` (flask --app app, gunicorn app:app) creates the default application on first use
+    if name == 'app':
+        application = globals()['app'] = create_app()
+        return application
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    create_app().run(debug=True)
\ No newline at end of file
@@ -0,0 +1,132 @@
+"""
+Structured, queued logging for the planning backend.
+
+Records are handed to a QueueHandler in the request thread and written by a
+background QueueListener, so stdout/file I/O never happens inside a request.
+Messages use the logging module's lazy %-style arguments: when a level is
+disabled the message (and any expensive repr in its arguments) is never built.
+
+Output is one logfmt line per record, e.g.
+
+    ts=2026-02-09T10:15:02.113 level=INFO logger=mobility.transport msg="Created transport" transport_id=TOUR01-0001
+
+Structured fields are passed through ``extra``:
+
+    logger.info("Created transport", extra={'transport_id': transport_id})
+
+Configuration through environment variables:
+    MOBILITY_LOG_LEVEL  - root level of the 'mobility' logger (default INFO)
+    MOBILITY_LOG_FILE   - optional file to write to instead of stderr
+"""
+import atexit
+import datetime
+import logging
+import logging.handlers
+import os
+import queue
+
+ROOT_LOGGER_NAME = 'mobility'
+
+# Attributes every LogRecord carries; anything else came in through `extra`
+_RESERVED_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'taskName'}
+
+_listener = None
+
+
+def _logfmt_value(value):
+    text = str(value)
+    if text == '' or any(c in text for c in ' ="\n'):
+        text = '"' + text.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+    return text
+
+
+class StructuredFormatter(logging.Formatter):
+    """Formats records as logfmt key=value lines, including fields passed via `extra`."""
+
+    def format(self, record):
+        timestamp = datetime.datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds')
+        parts = [
+            f"ts={timestamp}",
+            f"level={record.levelname}",
+            f"logger={record.name}",
+            f"msg={_logfmt_value(record.getMessage())}",
+        ]
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith('_'):
+                parts.append(f"{key}={_logfmt_value(value)}")
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            parts.append(f"exc={_logfmt_value(record.exc_text)}")
+        return ' '.join(parts)
+
+
+class _StructuredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that only resolves the message in the calling thread.
+
+    The default QueueHandler runs the full formatter before enqueueing; here
+    timestamps and logfmt encoding are left to the listener thread. The
+    message itself is still resolved eagerly so mutable arguments (such as a
+    transport's stop list) are captured as they were at the time of the call.
+    """
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def configure_logging(level=None, stream=None, filename=None):
+    """
+    Installs the queued structured handler on the 'mobility' logger.
+
+    Safe to call more than once; later calls only adjust the level.
+
+    Args:
+        level (str or int, optional): Log level, defaults to $MOBILITY_LOG_LEVEL or INFO.
+        stream (file-like, optional): Stream to write to, defaults to stderr.
+        filename (str, optional): File to write to, defaults to $MOBILITY_LOG_FILE.
+    """
+    global _listener
+    root = logging.getLogger(ROOT_LOGGER_NAME)
+    level = level or os.environ.get('MOBILITY_LOG_LEVEL', 'INFO')
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+    if _listener is not None:
+        return root
+
+    filename = filename or os.environ.get('MOBILITY_LOG_FILE')
+    if filename:
+        target = logging.FileHandler(filename, encoding='utf-8')
+    else:
+        target = logging.StreamHandler(stream)
+    target.setFormatter(StructuredFormatter())
+
+    log_queue = queue.SimpleQueue()
+    root.addHandler(_StructuredQueueHandler(log_queue))
+    root.propagate = False
+
+    _listener = logging.handlers.QueueListener(log_queue, target, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+    return root
+
+
+def shutdown_logging():
+    """Stops the background listener after writing out every queued record."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+        root = logging.getLogger(ROOT_LOGGER_NAME)
+        for handler in list(root.handlers):
+            if isinstance(handler, _StructuredQueueHandler):
+                root.removeHandler(handler)
+
+
+def get_logger(name):
+    """Returns a child of the 'mobility' logger, e.g. get_logger('transport') -> 'mobility.transport'."""
+    return logging.getLogger(f"{ROOT_LOGGER_NAME}.{name}")
@@ -0,0 +1,179 @@
+"""
+Cold storage for handled transports.
+
+A transport that has been executed (Status 'Handled', see transfer_truck) is
+never planned again, yet it used to stay in Transport.registry with its
+shipments and stops, and every list view kept iterating it. Once its delivery
+date is older than the archive horizon, the transport and its shipments are
+moved into a SQLite file and dropped from the live registries and the
+shipments table, so the in-memory state only grows with the open work.
+
+Each archived transport and shipment is one row: the columns queries filter on
+(department, dates, IDs) are real columns with indexes, the rest of the record
+is kept as a JSON document. Archived shipments stay in df_shipments.csv; their
+IDs are skipped when the table is loaded.
+"""
+import os
+import sqlite3
+import threading
+import time
+
+import serialization
+
+
+class TransportArchive:
+    SCHEMA = (
+        """
+        CREATE TABLE IF NOT EXISTS transports (
+            Transport_ID TEXT PRIMARY KEY,
+            Department TEXT,
+            Pickup_date TEXT,
+            Delivery_date TEXT,
+            Vehicle TEXT,
+            archived_at REAL NOT NULL,
+            record TEXT NOT NULL
+        )
+        """,
+        'CREATE INDEX IF NOT EXISTS transports_department_date ON transports (Department, Delivery_date)',
+        """
+        CREATE TABLE IF NOT EXISTS shipments (
+            Shipment_ID TEXT PRIMARY KEY,
+            Transport_ID TEXT NOT NULL,
+            Department TEXT,
+            Pickup_date TEXT,
+            record TEXT NOT NULL
+        )
+        """,
+        'CREATE INDEX IF NOT EXISTS shipments_transport ON shipments (Transport_ID)',
+    )
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): SQLite file of the archive; created on the first write.
+        """
+        self.path = path
+        self._local = threading.local()
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+        self._transport_ids = None  # cached set of archived Transport_IDs, loaded on first use
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def _connection(self):
+        # One connection per thread
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            self._local.connection = connection
+        if not self._schema_ready:
+            with self._schema_lock:
+                if not self._schema_ready:
+                    for statement in self.SCHEMA:
+                        connection.execute(statement)
+                    self._schema_ready = True
+        return connection
+
+    def store(self, transports, shipments):
+        """
+        Writes transports and their shipments in one transaction.
+
+        Args:
+            transports (list): Transport dicts; must hold Transport_ID, Department, Pickup_date,
+                Delivery_date and Vehicle, everything else is kept in the JSON record.
+            shipments (list): Shipment dicts (df_shipments.csv rows) with their Transport_ID.
+        """
+        now = time.time()
+        connection = self._connection()
+        with connection:
+            connection.execute('BEGIN')
+            connection.executemany(
+                'INSERT OR REPLACE INTO transports VALUES (?, ?, ?, ?, ?, ?, ?)',
+                [(t['Transport_ID'], t['Department'], _text(t['Pickup_date']), _text(t['Delivery_date']),
+                  t['Vehicle'], now, serialization.dumps(t).decode('utf-8')) for t in transports])
+            connection.executemany(
+                'INSERT OR REPLACE INTO shipments VALUES (?, ?, ?, ?, ?)',
+                [(s['Shipment_ID'], s['Transport_ID'], s['Department'], _text(s['Pickup_date']),
+                  serialization.dumps(s).decode('utf-8')) for s in shipments])
+        if self._transport_ids is not None:
+            self._transport_ids.update(t['Transport_ID'] for t in transports)
+
+    def has_transport(self, transport_id):
+        if self._transport_ids is None:
+            ids = set()
+            if self.exists():
+                ids = {row[0] for row in self._connection().execute('SELECT Transport_ID FROM transports')}
+            self._transport_ids = ids
+        return transport_id in self._transport_ids
+
+    def shipment_ids(self):
+        """IDs of all archived shipments; empty when nothing has been archived yet."""
+        if not self.exists():
+            return set()
+        return {row[0] for row in self._connection().execute('SELECT Shipment_ID FROM shipments')}
+
+    def transports(self, department=None, start_date=None, end_date=None, limit=100, offset=0):
+        """
+        Archived transports, newest delivery first.
+
+        Args:
+            department (str, optional): Only this department ('ALL' or '' for all).
+            start_date (str, optional): Earliest delivery date, YYYY-MM-DD.
+            end_date (str, optional): Latest delivery date, YYYY-MM-DD.
+            limit (int): Maximum number of transports.
+            offset (int): Transports to skip, for paging.
+
+        Returns:
+            tuple: (list of transport dicts, total number of matches)
+        """
+        if not self.exists():
+            return [], 0
+        conditions, values = [], []
+        if department and department != 'ALL':
+            conditions.append('Department = ?')
+            values.append(department)
+        if start_date:
+            conditions.append('Delivery_date >= ?')
+            values.append(start_date)
+        if end_date:
+            conditions.append('Delivery_date <= ?')
+            values.append(end_date)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        connection = self._connection()
+        total = connection.execute(f'SELECT COUNT(*) FROM transports {where}', values).fetchone()[0]
+        rows = connection.execute(
+            f'SELECT record, archived_at FROM transports {where} '
+            f'ORDER BY Delivery_date DESC, Transport_ID LIMIT ? OFFSET ?', (*values, limit, offset)).fetchall()
+        return [dict(serialization.loads(record), archived_at=archived_at) for record, archived_at in rows], total
+
+    def transport(self, transport_id):
+        """An archived transport with its shipment records, or None."""
+        if not self.exists():
+            return None
+        connection = self._connection()
+        row = connection.execute('SELECT record, archived_at FROM transports WHERE Transport_ID = ?',
+                                 (transport_id,)).fetchone()
+        if row is None:
+            return None
+        shipments = connection.execute('SELECT record FROM shipments WHERE Transport_ID = ? ORDER BY Shipment_ID',
+                                       (transport_id,)).fetchall()
+        return dict(serialization.loads(row[0]), archived_at=row[1],
+                    shipment_records=[serialization.loads(record) for (record,) in shipments])
+
+    def stats(self):
+        if not self.exists():
+            return {'transports': 0, 'shipments': 0, 'bytes': 0}
+        connection = self._connection()
+        return {
+            'transports': connection.execute('SELECT COUNT(*) FROM transports').fetchone()[0],
+            'shipments': connection.execute('SELECT COUNT(*) FROM shipments').fetchone()[0],
+            'bytes': os.path.getsize(self.path),
+        }
+
+
+def _text(value):
+    if value is None or value != value:
+        return None
+    return value.isoformat() if hasattr(value, 'isoformat') else str(value)
@@ -0,0 +1,181 @@
+"""
+Synthetic data generator for benchmarks.
+
+Builds df_shipments.csv / df_trucks.csv / df_trailers.csv style files at an
+arbitrary scale. Every categorical column is drawn from the empirical
+distribution of the checked-in CSVs (per department, so each department keeps
+its own country mix, postal code ranges, customers and addresses), and the
+numeric columns are resampled from the observed values with a little noise.
+The same seed always produces the same files.
+
+Usage:
+    python -m benchmarks.datagen --shipments 100000 --out /tmp/mobility_100k
+"""
+import argparse
+import datetime
+import os
+
+import numpy as np
+import pandas as pd
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Ratios of the checked-in data set (~5.3k shipments, 150 trucks, 210 trailers)
+TRUCKS_PER_SHIPMENT = 150 / 5289
+TRAILERS_PER_SHIPMENT = 210 / 5289
+
+# Columns copied together from one sampled template row so names, cities,
+# addresses and postal codes stay consistent with each other
+COLLECTION_COLUMNS = ['Collection_Name', 'Collection_City', 'Collection_Address',
+                      'Collection_Postal_Code', 'Collection_Country']
+DELIVERY_COLUMNS = ['Delivery_Name', 'Delivery_City', 'Delivery_Address',
+                    'Delivery_Postal_Code', 'Delivery_Country']
+CARGO_COLUMNS = ['Content', 'Unit_type', 'Customer', 'Finance_Department', 'Incoterm',
+                 'Pickup_time', 'Delivery_time', 'Hazardous', 'min_temperature', 'max_temperature']
+
+_ID_ALPHABET = np.array(list('0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'))
+
+
+def _load_templates(source_dir):
+    shipments = pd.read_csv(os.path.join(source_dir, 'df_shipments.csv'), dtype={'Transport': object})
+    trucks = pd.read_csv(os.path.join(source_dir, 'df_trucks.csv'), dtype={'Transport': object, 'Trailer': object})
+    trailers = pd.read_csv(os.path.join(source_dir, 'df_trailers.csv'), dtype={'Transport': object})
+    return shipments, trucks, trailers
+
+
+def _encode_ids(numbers, width):
+    """Encodes integers as fixed-width base36 strings (vectorized)."""
+    digits = np.empty((len(numbers), width), dtype='<U1')
+    values = numbers.copy()
+    for position in range(width - 1, -1, -1):
+        digits[:, position] = _ID_ALPHABET[values % 36]
+        values //= 36
+    return np.array([''.join(row) for row in digits])
+
+
+def _sample_rows(rng, template, department_column, departments):
+    """For every requested department, picks a random template row of that department."""
+    positions = np.empty(len(departments), dtype=np.int64)
+    groups = template.groupby(department_column).indices
+    for department, group_positions in groups.items():
+        mask = departments == department
+        positions[mask] = rng.choice(group_positions, size=int(mask.sum()))
+    return positions
+
+
+def generate_shipments(n, rng, template, base_date, date_span_days):
+    departments_dist = template['Department'].value_counts(normalize=True)
+    departments = rng.choice(departments_dist.index.to_numpy(), size=n, p=departments_dist.to_numpy())
+
+    # Collection, delivery and cargo attributes come from independent template rows of the same department
+    collection_rows = template.iloc[_sample_rows(rng, template, 'Department', departments)]
+    delivery_rows = template.iloc[_sample_rows(rng, template, 'Department', departments)]
+    cargo_rows = template.iloc[_sample_rows(rng, template, 'Department', departments)]
+
+    df = pd.DataFrame({'Department': departments})
+    prefixes = cargo_rows['Shipment_ID'].str.split('-').str[0].to_numpy()
+    # Multiplying by a prime coprime to 36**6 is a bijection, so suffixes are unique but look random
+    suffixes = _encode_ids((np.arange(n, dtype=np.int64) * 1_000_003 + int(rng.integers(36 ** 6))) % 36 ** 6, 6)
+    df.insert(0, 'Shipment_ID', [f"{p}-{s}" for p, s in zip(prefixes, suffixes)])
+    df['Transport'] = None
+
+    for column in CARGO_COLUMNS:
+        df[column] = cargo_rows[column].to_numpy()
+    for column in COLLECTION_COLUMNS:
+        df[column] = collection_rows[column].to_numpy()
+    for column in DELIVERY_COLUMNS:
+        df[column] = delivery_rows[column].to_numpy()
+
+    # Postal codes: keep the template code in most rows, jitter the rest within +-50
+    for column in ['Collection_Postal_Code', 'Delivery_Postal_Code']:
+        codes = pd.to_numeric(df[column].astype(str).str.replace(' ', '', regex=False), errors='coerce').fillna(0)
+        jitter = rng.integers(-50, 51, size=n) * (rng.random(n) < 0.3)
+        df[column] = np.maximum(codes.to_numpy() + jitter, 0).astype(int)
+
+    pickup_offsets = rng.integers(0, date_span_days + 1, size=n)
+    transit_days = rng.choice([0, 0, 0, 1, 1, 2], size=n)
+    pickup_dates = pd.to_datetime(base_date) + pd.to_timedelta(pickup_offsets, unit='D')
+    df['Pickup_date'] = pickup_dates.strftime('%Y-%m-%d')
+    df['Delivery_date'] = (pickup_dates + pd.to_timedelta(transit_days, unit='D')).strftime('%Y-%m-%d')
+
+    noise = rng.normal(1.0, 0.15, size=n).clip(0.5, 1.5)
+    df['Weight'] = np.maximum((cargo_rows['Weight'].to_numpy() * noise).round(), 1).astype(int)
+    df['Volume'] = (cargo_rows['Volume'].to_numpy() * noise).round(3)
+    df['Ldm'] = (cargo_rows['Ldm'].to_numpy() * noise).round(1)
+    df['Units'] = np.maximum((cargo_rows['Units'].to_numpy() * noise).round(), 1).astype(int)
+    df['Cost'] = (cargo_rows['Cost'].to_numpy() * rng.normal(1.0, 0.1, size=n)).round(-1)
+
+    for column in ['Loading_Instructions', 'Customer_Reference', 'Additional_Information', 'Services', 'stops']:
+        df[column] = None
+    return df[template.columns]
+
+
+def generate_trucks(n, rng, template, base_date, date_span_days):
+    rows = template.iloc[rng.integers(0, len(template), size=n)].reset_index(drop=True)
+    letters = _ID_ALPHABET[10:]
+    plates = [f"{a}{b}{num:05d}" for a, b, num in zip(rng.choice(letters, n), rng.choice(letters, n), range(n))]
+    rows['License_plate'] = plates
+    rows['Trailer'] = None
+    rows['Transport'] = None
+    rows['Last_transport'] = None
+    offsets = rng.integers(0, date_span_days + 1, size=n)
+    rows['Date'] = (pd.to_datetime(base_date) + pd.to_timedelta(offsets, unit='D')).strftime('%Y-%m-%d')
+    hours = rng.integers(6, 20, size=n)
+    minutes = rng.choice([0, 15, 30, 45], size=n)
+    rows['Time'] = [f"{h:02d}:{m:02d}" for h, m in zip(hours, minutes)]
+    return rows[template.columns]
+
+
+def generate_trailers(n, rng, template):
+    rows = template.iloc[rng.integers(0, len(template), size=n)].reset_index(drop=True)
+    letters = _ID_ALPHABET[10:]
+    rows['License_plate'] = [f"{a}{b}{num:04d}" for a, b, num in zip(rng.choice(letters, n), rng.choice(letters, n), range(n))]
+    rows['Transport'] = None
+    return rows[template.columns]
+
+
+def generate_dataset(out_dir, n_shipments, seed=0, source_dir=REPO_DIR, base_date=None, date_span_days=14):
+    """
+    Writes a synthetic df_shipments.csv, df_trucks.csv and df_trailers.csv to out_dir.
+
+    Args:
+        out_dir (str): Target directory (created if missing).
+        n_shipments (int): Number of shipments to generate.
+        seed (int): RNG seed; identical seeds give identical files.
+        source_dir (str): Directory of the CSVs used as distribution templates.
+        base_date (datetime.date, optional): First pickup date, defaults to today.
+        date_span_days (int): Pickup dates are spread over this many days.
+
+    Returns:
+        dict: Row counts per generated file.
+    """
+    rng = np.random.default_rng(seed)
+    base_date = base_date or datetime.date.today()
+    shipments_t, trucks_t, trailers_t = _load_templates(source_dir)
+
+    n_trucks = max(int(round(n_shipments * TRUCKS_PER_SHIPMENT)), 1)
+    n_trailers = max(int(round(n_shipments * TRAILERS_PER_SHIPMENT)), 1)
+
+    os.makedirs(out_dir, exist_ok=True)
+    generate_shipments(n_shipments, rng, shipments_t, base_date, date_span_days).to_csv(
+        os.path.join(out_dir, 'df_shipments.csv'), index=False)
+    generate_trucks(n_trucks, rng, trucks_t, base_date, date_span_days).to_csv(
+        os.path.join(out_dir, 'df_trucks.csv'), index=False)
+    generate_trailers(n_trailers, rng, trailers_t).to_csv(
+        os.path.join(out_dir, 'df_trailers.csv'), index=False)
+    return {'shipments': n_shipments, 'trucks': n_trucks, 'trailers': n_trailers}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--shipments', type=int, required=True)
+    parser.add_argument('--out', required=True)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--days', type=int, default=14, help='Spread of pickup dates in days')
+    args = parser.parse_args(argv)
+    counts = generate_dataset(args.out, args.shipments, seed=args.seed, date_span_days=args.days)
+    print(f"Wrote {counts} to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
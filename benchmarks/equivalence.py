@@ -0,0 +1,238 @@
+"""
+Equivalence check of the list views against their original filter semantics.
+
+/shipments and /transports read the department and day partitions of the
+planning state instead of filtering whole tables, which must not change the
+rows they return. For a synthetic data set (see benchmarks.datagen) with part
+of the shipments planned on transports, both views are requested as JSON for
+a grid of filters, and the IDs they return (in order) are compared with a
+plain reimplementation of the filters as they were before the partitions:
+department, unassigned, ID search, postal code ranges, and the date range last.
+
+Usage:
+    python -m benchmarks.equivalence --shipments 20000
+    python -m benchmarks.equivalence --data-dir /tmp/mobility_bench/10000_seed0
+"""
+import argparse
+import datetime
+import itertools
+import os
+import sys
+import tempfile
+
+import pandas as pd
+
+from benchmarks.datagen import generate_dataset
+from benchmarks.run import BASE_DATE, DATE_SPAN_DAYS, REPO_DIR
+
+DEPARTMENTS = ('NAESJ', 'KDEGR', 'ALL')
+# Country only, country with range, range only, and ranges that match no row (which keep all rows)
+COLLECTION_PC = ('', 'DE', 'DK:1000-5000', '2700-3500', 'ZZ')
+DELIVERY_PC = ('', 'DK,SE', 'NL:1000-2000,BE:2700-3500', '99998-99999')
+DATE_FILTERS = (
+    ('', ''),
+    (BASE_DATE.isoformat(), '0'),
+    (BASE_DATE.isoformat(), '2'),
+    ((BASE_DATE + datetime.timedelta(days=5)).isoformat(), '-3'),
+    (BASE_DATE.isoformat(), str(DATE_SPAN_DAYS)),
+    ('not-a-date', '2'),
+)
+
+
+def _pc_filter(frame, pc_string, column, country_column):
+    """Postal code filter of /shipments; a string matching no row keeps all rows."""
+    mask = pd.Series(False, index=frame.index)
+    for range_str in pc_string.split(','):
+        range_str = range_str.strip()
+        country_code, postal_range = None, None
+        if ':' in range_str:
+            parts = range_str.split(':', 1)
+            country_code = parts[0].strip().upper()
+            postal_range = parts[1].strip() or None
+        elif range_str.replace('-', '').replace(' ', '').isalpha() and len(range_str) <= 3:
+            country_code = range_str.upper()
+        else:
+            postal_range = range_str
+        country_mask = pd.Series(True, index=frame.index)
+        if country_code:
+            country_mask = frame[country_column].str.upper() == country_code
+        if postal_range and '-' in postal_range:
+            parts = postal_range.split('-')
+            if len(parts) == 2:
+                try:
+                    low, high = int(parts[0].strip()), int(parts[1].strip())
+                except ValueError:
+                    continue
+                values = pd.to_numeric(frame[column].astype(str).str.replace(' ', '', regex=False), errors='coerce')
+                mask |= country_mask & (values >= low) & (values <= high)
+        elif country_code and not postal_range:
+            mask |= country_mask
+    return frame[mask] if mask.any() else frame
+
+
+def _date_range(params, default_days):
+    """(start, end) of the date filter, or None when the view is not filtered by date."""
+    days = params.get('date_range_days', default_days).strip()
+    if not days:
+        return None
+    try:
+        days = int(days)
+        start_text = params.get('start_date', '').strip()
+        start = pd.to_datetime(start_text).date() if start_text else datetime.date.today()
+    except ValueError:
+        return None
+    end = start + datetime.timedelta(days=days)
+    return (start, end) if days >= 0 else (end, start)
+
+
+def reference_shipments(frame, params):
+    filtered = frame
+    department = params.get('department', 'KDEGR').strip()
+    if department and department != 'ALL':
+        filtered = filtered[filtered['Department'] == department]
+    if params.get('filter', 'unassigned') == 'unassigned':
+        filtered = filtered[filtered['Transport'].isnull() | (filtered['Transport'] == '')]
+    shipment_id = params.get('shipment_id', '').strip()
+    if shipment_id:
+        filtered = filtered[filtered['Shipment_ID'].str.contains(shipment_id, case=False, na=False)]
+    if params.get('collection_pc', '').strip():
+        filtered = _pc_filter(filtered, params['collection_pc'].strip(), 'Collection_Postal_Code', 'Collection_Country')
+    if params.get('delivery_pc', '').strip():
+        filtered = _pc_filter(filtered, params['delivery_pc'].strip(), 'Delivery_Postal_Code', 'Delivery_Country')
+    window = _date_range(params, '0')
+    if window is not None:
+        days = pd.to_datetime(filtered['Pickup_date']).dt.date
+        filtered = filtered[(days >= window[0]) & (days <= window[1])]
+    return filtered['Shipment_ID'].tolist()
+
+
+def _stop_matches(stop, pc_string):
+    """Postal code filter of /transports for the first or last stop."""
+    if stop is None or stop.Postal_Code is None:
+        return False
+    try:
+        value = int(str(stop.Postal_Code).replace(' ', ''))
+    except (ValueError, TypeError):
+        return False
+    for range_str in pc_string.split(','):
+        range_str = range_str.strip()
+        country_code, postal_range = None, None
+        if ':' in range_str:
+            parts = range_str.split(':', 1)
+            country_code = parts[0].strip().upper()
+            postal_range = parts[1].strip() or None
+        elif range_str.replace('-', '').replace(' ', '').isalpha() and len(range_str) <= 3:
+            country_code = range_str.upper()
+        else:
+            postal_range = range_str
+        if country_code and not (stop.Country and stop.Country.upper() == country_code):
+            continue
+        if postal_range and '-' in postal_range:
+            parts = postal_range.split('-')
+            if len(parts) == 2:
+                try:
+                    if int(parts[0].strip()) <= value <= int(parts[1].strip()):
+                        return True
+                except ValueError:
+                    pass
+        elif country_code and not postal_range:
+            return True
+    return False
+
+
+def reference_transports(transports, params):
+    filtered = list(transports)
+    department = params.get('department', 'KDEGR').strip()
+    if department and department != 'ALL':
+        filtered = [t for t in filtered if t.Department == department]
+    transport_id = params.get('transport_id', '').strip()
+    if transport_id:
+        filtered = [t for t in filtered if transport_id.lower() in t.Transport_ID.lower()]
+    collection_pc = params.get('collection_pc', '').strip()
+    if collection_pc:
+        filtered = [t for t in filtered if t.Stops and _stop_matches(t.Stops[0], collection_pc)]
+    delivery_pc = params.get('delivery_pc', '').strip()
+    if delivery_pc:
+        filtered = [t for t in filtered if t.Stops and _stop_matches(t.Stops[-1], delivery_pc)]
+    window = _date_range(params, '')
+    if window is not None:
+        filtered = [t for t in filtered if window[0] <= pd.to_datetime(str(t.Pickup_date)).date() <= window[1]]
+    return [t.Transport_ID for t in filtered]
+
+
+def _plan_transports(client, frame, count, size):
+    """Creates `count` transports of `size` shipments, spread over the departments."""
+    for department, rows in frame.groupby('Department'):
+        ids = rows['Shipment_ID'].tolist()[:count * size]
+        for i in range(0, len(ids) - size + 1, size):
+            response = client.post('/create_transport', json={'shipments': ids[i:i + size]})
+            assert response.status_code == 200, response.get_json()
+
+
+def check(data_dir, transports_per_department=50):
+    """
+    Compares the list views with the reference filters.
+
+    Returns:
+        list: (view, params, missing IDs, unexpected IDs or None for a different order) per mismatch.
+    """
+    os.environ.setdefault('MOBILITY_ARCHIVE_INTERVAL', '0')
+    os.environ.setdefault('MOBILITY_LOG_LEVEL', 'WARNING')
+    sys.path.insert(0, REPO_DIR)
+    import app as mobility_app
+
+    application = mobility_app.create_app(data_dir=data_dir, warm_up=False)
+    client = application.test_client()
+    _plan_transports(client, mobility_app.datasets.shipments, transports_per_department, 3)
+    frame = mobility_app.datasets.shipments
+    transports = list(mobility_app.Transport.registry.values())
+    sample_id = frame['Shipment_ID'].iloc[len(frame) // 2][:6]
+
+    grid = []
+    for department, unassigned, collection_pc, delivery_pc, (start_date, days) in itertools.product(
+            DEPARTMENTS, ('unassigned', 'all'), COLLECTION_PC, DELIVERY_PC, DATE_FILTERS):
+        grid.append({'department': department, 'filter': unassigned, 'collection_pc': collection_pc,
+                     'delivery_pc': delivery_pc, 'start_date': start_date, 'date_range_days': days})
+    grid += [dict(params, shipment_id=sample_id) for params in grid[::7]]
+
+    mismatches = []
+    for params in grid:
+        query = {key: value for key, value in params.items() if value != ''}
+        for view, reference, key in (('/shipments', reference_shipments, 'Shipment_ID'),
+                                     ('/transports', reference_transports, 'Transport_ID')):
+            if view == '/transports' and (params.get('shipment_id') or params['filter'] != 'all'):
+                continue
+            source = frame if view == '/shipments' else transports
+            response = client.get(view, query_string=dict(query, format='json'))
+            assert response.status_code == 200, (view, query, response.status_code)
+            got = [row[key] for row in response.get_json()]
+            expected = reference(source, query)
+            if got != expected:
+                missing, unexpected = set(expected) - set(got), set(got) - set(expected)
+                mismatches.append((view, query, sorted(missing), sorted(unexpected) if missing or unexpected else None))
+    print(f"{len(grid)} filter combinations, {len(transports)} transports, {len(mismatches)} mismatches")
+    return mismatches
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--shipments', type=int, default=20_000, help='Size of the generated data set')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--data-dir', help='Existing data set to check instead of a generated one')
+    args = parser.parse_args(argv)
+
+    data_dir = args.data_dir
+    if data_dir is None:
+        data_dir = tempfile.mkdtemp(prefix='mobility_equivalence_')
+        generate_dataset(data_dir, args.shipments, seed=args.seed, base_date=BASE_DATE,
+                         date_span_days=DATE_SPAN_DAYS)
+    mismatches = check(data_dir)
+    for view, params, missing, unexpected in mismatches[:20]:
+        detail = 'different order' if unexpected is None else f"missing {missing[:5]}, unexpected {unexpected[:5]}"
+        print(f"{view} {params}: {detail}")
+    if mismatches:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+"""
+Benchmark harness for the planning backend.
+
+For every scale a synthetic data set is generated (see benchmarks.datagen) and
+a fresh worker process imports app.py against it, so import, app creation, data
+loading and peak memory are measured per scale. The worker drives the mutation endpoints
+(/create_transport -> Transport_create, /add_shipment -> Transport_add,
+/remove_shipment -> Transport_remove) and the list views (/shipments,
+/transports, /planning) through the Flask test client.
+
+Each operation reports median/p95/mean wall time over the repetitions and the
+tracemalloc peak of one extra traced repetition. Results are printed as a table
+and written as JSON; pass --compare with an earlier JSON file to get ratios.
+
+Usage:
+    python -m benchmarks.run --scales 10k 100k --out bench_results.json
+    python -m benchmarks.run --scales 10k --compare bench_results.json
+"""
+import argparse
+import datetime
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.datagen import generate_dataset
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCALES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+# Fixed first pickup date so results are comparable across days and commits
+BASE_DATE = datetime.date(2026, 1, 5)
+DATE_SPAN_DAYS = 14
+DEPARTMENT = 'NAESJ'
+
+
+def _parse_scale(value):
+    key = value.lower()
+    if key in SCALES:
+        return key, SCALES[key]
+    return value, int(value)
+
+
+def _measure(fn, repeat):
+    """Runs fn `repeat` times for timing, then once under tracemalloc for the peak."""
+    timings = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        fn(i)
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    fn(repeat)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    timings.sort()
+    return {
+        'repeat': repeat,
+        'median_ms': statistics.median(timings) * 1000,
+        'p95_ms': timings[min(int(len(timings) * 0.95), len(timings) - 1)] * 1000,
+        'mean_ms': statistics.fmean(timings) * 1000,
+        'peak_kib': peak / 1024,
+    }
+
+
+def run_worker(data_dir, repeat, batch_size):
+    """Benchmarks one data set; runs inside a dedicated process."""
+    os.environ['MOBILITY_DATA_DIR'] = data_dir
+    os.environ.setdefault('MOBILITY_LOG_LEVEL', 'WARNING')
+    sys.path.insert(0, REPO_DIR)
+
+    results = {}
+    start = time.perf_counter()
+    import app as mobility_app
+    results['import_app'] = {'repeat': 1, 'median_ms': (time.perf_counter() - start) * 1000}
+
+    start = time.perf_counter()
+    application = mobility_app.create_app(warm_up=False)
+    results['create_app'] = {'repeat': 1, 'median_ms': (time.perf_counter() - start) * 1000}
+    start = time.perf_counter()
+    mobility_app.datasets.load_all()
+    results['load_data'] = {'repeat': 1, 'median_ms': (time.perf_counter() - start) * 1000}
+
+    client = application.test_client()
+    df = mobility_app.datasets.shipments
+    free_ids = df.loc[df['Department'] == DEPARTMENT, 'Shipment_ID'].tolist()
+    # Every repetition (plus the traced one) consumes its own shipments
+    needed = (repeat + 1) * batch_size * 3
+    if len(free_ids) < needed:
+        raise SystemExit(f"Data set too small: need {needed} {DEPARTMENT} shipments, have {len(free_ids)}")
+    batches = [free_ids[i:i + batch_size] for i in range(0, needed, batch_size)]
+    create_batches = batches[:repeat + 1]
+    add_batches = batches[repeat + 1:2 * (repeat + 1)]
+    created = []
+
+    def create(i):
+        response = client.post('/create_transport', json={'shipments': create_batches[i]})
+        assert response.status_code == 200, response.get_json()
+        created.append(response.get_json()['message'].split()[1])
+
+    def add(i):
+        response = client.post('/add_shipment', json={'transport': created[i], 'shipments': add_batches[i]})
+        assert response.status_code == 200, response.get_json()
+
+    def remove(i):
+        response = client.post('/remove_shipment', json={'shipments': add_batches[i]})
+        assert response.status_code == 200, response.get_json()
+
+    results['Transport_create'] = _measure(create, repeat)
+    results['Transport_add'] = _measure(add, repeat)
+    results['Transport_remove'] = _measure(remove, repeat)
+
+    window = {'department': DEPARTMENT, 'start_date': BASE_DATE.isoformat(), 'date_range_days': '2'}
+    views = {
+        '/shipments': window,
+        '/shipments all': dict(window, filter='all', date_range_days=str(DATE_SPAN_DAYS)),
+        '/transports': dict(window, date_range_days=str(DATE_SPAN_DAYS)),
+        '/planning': window,
+    }
+    for name, params in views.items():
+        path = name.split()[0]
+
+        def view(i, path=path, params=params):
+            response = client.get(path, query_string=params)
+            assert response.status_code == 200
+
+        results[name] = _measure(view, repeat)
+
+    results['process_max_rss'] = {
+        'repeat': 1, 'peak_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+    return results
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def _format_table(report, baseline=None):
+    lines = []
+    header = f"{'scale':>6} {'operation':<18} {'median ms':>10} {'p95 ms':>10} {'peak KiB':>11}"
+    if baseline:
+        header += f" {'vs base':>8}"
+    lines.append(header)
+    lines.append('-' * len(header))
+    for scale, operations in report['results'].items():
+        for operation, stats in operations.items():
+            median = stats.get('median_ms')
+            cells = [
+                f"{median:.2f}" if median is not None else '',
+                f"{stats['p95_ms']:.2f}" if 'p95_ms' in stats else '',
+                f"{stats['peak_kib']:.0f}" if 'peak_kib' in stats else '',
+            ]
+            row = f"{scale:>6} {operation:<18} {cells[0]:>10} {cells[1]:>10} {cells[2]:>11}"
+            if baseline:
+                base = baseline.get('results', {}).get(scale, {}).get(operation, {}).get('median_ms')
+                ratio = f"{median / base:.2f}x" if base and median is not None else ''
+                row += f" {ratio:>8}"
+            lines.append(row)
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', nargs='+', default=list(SCALES), help='10k, 100k, 1m or a shipment count')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--batch-size', type=int, default=5, help='Shipments per create/add/remove call')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--data-root', default=os.path.join(tempfile.gettempdir(), 'mobility_bench'),
+                        help='Where generated data sets are cached')
+    parser.add_argument('--out', help='Write results as JSON to this file')
+    parser.add_argument('--compare', help='Earlier JSON results to compare against')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        json.dump(run_worker(args.worker, args.repeat, args.batch_size), sys.stdout)
+        return
+
+    report = {'revision': _git_revision(), 'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+              'python': sys.version.split()[0], 'seed': args.seed, 'results': {}}
+    for scale in args.scales:
+        label, n_shipments = _parse_scale(scale)
+        data_dir = os.path.join(args.data_root, f"{n_shipments}_seed{args.seed}")
+        if not os.path.exists(os.path.join(data_dir, 'df_shipments.csv')):
+            generate_dataset(data_dir, n_shipments, seed=args.seed, base_date=BASE_DATE,
+                             date_span_days=DATE_SPAN_DAYS)
+        completed = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.run', '--worker', data_dir,
+             '--repeat', str(args.repeat), '--batch-size', str(args.batch_size)],
+            cwd=REPO_DIR, capture_output=True, text=True)
+        if completed.returncode != 0:
+            sys.stderr.write(completed.stderr)
+            raise SystemExit(f"Benchmark worker failed for scale {label}")
+        report['results'][label] = json.loads(completed.stdout)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print(f"revision {report['revision']}  python {report['python']}  seed {report['seed']}")
+    print(_format_table(report, baseline))
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+"""
+Capacity and compatibility checks for shipment sets against trailer types.
+
+Checks work on column arrays (Weight, Ldm, Volume, Hazardous, min_temperature,
+max_temperature) instead of objects, so a candidate set is validated with a
+few NumPy reductions and a whole department's transports are validated in one
+grouped pass.
+
+Trailer limits are looked up by (Type, Sub_type) as used in df_trailers.csv.
+Sub_type rows only override the fields they set; everything else falls back
+to the Type row.
+
+Temperature requirements use the convention of df_shipments.csv: -99/99 means
+"no requirement". A set of shipments is compatible when the intersection of
+their temperature ranges is non-empty, and a trailer can carry it when it can
+hold a temperature inside that intersection. Trailers without temperature
+control can only carry shipments whose range covers the whole ambient range.
+"""
+import numpy as np
+
+# Ambient temperatures an uncontrolled trailer can reach during a trip
+AMBIENT_RANGE = (0.0, 30.0)
+
+# (Type, Sub_type) -> limits; Sub_type None is the base row of a Type
+TRAILER_LIMITS = {
+    ('Box', None): {'max_weight': 24000.0, 'max_ldm': 13.6, 'max_volume': 86.0,
+                    'temp_range': None, 'hazardous': True},
+    ('Box', 'Raisable'): {'max_volume': 100.0},
+    ('Box', 'Tail lift'): {'max_weight': 23000.0},
+    ('Curtain', None): {'max_weight': 24000.0, 'max_ldm': 13.6, 'max_volume': 90.0,
+                        'temp_range': None, 'hazardous': True},
+    ('Curtain', 'Raisable'): {'max_volume': 100.0},
+    ('Curtain', 'Tail lift'): {'max_weight': 23000.0},
+    ('Reefer', None): {'max_weight': 22000.0, 'max_ldm': 13.3, 'max_volume': 80.0,
+                       'temp_range': (-25.0, 25.0), 'hazardous': False},
+    ('Reefer', 'Raisable'): {'max_volume': 92.0},
+    ('Reefer', 'Tail lift'): {'max_weight': 21000.0},
+}
+
+# Used when a set is checked without a trailer: it must fit at least one trailer type
+ANY_TRAILER = 'ANY'
+
+COLUMNS = ('Weight', 'Ldm', 'Volume', 'Hazardous', 'min_temperature', 'max_temperature')
+
+
+class Violation(dict):
+    """A failed rule, as a plain dict so it can be returned with jsonify."""
+
+    def __init__(self, rule, message, value=None, limit=None, group=None):
+        super().__init__(rule=rule, message=message)
+        if value is not None:
+            self['value'] = round(float(value), 3)
+        if limit is not None:
+            self['limit'] = round(float(limit), 3)
+        if group is not None:
+            self['group'] = group
+
+
+def _clean_subtype(sub_type):
+    if sub_type is None or sub_type != sub_type or sub_type == '':  # None, NaN or empty
+        return None
+    return sub_type
+
+
+class ConstraintEngine:
+    def __init__(self, limits=TRAILER_LIMITS):
+        self._limits = {}
+        for (trailer_type, sub_type), values in limits.items():
+            if sub_type is None:
+                self._limits[(trailer_type, None)] = dict(values)
+        for (trailer_type, sub_type), values in limits.items():
+            if sub_type is not None:
+                merged = dict(self._limits[(trailer_type, None)])
+                merged.update(values)
+                self._limits[(trailer_type, sub_type)] = merged
+        # Limit table as arrays, one entry per (Type, Sub_type), for the "fits any trailer" check
+        keys = list(self._limits)
+        self._keys = keys
+        self._max_weight = np.array([self._limits[k]['max_weight'] for k in keys])
+        self._max_ldm = np.array([self._limits[k]['max_ldm'] for k in keys])
+        self._max_volume = np.array([self._limits[k]['max_volume'] for k in keys])
+        self._hazardous = np.array([self._limits[k]['hazardous'] for k in keys])
+        ranges = [self._limits[k]['temp_range'] or AMBIENT_RANGE for k in keys]
+        self._controlled = np.array([self._limits[k]['temp_range'] is not None for k in keys])
+        self._temp_low = np.array([r[0] for r in ranges])
+        self._temp_high = np.array([r[1] for r in ranges])
+
+    def limits_for(self, trailer_type, sub_type=None):
+        sub_type = _clean_subtype(sub_type)
+        limits = self._limits.get((trailer_type, sub_type)) or self._limits.get((trailer_type, None))
+        if limits is None:
+            raise KeyError(f"Unknown trailer type '{trailer_type}'.")
+        return limits
+
+    def capacity(self, field, trailer_type=ANY_TRAILER, sub_type=None):
+        """
+        Returns one limit ('max_weight', 'max_ldm', 'max_volume') of a trailer type,
+        or the largest limit over all types for ANY_TRAILER and unknown types.
+        """
+        if trailer_type != ANY_TRAILER:
+            try:
+                return self.limits_for(trailer_type, sub_type)[field]
+            except KeyError:
+                pass
+        return max(limits[field] for limits in self._limits.values())
+
+    @staticmethod
+    def _as_arrays(columns):
+        weight = np.asarray(columns['Weight'], dtype=float)
+        n = len(weight)
+        return (
+            weight,
+            np.asarray(columns['Ldm'], dtype=float),
+            np.asarray(columns['Volume'], dtype=float),
+            np.asarray(columns.get('Hazardous', np.zeros(n)), dtype=bool),
+            np.asarray(columns.get('min_temperature', np.full(n, -99.0)), dtype=float),
+            np.asarray(columns.get('max_temperature', np.full(n, 99.0)), dtype=float),
+        )
+
+    def check(self, columns, trailer_type=ANY_TRAILER, sub_type=None):
+        """
+        Validates one candidate shipment set.
+
+        Args:
+            columns (dict): Column name -> array for the shipments in the set (see COLUMNS).
+            trailer_type (str): Trailer Type from df_trailers.csv, or ANY_TRAILER to require
+                that the set fits at least one known trailer type.
+            sub_type (str, optional): Trailer Sub_type, e.g. 'Raisable' or 'Tail lift'.
+
+        Returns:
+            list: Violation dicts; empty when the set is valid.
+        """
+        weight, ldm, volume, hazardous, tmin, tmax = self._as_arrays(columns)
+        keys = np.zeros(len(weight), dtype=np.int64)
+        return self.check_groups(keys, {'Weight': weight, 'Ldm': ldm, 'Volume': volume, 'Hazardous': hazardous,
+                                        'min_temperature': tmin, 'max_temperature': tmax},
+                                 [(trailer_type, sub_type)]).get(0, [])
+
+    def check_groups(self, group_index, columns, trailers):
+        """
+        Validates many shipment sets in one pass.
+
+        Args:
+            group_index (array): For every shipment row, the position of its set in `trailers`.
+            columns (dict): Column name -> array over all rows (see COLUMNS).
+            trailers (list): Per set a (Type, Sub_type) tuple, or (ANY_TRAILER, None).
+
+        Returns:
+            dict: Set position -> list of Violation dicts, only for sets with violations.
+        """
+        group_index = np.asarray(group_index, dtype=np.int64)
+        n_groups = len(trailers)
+        if n_groups == 0:
+            return {}
+        weight, ldm, volume, hazardous, tmin, tmax = self._as_arrays(columns)
+
+        total_weight = np.bincount(group_index, weights=weight, minlength=n_groups)
+        total_ldm = np.bincount(group_index, weights=ldm, minlength=n_groups)
+        total_volume = np.bincount(group_index, weights=volume, minlength=n_groups)
+        any_hazardous = np.bincount(group_index, weights=hazardous, minlength=n_groups) > 0
+        # Intersection of the temperature requirements of each set
+        need_low = np.full(n_groups, -np.inf)
+        need_high = np.full(n_groups, np.inf)
+        np.maximum.at(need_low, group_index, tmin)
+        np.minimum.at(need_high, group_index, tmax)
+        needs_control = (need_low > AMBIENT_RANGE[0]) | (need_high < AMBIENT_RANGE[1])
+
+        violations = {}
+
+        def add(position, violation):
+            violations.setdefault(int(position), []).append(violation)
+
+        for position in np.flatnonzero(need_low > need_high):
+            add(position, Violation('temperature_conflict',
+                                    f"Shipments need incompatible temperatures "
+                                    f"({need_low[position]:g} to {need_high[position]:g})",
+                                    need_low[position], need_high[position]))
+
+        # Fits-any check: compare every ANY set against every trailer type at once
+        any_positions = np.array([i for i, (t, _) in enumerate(trailers) if t == ANY_TRAILER], dtype=np.int64)
+        if len(any_positions):
+            w = total_weight[any_positions, None]
+            fits = ((w <= self._max_weight) &
+                    (total_ldm[any_positions, None] <= self._max_ldm) &
+                    (total_volume[any_positions, None] <= self._max_volume) &
+                    (~any_hazardous[any_positions, None] | self._hazardous) &
+                    (~needs_control[any_positions, None] | self._controlled) &
+                    (need_low[any_positions, None] <= self._temp_high) &
+                    (need_high[any_positions, None] >= self._temp_low))
+            for row in np.flatnonzero(~fits.any(axis=1)):
+                position = any_positions[row]
+                add(position, Violation('no_trailer_fits',
+                                        f"No trailer type can carry {total_weight[position]:g} kg, "
+                                        f"{total_ldm[position]:g} ldm, {total_volume[position]:g} m3"
+                                        f"{' of hazardous goods' if any_hazardous[position] else ''}",
+                                        total_weight[position]))
+
+        for position, (trailer_type, sub_type) in enumerate(trailers):
+            if trailer_type == ANY_TRAILER:
+                continue
+            try:
+                limits = self.limits_for(trailer_type, sub_type)
+            except KeyError as e:
+                add(position, Violation('unknown_trailer', str(e)))
+                continue
+            label = f"{trailer_type}{' ' + _clean_subtype(sub_type) if _clean_subtype(sub_type) else ''}"
+            if total_weight[position] > limits['max_weight']:
+                add(position, Violation('weight', f"Weight exceeds {label} capacity",
+                                        total_weight[position], limits['max_weight']))
+            if total_ldm[position] > limits['max_ldm']:
+                add(position, Violation('ldm', f"Loading meters exceed {label} capacity",
+                                        total_ldm[position], limits['max_ldm']))
+            if total_volume[position] > limits['max_volume']:
+                add(position, Violation('volume', f"Volume exceeds {label} capacity",
+                                        total_volume[position], limits['max_volume']))
+            if any_hazardous[position] and not limits['hazardous']:
+                add(position, Violation('hazardous', f"Hazardous goods are not allowed on a {label}"))
+            temp_range = limits['temp_range']
+            if temp_range is None:
+                if needs_control[position]:
+                    add(position, Violation('temperature', f"{label} has no temperature control",
+                                            need_low[position], need_high[position]))
+            elif need_low[position] > temp_range[1] or need_high[position] < temp_range[0]:
+                add(position, Violation('temperature', f"{label} cannot reach the required temperature",
+                                        need_low[position], need_high[position]))
+        return violations
+
+
+engine = ConstraintEngine()
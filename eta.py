@@ -0,0 +1,137 @@
+"""
+Arrival times along the stops of a transport.
+
+A truck starts from its location at its Date/Time and drives the stops of its
+transport in order. For every stop the timeline holds the arrival, the waiting
+time until the stop's window opens, the departure after the service time, and
+how late the arrival is when the window has already closed. Drive times come
+from the approximate distances of geo.py at an average speed, so they are an
+estimate for spotting infeasible plans, not a navigation result.
+
+Each stop only depends on the departure from the stop before it, so after a
+change only the stops from the first changed one onwards are recomputed:
+propagate() takes the previous Timeline of the transport and reuses its prefix
+when the start and the leading stops are unchanged. Moving a stop near the end
+of a long route therefore recomputes just the tail.
+"""
+import datetime
+
+import geo
+
+
+class EtaModel:
+    """Drive and service time assumptions."""
+
+    def __init__(self, speed_kmh=70.0, road_factor=1.25, service_minutes=30.0):
+        """
+        Args:
+            speed_kmh (float): Average driving speed.
+            road_factor (float): Road distance per km of great-circle distance.
+            service_minutes (float): Time spent at every stop for loading or unloading.
+        """
+        self.speed_kmh = speed_kmh
+        self.road_factor = road_factor
+        self.service_minutes = service_minutes
+
+    def distance_km(self, a, b):
+        if a is None or b is None:
+            return 0.0
+        return geo.distance_km(a, b) * self.road_factor
+
+    def drive_minutes(self, distance_km):
+        # Whole minutes; the distances are not precise enough for more
+        return round(distance_km / self.speed_kmh * 60.0)
+
+
+def _minutes(delta):
+    return round(delta.total_seconds() / 60.0, 1)
+
+
+class Timeline:
+    """Result of propagate(): one entry per stop, in route order."""
+
+    def __init__(self, start, inputs, stops, reused):
+        self.start = start
+        self.inputs = inputs
+        self.stops = stops
+        # Stops taken over from the previous timeline without recomputing them
+        self.reused = reused
+
+    @property
+    def late_stops(self):
+        return [stop for stop in self.stops if stop['late_minutes'] > 0]
+
+    @property
+    def end(self):
+        return self.stops[-1]['departure'] if self.stops else None
+
+    def summary(self):
+        return {
+            'start': self.start[1],
+            'end': self.end,
+            'distance_km': round(sum(stop['distance_km'] for stop in self.stops), 1),
+            'wait_minutes': round(sum(stop['wait_minutes'] for stop in self.stops), 1),
+            'late_stops': len(self.late_stops),
+            'late_minutes': round(sum(stop['late_minutes'] for stop in self.stops), 1),
+        }
+
+
+def propagate(model, start, stops, previous=None):
+    """
+    Computes the timeline of a route.
+
+    Args:
+        model (EtaModel): Drive and service times.
+        start (tuple): (point, datetime) the truck leaves from; either may be None. Without a
+            start time the first stop is reached when its window opens.
+        stops (list): (stop ID, point, earliest, latest) per stop in route order; earliest and
+            latest are datetimes or None for an open window.
+        previous (Timeline, optional): Earlier timeline of the same route; its entries are reused
+            up to the first stop that differs from `stops`.
+
+    Returns:
+        Timeline
+    """
+    inputs = [tuple(stop) for stop in stops]
+    reused = 0
+    if previous is not None and previous.start == start:
+        for old, new in zip(previous.inputs, inputs):
+            if old != new:
+                break
+            reused += 1
+    results = previous.stops[:reused] if reused else []
+
+    point, clock = start
+    if results:
+        # Continue from the last reused stop (or the last one before it with a known location)
+        point = next((stop[1] for stop in reversed(inputs[:reused]) if stop[1] is not None), point)
+        clock = results[-1]['departure']
+    service = datetime.timedelta(minutes=model.service_minutes)
+    for sequence, (stop_id, stop_point, earliest, latest) in enumerate(inputs[reused:], start=reused + 1):
+        distance = model.distance_km(point, stop_point)
+        if clock is None:
+            arrival = earliest
+        else:
+            arrival = clock + datetime.timedelta(minutes=model.drive_minutes(distance))
+        if arrival is None:
+            begin = departure = None
+            wait = late = 0.0
+        else:
+            begin = max(arrival, earliest) if earliest is not None else arrival
+            wait = _minutes(begin - arrival)
+            late = _minutes(arrival - latest) if latest is not None and arrival > latest else 0.0
+            departure = begin + service
+        results.append({
+            'id': stop_id,
+            'sequence': sequence,
+            'distance_km': round(distance, 1),
+            'arrival': arrival,
+            'wait_minutes': wait,
+            'departure': departure,
+            'earliest': earliest,
+            'latest': latest,
+            'late_minutes': late,
+        })
+        point = stop_point if stop_point is not None else point
+        clock = departure
+    return Timeline(start, inputs, results, reused)
@@ -0,0 +1,79 @@
+"""
+Cache of pre-rendered list rows.
+
+The list views render one small row template per shipment, transport or
+truck. A row is rendered once and kept together with the version of the data
+it was rendered from; the version is the tuple of values the row displays,
+with their types, so any change to a shown field produces a new version and a
+fresh render, and no invalidation hooks are needed on the mutation paths.
+Rendering an unchanged row again is a dict lookup and a tuple comparison
+instead of a Jinja render.
+
+The cache is bounded and evicts the least recently used rows first.
+"""
+import collections
+import threading
+
+from markupsafe import Markup
+
+
+def _version(value):
+    # NaN never compares equal to itself, which would make every row with a missing value a cache miss.
+    # The type is part of the version: 1, 1.0 and True compare equal but render differently.
+    if value != value:
+        return None
+    return type(value), value
+
+
+class FragmentCache:
+    def __init__(self, jinja_env, capacity=50000):
+        """
+        Args:
+            jinja_env (jinja2.Environment): Environment the row templates are loaded from.
+            capacity (int): Maximum number of cached rows over all templates.
+        """
+        self.jinja_env = jinja_env
+        self.capacity = capacity
+        self._fragments = collections.OrderedDict()  # (template, key) -> (version, Markup)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, template_name, key, row, **context):
+        """
+        Returns the rendered row, from the cache when the row's displayed values are unchanged.
+
+        Args:
+            template_name (str): Row template, rendered with the row as `row`.
+            key: Identity of the row within the template, e.g. the Shipment_ID.
+            row (dict): Values shown by the row; they also form its version.
+            **context: Extra template variables; they must not vary per request.
+        """
+        cache_key = (template_name, key)
+        version = tuple(_version(value) for value in row.values())
+        with self._lock:
+            cached = self._fragments.get(cache_key)
+            if cached is not None and cached[0] == version:
+                self._fragments.move_to_end(cache_key)
+                self.hits += 1
+                return cached[1]
+        fragment = Markup(self.jinja_env.get_template(template_name).render(row=row, **context))
+        with self._lock:
+            self.misses += 1
+            self._fragments[cache_key] = (version, fragment)
+            self._fragments.move_to_end(cache_key)
+            while len(self._fragments) > self.capacity:
+                self._fragments.popitem(last=False)
+        return fragment
+
+    def rows(self, template_name, rows, key_field, **context):
+        """Lazily renders a list of rows, for streaming them into a page."""
+        for row in rows:
+            yield self.render(template_name, row[key_field], row, **context)
+
+    def clear(self):
+        with self._lock:
+            self._fragments.clear()
+
+    def __len__(self):
+        return len(self._fragments)
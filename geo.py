@@ -0,0 +1,224 @@
+"""
+Approximate locations and a grid index for stops.
+
+The data has no coordinates, only a country and a postal code per stop. Postal
+codes are mapped to the centroid of their postal region (Denmark and Germany by
+leading digit, Greece by leading digit with a few larger cities split out, France
+by département), and unknown codes fall back to the centroid of the country.
+Distances between such points are accurate to roughly 50-100 km, which is
+enough to rank detours but not to plan drive times.
+
+GridIndex buckets keys (e.g. transports) by the grid cells of their points, so
+the keys with a point near a location are found by looking at a few cells
+instead of at every key. cheapest_insertion() finds where a pickup/delivery
+pair adds the least distance to an existing route.
+"""
+import functools
+import math
+
+EARTH_RADIUS_KM = 6371.0
+
+# Country centroids (lat, lon), used when a postal code is unknown
+COUNTRY_CENTROIDS = {
+    'AT': (47.6, 14.1), 'BE': (50.6, 4.6), 'CH': (46.8, 8.2), 'CZ': (49.8, 15.5), 'DE': (51.2, 10.4),
+    'DK': (56.0, 9.9), 'ES': (40.2, -3.6), 'FI': (62.0, 25.7), 'FR': (46.6, 2.4), 'GB': (52.8, -1.6),
+    'GR': (39.1, 22.0), 'IE': (53.2, -8.1), 'IT': (42.8, 12.5), 'LU': (49.8, 6.1), 'NL': (52.2, 5.5),
+    'NO': (60.5, 9.0), 'PL': (52.1, 19.4), 'PT': (39.6, -8.0), 'SE': (60.1, 15.6),
+}
+
+# Digits of the postal code per country (for restoring leading zeros lost in numeric columns)
+POSTAL_DIGITS = {'DK': 4, 'DE': 5, 'FR': 5, 'GR': 5}
+
+# Postal code prefix -> region centroid; the longest matching prefix wins
+POSTAL_REGIONS = {
+    'DK': {
+        '1': (55.68, 12.57), '2': (55.68, 12.45), '3': (55.95, 12.30), '37': (55.10, 14.90),
+        '4': (55.40, 11.80), '5': (55.30, 10.40), '6': (55.30, 9.20), '7': (56.20, 9.00),
+        '8': (56.20, 10.00), '9': (57.00, 9.90),
+    },
+    'DE': {
+        '0': (51.10, 13.00), '1': (52.50, 13.40), '2': (53.60, 9.90), '3': (52.20, 9.90),
+        '4': (51.40, 7.00), '5': (50.70, 7.00), '6': (50.10, 8.60), '7': (48.70, 9.10),
+        '8': (48.20, 11.60), '9': (49.60, 11.00),
+    },
+    'GR': {
+        '1': (37.98, 23.73), '2': (37.90, 22.00), '26': (38.25, 21.73), '3': (38.90, 22.40),
+        '38': (39.36, 22.94), '4': (39.60, 22.00), '45': (39.66, 20.85), '5': (40.50, 22.30),
+        '54': (40.64, 22.94), '55': (40.64, 22.94), '56': (40.64, 22.94), '6': (41.00, 24.50),
+        '7': (35.30, 25.10), '73': (35.51, 24.02), '8': (37.80, 26.00),
+    },
+    # Départements (first two digits), at the prefecture
+    'FR': {
+        '01': (46.20, 5.22), '02': (49.56, 3.62), '03': (46.57, 3.33), '04': (44.09, 6.24), '05': (44.56, 6.08),
+        '06': (43.70, 7.26), '07': (44.73, 4.60), '08': (49.77, 4.72), '09': (42.96, 1.60), '10': (48.30, 4.08),
+        '11': (43.21, 2.35), '12': (44.35, 2.57), '13': (43.30, 5.40), '14': (49.18, -0.37), '15': (44.93, 2.44),
+        '16': (45.65, 0.16), '17': (46.16, -1.15), '18': (47.08, 2.40), '19': (45.27, 1.77), '20': (41.93, 8.74),
+        '21': (47.32, 5.04), '22': (48.51, -2.76), '23': (46.17, 1.87), '24': (45.18, 0.72), '25': (47.24, 6.02),
+        '26': (44.93, 4.89), '27': (49.02, 1.15), '28': (48.45, 1.49), '29': (48.39, -4.49), '30': (43.84, 4.36),
+        '31': (43.60, 1.44), '32': (43.65, 0.59), '33': (44.84, -0.58), '34': (43.61, 3.88), '35': (48.11, -1.68),
+        '36': (46.81, 1.69), '37': (47.39, 0.69), '38': (45.19, 5.72), '39': (46.67, 5.55), '40': (43.89, -0.50),
+        '41': (47.59, 1.33), '42': (45.43, 4.39), '43': (45.04, 3.88), '44': (47.22, -1.55), '45': (47.90, 1.90),
+        '46': (44.45, 1.44), '47': (44.20, 0.62), '48': (44.52, 3.50), '49': (47.47, -0.55), '50': (49.12, -1.09),
+        '51': (49.26, 4.03), '52': (48.11, 5.14), '53': (48.07, -0.77), '54': (48.69, 6.18), '55': (48.77, 5.16),
+        '56': (47.66, -2.76), '57': (49.12, 6.18), '58': (46.99, 3.16), '59': (50.63, 3.06), '60': (49.43, 2.08),
+        '61': (48.43, 0.09), '62': (50.29, 2.78), '63': (45.78, 3.08), '64': (43.30, -0.37), '65': (43.23, 0.08),
+        '66': (42.70, 2.90), '67': (48.58, 7.75), '68': (47.75, 7.34), '69': (45.76, 4.84), '70': (47.62, 6.15),
+        '71': (46.31, 4.83), '72': (48.00, 0.20), '73': (45.57, 5.92), '74': (45.90, 6.13), '75': (48.86, 2.35),
+        '76': (49.44, 1.10), '77': (48.54, 2.66), '78': (48.80, 2.13), '79': (46.32, -0.46), '80': (49.89, 2.30),
+        '81': (43.93, 2.15), '82': (44.02, 1.35), '83': (43.12, 5.93), '84': (43.95, 4.81), '85': (46.67, -1.43),
+        '86': (46.58, 0.34), '87': (45.83, 1.26), '88': (48.17, 6.45), '89': (47.80, 3.57), '90': (47.64, 6.86),
+        '91': (48.63, 2.44), '92': (48.89, 2.20), '93': (48.91, 2.44), '94': (48.79, 2.46), '95': (49.04, 2.08),
+    },
+}
+
+
+def postal_text(country, postal_code):
+    """
+    A postal code as text without spaces, with the leading zeros of fixed-length codes (see
+    POSTAL_DIGITS) restored, e.g. 1099 in DE -> '01099'. Missing codes become ''.
+    """
+    if postal_code is None or postal_code != postal_code:
+        return ''
+    if isinstance(postal_code, float):
+        postal_code = int(postal_code)
+    text = ''.join(str(postal_code).split())
+    digits = POSTAL_DIGITS.get(country)
+    if digits and text.isdigit() and 0 < len(text) < digits:
+        text = text.zfill(digits)
+    return text
+
+
+@functools.lru_cache(maxsize=65536)
+def locate(country, postal_code):
+    """
+    Returns the approximate (lat, lon) of a postal code, or None when the country is unknown.
+    """
+    country = str(country or '').strip().upper()
+    regions = POSTAL_REGIONS.get(country)
+    if regions:
+        text = postal_text(country, postal_code)
+        for length in range(min(len(text), 3), 0, -1):
+            point = regions.get(text[:length])
+            if point is not None:
+                return point
+    return COUNTRY_CENTROIDS.get(country)
+
+
+# Points come from the region tables, so there are few distinct pairs
+@functools.lru_cache(maxsize=65536)
+def distance_km(a, b):
+    """Great-circle distance between two (lat, lon) points; 0 if either is None."""
+    if a is None or b is None:
+        return 0.0
+    lat1, lon1 = math.radians(a[0]), math.radians(a[1])
+    lat2, lon2 = math.radians(b[0]), math.radians(b[1])
+    h = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(h)))
+
+
+def cheapest_insertion(route, pickup, delivery, pickup_penalty=None, delivery_penalty=None):
+    """
+    Finds where to insert a pickup and its delivery into a route with the least extra distance.
+
+    Gap g is the position before route[g] (g == len(route) appends); the delivery goes into the
+    same gap as the pickup (right after it) or a later one. Runs in O(n) for a route of n stops.
+
+    Args:
+        route (list): (lat, lon) points of the stops in order; None for unknown locations.
+        pickup (tuple): Point of the pickup.
+        delivery (tuple): Point of the delivery.
+        pickup_penalty (list, optional): Extra cost per gap (len(route) + 1 values) for the pickup,
+            e.g. for time windows that do not fit there.
+        delivery_penalty (list, optional): Same for the delivery.
+
+    Returns:
+        tuple: (extra cost, pickup gap, delivery gap)
+    """
+    n = len(route)
+    pickup_penalty = pickup_penalty or [0.0] * (n + 1)
+    delivery_penalty = delivery_penalty or [0.0] * (n + 1)
+
+    def edge(a, b):
+        return 0.0 if a is None or b is None else distance_km(a, b)
+
+    def insert_cost(point, gap):
+        prev_point = route[gap - 1] if gap > 0 else None
+        next_point = route[gap] if gap < n else None
+        return edge(prev_point, point) + edge(point, next_point) - edge(prev_point, next_point)
+
+    delivery_costs = [insert_cost(delivery, gap) + delivery_penalty[gap] for gap in range(n + 1)]
+    # Cheapest delivery gap strictly after each gap, from the back
+    best_after = [None] * (n + 1)
+    best = None
+    for gap in range(n, -1, -1):
+        best_after[gap] = best
+        if best is None or delivery_costs[gap] < delivery_costs[best]:
+            best = gap
+
+    result = None
+    for gap in range(n + 1):
+        prev_point = route[gap - 1] if gap > 0 else None
+        next_point = route[gap] if gap < n else None
+        pickup_cost = insert_cost(pickup, gap) + pickup_penalty[gap]
+        # Both stops in the same gap, pickup first
+        together = (edge(prev_point, pickup) + edge(pickup, delivery) + edge(delivery, next_point)
+                    - edge(prev_point, next_point) + pickup_penalty[gap] + delivery_penalty[gap])
+        candidates = [(together, gap, gap)]
+        if best_after[gap] is not None:
+            candidates.append((pickup_cost + delivery_costs[best_after[gap]], gap, best_after[gap]))
+        for candidate in candidates:
+            if result is None or candidate[0] < result[0]:
+                result = candidate
+    return result
+
+
+class GridIndex:
+    """Keys bucketed by the grid cells (cell_degrees x cell_degrees) of their points."""
+
+    def __init__(self, cell_degrees=0.5):
+        self.cell_degrees = cell_degrees
+        self._cells = {}  # (row, column) -> set of keys
+        self._keys = {}   # key -> set of cells
+
+    def _cell(self, point):
+        return (math.floor(point[0] / self.cell_degrees), math.floor(point[1] / self.cell_degrees))
+
+    def put(self, key, points):
+        """Sets the points of a key, replacing earlier ones; points that are None are skipped."""
+        cells = {self._cell(point) for point in points if point is not None}
+        old = self._keys.get(key, set())
+        for cell in old - cells:
+            bucket = self._cells[cell]
+            bucket.discard(key)
+            if not bucket:
+                del self._cells[cell]
+        for cell in cells - old:
+            self._cells.setdefault(cell, set()).add(key)
+        if cells:
+            self._keys[key] = cells
+        else:
+            self._keys.pop(key, None)
+
+    def remove(self, key):
+        self.put(key, ())
+
+    def near(self, point, radius_km):
+        """Returns the keys with a point in a cell overlapping the radius around `point`."""
+        if point is None:
+            return set()
+        lat_cells = math.ceil(radius_km / (111.0 * self.cell_degrees))
+        # A degree of longitude shrinks with the cosine of the latitude
+        lon_km = 111.0 * max(math.cos(math.radians(min(abs(point[0]) + radius_km / 111.0, 89.0))), 0.01)
+        lon_cells = math.ceil(radius_km / (lon_km * self.cell_degrees))
+        row, column = self._cell(point)
+        keys = set()
+        for r in range(row - lat_cells, row + lat_cells + 1):
+            for c in range(column - lon_cells, column + lon_cells + 1):
+                bucket = self._cells.get((r, c))
+                if bucket:
+                    keys |= bucket
+        return keys
+
+    def __len__(self):
+        return len(self._keys)
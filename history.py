@@ -0,0 +1,142 @@
+"""
+Undo/redo of planning operations.
+
+Every mutating endpoint records a Command holding two callables: one that
+reverts the change and one that re-applies it. Commands are kept per user in a
+bounded log (the oldest ones fall off), and several steps can be undone or
+redone as one batch: if any step of a batch fails, the steps already taken are
+rolled back so the planning state is left as it was.
+
+The same events (do, undo, redo) are appended to a bounded audit trail, which
+records who changed what and when.
+"""
+import collections
+import itertools
+import threading
+import time
+
+
+class HistoryConflict(Exception):
+    """Raised by an undo/redo callable when the state has changed since the command ran."""
+
+
+class Command:
+    __slots__ = ('id', 'user', 'action', 'description', 'undo', 'redo', 'tables', 'timestamp')
+
+    def __init__(self, action, description, undo, redo, tables=()):
+        """
+        Args:
+            action (str): Name of the operation, e.g. 'add_shipment'.
+            description (str): Human readable summary for the history and audit trail.
+            undo (callable): Reverts the change; raises HistoryConflict if that is no longer possible.
+            redo (callable): Re-applies the change; raises HistoryConflict if that is no longer possible.
+            tables (iterable): Persisted tables the command touches, written once per batch.
+        """
+        self.id = None
+        self.user = None
+        self.action = action
+        self.description = description
+        self.undo = undo
+        self.redo = redo
+        self.tables = frozenset(tables)
+        self.timestamp = None
+
+    def summary(self):
+        return {
+            'id': self.id,
+            'action': self.action,
+            'description': self.description,
+            'timestamp': self.timestamp,
+        }
+
+
+class History:
+    def __init__(self, depth=50, audit_capacity=1000, on_event=None):
+        """
+        Args:
+            depth (int): Number of undoable commands kept per user.
+            audit_capacity (int): Number of audit entries kept in memory.
+            on_event (callable, optional): Called with every audit entry, e.g. to log it.
+        """
+        self.depth = depth
+        self.on_event = on_event
+        self._undo = {}  # user -> deque of commands, most recent last
+        self._redo = {}  # user -> list of undone commands, most recently undone last
+        self._audit = collections.deque(maxlen=audit_capacity)
+        self._ids = itertools.count(1)
+        self._lock = threading.RLock()
+
+    def _audit_event(self, event, command):
+        entry = {
+            'time': time.time(),
+            'user': command.user,
+            'event': event,
+            'command': command.id,
+            'action': command.action,
+            'description': command.description,
+        }
+        self._audit.append(entry)
+        if self.on_event is not None:
+            self.on_event(entry)
+
+    def record(self, user, command):
+        """Stores a command that has just been applied; clears the user's redo stack."""
+        with self._lock:
+            command.id = next(self._ids)
+            command.user = user
+            command.timestamp = time.time()
+            self._undo.setdefault(user, collections.deque(maxlen=self.depth)).append(command)
+            self._redo.pop(user, None)
+            self._audit_event('do', command)
+        return command
+
+    def undo(self, user, steps=1):
+        """
+        Undoes the last `steps` commands of a user as one batch.
+
+        Returns:
+            list: The undone commands, most recent first.
+
+        Raises:
+            HistoryConflict: When a step cannot be undone; no step is applied then.
+        """
+        return self._replay(user, steps, self._undo.get(user), self._redo.setdefault(user, []), 'undo', 'redo')
+
+    def redo(self, user, steps=1):
+        """Redoes the last `steps` undone commands of a user as one batch; see undo()."""
+        return self._replay(user, steps, self._redo.get(user), self._undo.setdefault(
+            user, collections.deque(maxlen=self.depth)), 'redo', 'undo')
+
+    def _replay(self, user, steps, source, target, method, inverse):
+        with self._lock:
+            if not source:
+                return []
+            batch = [source[-i] for i in range(1, min(steps, len(source)) + 1)]
+            done = []
+            try:
+                for command in batch:
+                    getattr(command, method)()
+                    done.append(command)
+            except Exception:
+                # Roll back the part of the batch that was applied, in reverse order
+                for command in reversed(done):
+                    getattr(command, inverse)()
+                raise
+            for command in batch:
+                source.pop()
+                target.append(command)
+                self._audit_event(method, command)
+            return batch
+
+    def stacks(self, user):
+        with self._lock:
+            return {
+                'undo': [c.summary() for c in reversed(self._undo.get(user, ()))],
+                'redo': [c.summary() for c in reversed(self._redo.get(user, ()))],
+            }
+
+    def audit(self, user=None, limit=100):
+        """Returns the most recent audit entries, newest first, optionally for one user."""
+        with self._lock:
+            entries = [e for e in reversed(self._audit) if user is None or e['user'] == user]
+        return entries[:limit]
@@ -0,0 +1,335 @@
+"""
+Bulk ingestion of daily shipment dumps (SEST0408.xlsx, SEST0508.xlsx, ...) into df_shipments.csv.
+
+A dump has one row per stop: column 'Type' is 'P' for the pickup and 'D' for
+the delivery of a shipment, and 'Expected Handling' holds the stop's date and
+time window ('2026-08-04 08:00-12:00'). The pickup and the delivery of one
+shipment can be in different files, so ingestion runs in two steps:
+
+1. Every file is parsed and normalized in its own worker process (openpyxl
+   parsing is the slow part and is CPU-bound): columns are renamed to the
+   df_shipments.csv schema, postal codes are cleaned up, handling times are
+   split into date and window, Services are normalized. The result is one row
+   per (shipment, stop type).
+2. The parent process combines the stops of all files into shipments, keeps
+   those with both a pickup and a delivery, drops shipment IDs that are already
+   in the store (the store wins, as in the notebook's process_shipment_files)
+   and writes the merged table once, atomically.
+
+Usage:
+    python ingest.py SEST0408.xlsx SEST0508.xlsx --data-dir . --workers 4
+    python ingest.py dumps/*.xlsx --dry-run
+
+The web app reads df_shipments.csv on start-up, so a running server picks up
+shipments ingested from the command line after a restart. An ingest job
+(POST /jobs with kind 'ingest') runs the same merge in a worker and loads the
+new shipments into the running server.
+"""
+import argparse
+import concurrent.futures
+import multiprocessing
+import os
+import tempfile
+import time
+
+import pandas as pd
+
+import validation
+from geo import POSTAL_DIGITS
+
+# Dump column -> df_shipments.csv column, for the columns copied as they are
+DUMP_COLUMNS = {
+    'Transport': 'Transport',
+    'Collection Name': 'Collection_Name',
+    'Collection City': 'Collection_City',
+    'Collection Address': 'Collection_Address',
+    'Collection Postal Code': 'Collection_Postal_Code',
+    'Collection Country': 'Collection_Country',
+    'Delivery Name': 'Delivery_Name',
+    'Delivery City': 'Delivery_City',
+    'Delivery Address': 'Delivery_Address',
+    'Delivery Postal Code': 'Delivery_Postal_Code',
+    'Delivery Country': 'Delivery_Country',
+    'Total Weight': 'Weight',
+    'Total Volume': 'Volume',
+    'Ldm': 'Ldm',
+    'Content': 'Content',
+    'Expected Items': 'Units',
+    'Items of Type': 'Unit_type',
+    'Haz': 'Hazardous',
+    'Cost': 'Cost',
+    'Incoterm': 'Incoterm',
+    'Customer': 'Customer',
+    'Loading Instructions': 'Loading_Instructions',
+    'Customer Reference': 'Customer_Reference',
+    'Additional Information': 'Additional_Information',
+    'Services': 'Services',
+}
+REQUIRED_DUMP_COLUMNS = ('Shipment', 'Type', 'Expected Handling')
+
+# Columns of df_shipments.csv, used when the store does not exist yet
+SHIPMENT_COLUMNS = [
+    'Shipment_ID', 'Transport', 'Department', 'Pickup_time', 'Pickup_date', 'Delivery_time', 'Delivery_date',
+    'Collection_Name', 'Collection_City', 'Collection_Address', 'Collection_Postal_Code', 'Collection_Country',
+    'Delivery_Name', 'Delivery_City', 'Delivery_Address', 'Delivery_Postal_Code', 'Delivery_Country',
+    'Weight', 'Volume', 'Ldm', 'Content', 'Units', 'Unit_type', 'Hazardous', 'Cost', 'Finance_Department',
+    'Incoterm', 'Customer', 'Loading_Instructions', 'Customer_Reference', 'Additional_Information', 'Services',
+    'min_temperature', 'max_temperature', 'stops',
+]
+# Values of schema columns a dump does not provide
+DEFAULTS = {'Cost': 0.0, 'min_temperature': -99.0, 'max_temperature': 99.0}
+
+
+def read_dump(path):
+    """Reads a dump file; .xlsx/.xls through pandas/openpyxl, anything else as CSV."""
+    if os.path.splitext(path)[1].lower() in ('.xlsx', '.xlsm', '.xls'):
+        return pd.read_excel(path, header=0)
+    return pd.read_csv(path)
+
+
+def clean_postal_codes(codes, countries=None):
+    """
+    Postal codes as text without spaces or a trailing '.0' (from numeric cells), with the
+    leading zeros of countries with fixed-length codes restored. Missing codes become ''.
+    """
+    text = codes.astype('string').fillna('').str.replace(r'\s+', '', regex=True).str.replace(
+        r'\.0+$', '', regex=True)
+    if countries is not None:
+        countries = countries.astype('string').fillna('').str.strip().str.upper()
+        for country, digits in POSTAL_DIGITS.items():
+            short = (countries == country) & text.str.fullmatch(r'\d+') & (text.str.len() < digits)
+            text = text.mask(short, text.str.zfill(digits))
+    return text.astype(object)
+
+
+def split_handling(values):
+    """
+    Splits 'Expected Handling' into (date 'YYYY-MM-DD', window 'HH:MM-HH:MM').
+
+    Text in the dump format 'YYYY-MM-DD HH:MM-HH:MM' is split at the space; other values
+    (Excel datetimes) are parsed as a single moment, which becomes a window of length zero.
+    """
+    text = values.astype('string').str.strip()
+    parts = text.str.split(' ', n=1, expand=True).reindex(columns=[0, 1])
+    is_window = parts[1].str.fullmatch(r'\d{1,2}:\d{2}-\d{1,2}:\d{2}').fillna(False).astype(bool)
+    dates = pd.to_datetime(parts[0].where(is_window, text), errors='coerce', format='mixed')
+    moments = dates.dt.strftime('%H:%M')
+    windows = parts[1].where(is_window, moments + '-' + moments)
+    return dates.dt.strftime('%Y-%m-%d').astype(object), windows.astype(object)
+
+
+def normalize_services(values):
+    """Services as a sorted, comma-separated list of unique upper-case codes ('' for none)."""
+    def normalize(value):
+        if not isinstance(value, str):
+            return ''
+        codes = {code.strip().upper() for code in value.replace(';', ',').split(',')}
+        return ','.join(sorted(code for code in codes if code))
+    return values.map(normalize)
+
+
+def parse_dump(path):
+    """
+    Reads and normalizes one dump file; runs in a worker process.
+
+    Returns:
+        dict: 'path', 'rows' (rows read), 'stops' (DataFrame, one row per shipment and stop
+        type, in df_shipments.csv column names plus Shipment_ID, Type, date and window),
+        'seconds' and 'error' (None, or why the file was skipped).
+    """
+    start = time.perf_counter()
+    result = {'path': path, 'rows': 0, 'stops': None, 'seconds': 0.0, 'error': None}
+    try:
+        dump = read_dump(path)
+        missing = [column for column in REQUIRED_DUMP_COLUMNS if column not in dump.columns]
+        if missing:
+            raise ValueError(f"missing columns {missing}")
+        result['rows'] = len(dump)
+
+        stops = dump[[column for column in DUMP_COLUMNS if column in dump.columns]].rename(columns=DUMP_COLUMNS)
+        stops.insert(0, 'Shipment_ID', dump['Shipment'].astype('string').str.strip().astype(object))
+        stops.insert(1, 'Type', dump['Type'].astype('string').str.strip().str.upper().astype(object))
+        stops['date'], stops['window'] = split_handling(dump['Expected Handling'])
+        stops = stops[stops['Shipment_ID'].notna() & stops['Type'].isin(['P', 'D'])]
+
+        for side in ('Collection', 'Delivery'):
+            column = f'{side}_Postal_Code'
+            if column in stops.columns:
+                stops[column] = clean_postal_codes(stops[column], stops.get(f'{side}_Country'))
+        if 'Hazardous' in stops.columns:
+            haz = stops['Hazardous']
+            stops['Hazardous'] = haz.astype('string').str.strip().str.lower().isin(['yes', 'true', '1']).astype(bool)
+        if 'Services' in stops.columns:
+            stops['Services'] = normalize_services(stops['Services'])
+        # First stop of each type per shipment, like the notebook's groupby(...).agg('first')
+        result['stops'] = stops.drop_duplicates(['Shipment_ID', 'Type'], keep='first')
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+
+def combine_stops(stops, department=None):
+    """
+    Combines pickup and delivery stops into one row per shipment.
+
+    Shipment fields are taken from the pickup row, falling back to the delivery row. The
+    Department is `department` or, as in the notebook, the first three letters of the pickup's
+    Transport followed by 'ST'.
+
+    Returns:
+        tuple: (shipments DataFrame in df_shipments.csv columns, number of incomplete shipments)
+    """
+    # Files were parsed in the order given; the first file with a stop wins
+    stops = stops.drop_duplicates(['Shipment_ID', 'Type'], keep='first')
+    pickups = stops[stops['Type'] == 'P'].set_index('Shipment_ID')
+    deliveries = stops[stops['Type'] == 'D'].set_index('Shipment_ID')
+    complete = pickups.index.intersection(deliveries.index)
+    incomplete = stops['Shipment_ID'].nunique() - len(complete)
+
+    pickups, deliveries = pickups.loc[complete], deliveries.loc[complete]
+    shipments = pickups.drop(columns=['Type', 'date', 'window']).combine_first(
+        deliveries.drop(columns=['Type', 'date', 'window']))
+    shipments['Pickup_date'], shipments['Pickup_time'] = pickups['date'], pickups['window']
+    shipments['Delivery_date'], shipments['Delivery_time'] = deliveries['date'], deliveries['window']
+
+    if department is not None:
+        shipments['Department'] = department
+    elif 'Transport' in pickups.columns:
+        transport = pickups['Transport'].astype('string')
+        shipments['Department'] = (transport.str.slice(0, 3) + 'ST').where(transport.str.len() >= 3).astype(object)
+    else:
+        shipments['Department'] = None
+    # Ingested shipments are unplanned
+    shipments['Transport'] = None
+    shipments['Finance_Department'] = shipments['Department']
+    shipments = shipments.reset_index().rename(columns={'index': 'Shipment_ID'})
+    return shipments, incomplete
+
+
+def merge_into_store(shipments, store_path, dry_run=False):
+    """
+    Appends shipments whose ID is not in the store yet and writes the store once.
+
+    The file is written to a temporary file in the same directory and moved into place, so
+    readers never see a partly written store.
+
+    Returns:
+        dict: 'added', 'duplicates' (already in the store), 'quarantined' (failing validation, see
+        validation.py) and 'total' rows after the merge.
+    """
+    if os.path.exists(store_path):
+        store = pd.read_csv(store_path, dtype={'Transport': object})
+    else:
+        store = pd.DataFrame(columns=SHIPMENT_COLUMNS)
+    new = shipments[~shipments['Shipment_ID'].isin(store['Shipment_ID'])]
+    # Columns missing in the dumps get the store's defaults; extra ones are dropped
+    new = new.reindex(columns=store.columns)
+    for column, value in DEFAULTS.items():
+        if column in new.columns:
+            new[column] = new[column].fillna(value)
+    if 'Hazardous' in new.columns:
+        new['Hazardous'] = new['Hazardous'].fillna(False).astype(bool)
+    duplicates = len(shipments) - len(new)
+    # Rows the app would quarantine on load are not stored at all
+    new, report = validation.validate_shipments(new)
+    counts = {'added': len(new), 'duplicates': duplicates, 'quarantined': report['quarantined'],
+              'total': len(store) + len(new)}
+    if dry_run or new.empty:
+        return counts
+
+    merged = pd.concat([store, new], ignore_index=True) if len(store) else new
+    directory = os.path.dirname(os.path.abspath(store_path))
+    fd, temp_path = tempfile.mkstemp(prefix='.df_shipments.', suffix='.csv', dir=directory)
+    try:
+        with os.fdopen(fd, 'w', newline='') as f:
+            merged.to_csv(f, index=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, store_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return counts
+
+
+def ingest(paths, data_dir, workers=None, department=None, dry_run=False, on_file=None):
+    """
+    Parses dump files in parallel and merges their shipments into df_shipments.csv.
+
+    Args:
+        paths (list): Dump files, in priority order (the first file with a stop wins).
+        data_dir (str): Directory holding df_shipments.csv.
+        workers (int, optional): Worker processes; defaults to one per CPU, at most one per file.
+        department (str, optional): Department for all shipments instead of deriving it.
+        dry_run (bool): Parse and merge, but do not write the store.
+        on_file (callable, optional): Called with each file's report as soon as it is parsed.
+
+    Returns:
+        dict: Per-file reports ('path', 'rows', 'stops', 'seconds', 'error') under 'files'
+        and the totals of the merge.
+    """
+    start = time.perf_counter()
+    workers = max(1, min(workers or os.cpu_count() or 1, len(paths)))
+    results = {}
+    if workers == 1:
+        for path in paths:
+            results[path] = parse_dump(path)
+            if on_file is not None:
+                on_file(_file_report(results[path]))
+    else:
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+            futures = {executor.submit(parse_dump, path): path for path in paths}
+            for future in concurrent.futures.as_completed(futures):
+                results[futures[future]] = future.result()
+                if on_file is not None:
+                    on_file(_file_report(results[futures[future]]))
+    parse_seconds = time.perf_counter() - start
+
+    frames = [results[path]['stops'] for path in paths if results[path]['stops'] is not None]
+    report = {'files': [_file_report(results[path]) for path in paths], 'workers': workers,
+              'parse_seconds': round(parse_seconds, 3)}
+    if frames:
+        shipments, incomplete = combine_stops(pd.concat(frames, ignore_index=True), department)
+        counts = merge_into_store(shipments, os.path.join(data_dir, 'df_shipments.csv'), dry_run)
+    else:
+        shipments, incomplete, counts = (), 0, {'added': 0, 'duplicates': 0, 'quarantined': 0, 'total': None}
+    report.update(shipments=len(shipments), incomplete=incomplete, **counts, dry_run=dry_run,
+                  seconds=round(time.perf_counter() - start, 3))
+    return report
+
+
+def _file_report(result):
+    stops = result['stops']
+    return {'path': result['path'], 'rows': result['rows'], 'stops': 0 if stops is None else len(stops),
+            'seconds': round(result['seconds'], 3), 'error': result['error']}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('paths', nargs='+', help='Dump files (.xlsx, or .csv with the same columns)')
+    parser.add_argument('--data-dir', default=os.environ.get('MOBILITY_DATA_DIR', os.path.dirname(
+        os.path.abspath(__file__))), help='Directory with df_shipments.csv')
+    parser.add_argument('--workers', type=int, help='Worker processes (default: one per CPU)')
+    parser.add_argument('--department', help='Department of all ingested shipments')
+    parser.add_argument('--dry-run', action='store_true', help='Do not write df_shipments.csv')
+    args = parser.parse_args(argv)
+
+    def print_file(file_report):
+        status = file_report['error'] or f"{file_report['stops']} stops"
+        print(f"{file_report['path']}: {file_report['rows']} rows, {status} in {file_report['seconds']:.2f}s")
+
+    report = ingest(args.paths, args.data_dir, args.workers, args.department, args.dry_run, on_file=print_file)
+    verb = 'Would add' if args.dry_run else 'Added'
+    print(f"{report['shipments']} complete shipments from {len(args.paths)} files "
+          f"({report['incomplete']} without both stops). {verb} {report['added']}, "
+          f"{report['duplicates']} already stored, {report['quarantined']} failed validation; "
+          f"{report['seconds']:.2f}s ({report['workers']} worker processes).")
+    if any(file_report['error'] for file_report in report['files']):
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,268 @@
+"""
+Background jobs for heavy planning computations.
+
+CPU-bound work (stop optimization, bulk consolidation, ingestion) runs in a
+pool of worker processes, so it neither blocks a request thread nor competes
+with requests for the GIL. A job is split in three parts:
+
+1. A snapshot of the state it needs, taken in the web process under the
+   relevant locks and passed to the worker as plain data.
+2. The task, a module-level function task(params, snapshot, progress) running
+   in a worker process. It only computes; it returns a JSON-able result.
+3. An optional apply(result) callable, run back in the web process once the
+   task has finished, which makes the changes through the normal mutation
+   functions and returns the result to store.
+
+Jobs are kept in a SQLite table that both sides write to: workers report
+progress there and read cancellation requests from it, and finished jobs keep
+their result until they are removed. Jobs that were queued or running when the
+process stopped are marked as failed on the next start.
+"""
+import concurrent.futures
+import json
+import multiprocessing
+import sqlite3
+import threading
+import time
+import uuid
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = 'queued', 'running', 'succeeded', 'failed', 'cancelled'
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+# Minimum seconds between two progress writes of a worker
+PROGRESS_INTERVAL = 0.2
+
+
+class JobCancelled(Exception):
+    """Raised by progress() inside a task when the job has been cancelled."""
+
+
+class JobStore:
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            owner TEXT,
+            status TEXT NOT NULL,
+            progress REAL NOT NULL DEFAULT 0,
+            message TEXT,
+            params TEXT,
+            result TEXT,
+            error TEXT,
+            cancel_requested INTEGER NOT NULL DEFAULT 0,
+            created REAL NOT NULL,
+            started REAL,
+            finished REAL
+        )
+    """
+    COLUMNS = ('id', 'kind', 'owner', 'status', 'progress', 'message', 'params', 'result', 'error',
+               'cancel_requested', 'created', 'started', 'finished')
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): SQLite file of the job table; created if missing.
+        """
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.execute(self.SCHEMA)
+
+    def _connection(self):
+        # One connection per thread; the table is also written by the worker processes
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            self._local.connection = connection
+        return connection
+
+    def _row(self, row, with_result=False):
+        if row is None:
+            return None
+        job = dict(zip(self.COLUMNS, row))
+        job['params'] = json.loads(job['params']) if job['params'] else {}
+        job['cancel_requested'] = bool(job['cancel_requested'])
+        result = job.pop('result')
+        if with_result:
+            job['result'] = json.loads(result) if result else None
+        return job
+
+    def create(self, kind, owner, params):
+        job_id = uuid.uuid4().hex[:12]
+        self._connection().execute(
+            'INSERT INTO jobs (id, kind, owner, status, params, created) VALUES (?, ?, ?, ?, ?, ?)',
+            (job_id, kind, owner, QUEUED, json.dumps(params, default=str), time.time()))
+        return job_id
+
+    def update(self, job_id, **fields):
+        if 'result' in fields:
+            fields['result'] = json.dumps(fields['result'], default=str)
+        assignments = ', '.join(f"{name} = ?" for name in fields)
+        self._connection().execute(f'UPDATE jobs SET {assignments} WHERE id = ?', (*fields.values(), job_id))
+
+    def finish(self, job_id, status, **fields):
+        """Sets a final status, unless the job has already finished (e.g. was cancelled meanwhile)."""
+        fields.update(status=status, finished=time.time())
+        if 'result' in fields:
+            fields['result'] = json.dumps(fields['result'], default=str)
+        assignments = ', '.join(f"{name} = ?" for name in fields)
+        placeholders = ', '.join('?' for _ in FINISHED)
+        self._connection().execute(
+            f'UPDATE jobs SET {assignments} WHERE id = ? AND status NOT IN ({placeholders})',
+            (*fields.values(), job_id, *FINISHED))
+
+    def get(self, job_id, with_result=False):
+        row = self._connection().execute(
+            f'SELECT {", ".join(self.COLUMNS)} FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return self._row(row, with_result)
+
+    def list(self, owner=None, status=None, limit=100):
+        conditions, values = [], []
+        if owner is not None:
+            conditions.append('owner = ?')
+            values.append(owner)
+        if status is not None:
+            conditions.append('status = ?')
+            values.append(status)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        rows = self._connection().execute(
+            f'SELECT {", ".join(self.COLUMNS)} FROM jobs {where} ORDER BY created DESC LIMIT ?',
+            (*values, limit)).fetchall()
+        return [self._row(row) for row in rows]
+
+    def request_cancel(self, job_id):
+        self._connection().execute('UPDATE jobs SET cancel_requested = 1 WHERE id = ?', (job_id,))
+
+    def cancel_requested(self, job_id):
+        row = self._connection().execute('SELECT cancel_requested FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return bool(row and row[0])
+
+    def recover(self):
+        """Marks jobs left queued or running by a previous process as failed; returns their number."""
+        cursor = self._connection().execute(
+            'UPDATE jobs SET status = ?, error = ?, finished = ? WHERE status IN (?, ?)',
+            (FAILED, 'Interrupted by a restart', time.time(), QUEUED, RUNNING))
+        return cursor.rowcount
+
+
+class Progress:
+    """Passed to tasks as progress(done, total, message); also where cancellation is noticed."""
+
+    def __init__(self, store, job_id):
+        self.store = store
+        self.job_id = job_id
+        self._last = 0.0
+
+    def __call__(self, done, total=None, message=None):
+        now = time.monotonic()
+        if now - self._last < PROGRESS_INTERVAL and (total is None or done < total):
+            return
+        self._last = now
+        fields = {'progress': min(done / total, 1.0) if total else done}
+        if message is not None:
+            fields['message'] = message
+        self.store.update(self.job_id, **fields)
+        if self.store.cancel_requested(self.job_id):
+            raise JobCancelled()
+
+
+def _run(task, db_path, job_id, params, snapshot):
+    # Entry point in the worker process
+    store = JobStore(db_path)
+    if store.cancel_requested(job_id):
+        raise JobCancelled()
+    store.update(job_id, status=RUNNING, started=time.time())
+    return task(params, snapshot, Progress(store, job_id))
+
+
+class JobRunner:
+    def __init__(self, store, workers=2, on_finish=None):
+        """
+        Args:
+            store (JobStore): Job table.
+            workers (int): Number of worker processes.
+            on_finish (callable, optional): Called with the job dict when a job has finished.
+        """
+        self.store = store
+        self.workers = workers
+        self.on_finish = on_finish
+        self._executor = None
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        # Started on the first job; 'spawn' keeps the workers free of the web process' threads and state
+        with self._lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+    def submit(self, kind, task, params, snapshot, apply=None, owner=''):
+        """
+        Queues a job.
+
+        Args:
+            kind (str): Name of the job type.
+            task (callable): Module-level function task(params, snapshot, progress) run in a worker.
+            params (dict): JSON-able parameters, stored with the job.
+            snapshot: Picklable input data for the task.
+            apply (callable, optional): apply(result) run in this process after the task; its
+                return value is stored as the job's result.
+            owner (str): User who started the job.
+
+        Returns:
+            str: Job ID.
+        """
+        job_id = self.store.create(kind, owner, params)
+        future = self._pool().submit(_run, task, self.store.path, job_id, params, snapshot)
+        self._futures[job_id] = future
+        future.add_done_callback(lambda done: self._finish(job_id, done, apply))
+        return job_id
+
+    def _finish(self, job_id, future, apply):
+        self._futures.pop(job_id, None)
+        try:
+            if future.cancelled():
+                self.store.finish(job_id, CANCELLED)
+            else:
+                result = future.result()
+                if self.store.cancel_requested(job_id):
+                    # Cancelled after the computation was done; its result is not applied
+                    self.store.finish(job_id, CANCELLED)
+                else:
+                    if apply is not None:
+                        result = apply(result)
+                    self.store.finish(job_id, SUCCEEDED, progress=1.0, result=result)
+        except JobCancelled:
+            self.store.finish(job_id, CANCELLED)
+        except Exception as e:
+            self.store.finish(job_id, FAILED, error=f"{type(e).__name__}: {e}")
+        if self.on_finish is not None:
+            self.on_finish(self.store.get(job_id))
+
+    def cancel(self, job_id):
+        """
+        Cancels a job: a queued job is dropped, a running one stops at its next progress report.
+
+        Returns:
+            bool: False when the job does not exist or has already finished.
+        """
+        job = self.store.get(job_id)
+        if job is None or job['status'] in FINISHED:
+            return False
+        self.store.request_cancel(job_id)
+        future = self._futures.get(job_id)
+        if future is not None:
+            future.cancel()
+        return True
+
+    def running(self):
+        return len(self._futures)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
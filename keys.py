@@ -0,0 +1,94 @@
+"""
+Integer surrogate keys for shipments, stops and transports.
+
+External IDs ('BOLIA-D0Q63', 'BOLIA-D0Q63_P', 'TOUR01-0001') stay the keys of
+the API, the templates and the files. Inside the process every object also
+gets a dense integer key, assigned once when its ID is first seen, and the
+objects are kept in lists indexed by that key. The data structures touched on
+every mutation (a transport's shipment set, its linked list of stops, the
+transport location grid) are keyed by these integers, so the inner loops
+neither format ID strings nor hash them; a string is mapped to its integer
+once, where it enters through a request.
+
+Stops have no table of their own: the pickup and delivery of the shipment with
+key i have the keys 2*i and 2*i + 1.
+"""
+import threading
+
+PICKUP, DELIVERY = 0, 1
+STOP_OFFSETS = {'P': PICKUP, 'D': DELIVERY}
+
+
+def stop_key(shipment_key, stop_type):
+    """Key of the pickup ('P') or delivery ('D') stop of a shipment."""
+    return 2 * shipment_key + STOP_OFFSETS[stop_type]
+
+
+def shipment_key_of_stop(key):
+    return key >> 1
+
+
+class KeyTable:
+    """External ID <-> dense integer key, and the object currently registered under each key."""
+
+    def __init__(self):
+        self._keys = {}     # external ID -> key
+        self._ids = []      # key -> external ID
+        self._objects = []  # key -> object or None
+        self._lock = threading.Lock()
+
+    def intern(self, external_id):
+        """Returns the key of an ID, assigning the next free one on first use. Keys are never reused."""
+        key = self._keys.get(external_id)
+        if key is None:
+            with self._lock:
+                key = self._keys.get(external_id)
+                if key is None:
+                    key = len(self._ids)
+                    self._ids.append(external_id)
+                    self._objects.append(None)
+                    self._keys[external_id] = key
+        return key
+
+    def key(self, external_id):
+        """Key of an ID that has been interned, else None."""
+        return self._keys.get(external_id)
+
+    def external(self, key):
+        return self._ids[key]
+
+    def bind(self, key, obj):
+        self._objects[key] = obj
+
+    def unbind(self, key):
+        self._objects[key] = None
+
+    def get(self, key):
+        return self._objects[key]
+
+    def lookup(self, external_id):
+        """Object registered under an external ID, else None."""
+        key = self._keys.get(external_id)
+        return None if key is None else self._objects[key]
+
+    def __len__(self):
+        return len(self._ids)
+
+
+class ObjectArray:
+    """Objects by integer key in a list that grows on demand; missing keys read as None."""
+
+    def __init__(self):
+        self._objects = []
+
+    def bind(self, key, obj):
+        if key >= len(self._objects):
+            self._objects.extend([None] * (key + 1 - len(self._objects)))
+        self._objects[key] = obj
+
+    def unbind(self, key):
+        if key < len(self._objects):
+            self._objects[key] = None
+
+    def get(self, key):
+        return self._objects[key] if 0 <= key < len(self._objects) else None
@@ -0,0 +1,79 @@
+"""
+Materialized KPI aggregates per department and day.
+
+The utilization dashboards need totals such as the Ldm and weight of the
+transports against the capacity of their trailers, planned against unassigned
+shipments, and Cost against Sale_cost and Haulier_cost, for each department
+and day. Summing them over the registries on every request would scan every
+transport and shipment.
+
+KpiTable keeps those sums instead. Every record (a shipment or a transport)
+contributes amounts to one or more (department, day) cells, and the table
+remembers what each record contributed. When a record changes, its previous
+contribution is subtracted and the new one added, so an update costs as much
+as the record itself and reading a cell does not depend on the size of the
+state. The app feeds the table from the registry listeners, which every
+mutation (including undo/redo, sandbox commits and archiving) goes through.
+"""
+import threading
+
+
+class KpiTable:
+    """Sums of KPI amounts per (department, day), kept up to date record by record."""
+
+    def __init__(self):
+        self._cells = {}          # (department, day) -> {amount: total}
+        self._records = {}        # (department, day) -> number of contributing records
+        self._contributions = {}  # (kind, ID) -> [((department, day), amounts), ...]
+        self._lock = threading.Lock()
+
+    def update(self, kind, record_id, contributions):
+        """
+        Replaces what a record contributes.
+
+        Args:
+            kind (str): Record type, e.g. 'shipment' or 'transport'.
+            record_id: ID of the record within its type.
+            contributions (list): ((department, day), amounts) pairs; empty or None when the
+                record no longer exists.
+        """
+        with self._lock:
+            for cell, amounts in self._contributions.pop((kind, record_id), ()):
+                self._add(cell, amounts, -1)
+            if contributions:
+                self._contributions[(kind, record_id)] = contributions
+                for cell, amounts in contributions:
+                    self._add(cell, amounts, 1)
+
+    def _add(self, cell, amounts, sign):
+        totals = self._cells.setdefault(cell, {})
+        for name, value in amounts.items():
+            totals[name] = totals.get(name, 0) + sign * value
+        self._records[cell] = self._records.get(cell, 0) + sign
+        if not self._records[cell]:
+            # Drop emptied cells rather than keep rounding leftovers of the float sums
+            del self._cells[cell]
+            del self._records[cell]
+
+    def cells(self, department=None, start=None, end=None):
+        """
+        Returns the cells of a department (all for None) from `start` to `end` (inclusive, either
+        open), as (department, day, totals) sorted by department and day. Cells without a day
+        (records with an unreadable date) are only included when no date bound is given.
+        """
+        with self._lock:
+            found = [(cell[0], cell[1], dict(totals)) for cell, totals in self._cells.items()
+                     if (department is None or cell[0] == department)
+                     and (cell[1] is not None or (start is None and end is None))
+                     and (start is None or cell[1] >= start) and (end is None or cell[1] <= end)]
+        found.sort(key=lambda item: (str(item[0]), item[1] is not None, item[1] or 0))
+        return found
+
+    def clear(self):
+        with self._lock:
+            self._cells.clear()
+            self._records.clear()
+            self._contributions.clear()
+
+    def __len__(self):
+        return len(self._cells)
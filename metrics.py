@@ -0,0 +1,221 @@
+"""
+Lightweight in-process instrumentation for the planning backend.
+
+Records per-route and per-stage latency histograms, counters and gauges and
+renders them in the Prometheus text exposition format for the /metrics
+endpoint. Observations are a bisect plus an increment under a per-metric lock,
+so they are cheap enough to leave on in the request hot path.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency buckets in seconds (upper bounds), tuned for web requests
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Row count buckets for filter steps
+ROW_BUCKETS = (0, 1, 10, 50, 100, 500, 1000, 5000, 10000, 50000, 100000, 1000000)
+
+
+def _format_labels(label_names, label_values, extra=None):
+    pairs = list(zip(label_names, label_values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = []
+    for name, value in pairs:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        escaped.append(f'{name}="{value}"')
+    return '{' + ','.join(escaped) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return repr(value)
+    return str(value)
+
+
+class Counter:
+    """Monotonically increasing counter, optionally split by labels."""
+    kind = 'counter'
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for label_values, value in sorted(items):
+            yield self.name, _format_labels(self.label_names, label_values), value
+
+
+class Gauge:
+    """Value that can go up and down, or be read from a callback at scrape time."""
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, label_names=(), callback=None):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.callback = callback
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def set(self, value, *label_values):
+        with self._lock:
+            self._values[label_values] = value
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0)
+
+    def samples(self):
+        if self.callback is not None:
+            yield self.name, '', self.callback()
+            return
+        with self._lock:
+            items = list(self._values.items())
+        for label_values, value in sorted(items):
+            yield self.name, _format_labels(self.label_names, label_values), value
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram split by labels.
+
+    Bucket counts are stored non-cumulatively and only summed up at render
+    time, so an observation is one bisect and three additions.
+    """
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, label_names=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                # [bucket counts..., +Inf count], sum, count
+                series = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                self._series[label_values] = series
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, *label_values):
+        series = self._series.get(label_values)
+        return series[2] if series else 0
+
+    def samples(self):
+        with self._lock:
+            items = [(labels, (list(s[0]), s[1], s[2])) for labels, s in self._series.items()]
+        for label_values, (bucket_counts, total, count) in sorted(items):
+            cumulative = 0
+            for upper, bucket_count in zip(self.buckets + (float('inf'),), bucket_counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.label_names, label_values, ('le', _format_value(float(upper))))
+                yield f'{self.name}_bucket', labels, cumulative
+            labels = _format_labels(self.label_names, label_values)
+            yield f'{self.name}_sum', labels, total
+            yield f'{self.name}_count', labels, count
+
+
+class MetricsRegistry:
+    """Holds all metrics of the process and renders them for scraping."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, documentation, label_names=()):
+        return self._register(Counter(name, documentation, label_names))
+
+    def gauge(self, name, documentation, label_names=(), callback=None):
+        gauge = self._register(Gauge(name, documentation, label_names, callback))
+        # Registering again (e.g. from a second app) reads the new callback's state from now on
+        if callback is not None:
+            gauge.callback = callback
+        return gauge
+
+    def histogram(self, name, documentation, label_names=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, documentation, label_names, buckets))
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def render(self):
+        """Returns all metrics in the Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        for name in sorted(self._metrics):
+            metric = self._metrics[name]
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for sample_name, labels, value in metric.samples():
+                lines.append(f'{sample_name}{labels} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+registry = MetricsRegistry()
+
+REQUEST_LATENCY = registry.histogram(
+    'mobility_request_duration_seconds', 'Request latency per route.', ('route', 'method', 'status'))
+REQUESTS_TOTAL = registry.counter(
+    'mobility_requests_total', 'Number of handled requests per route.', ('route', 'method', 'status'))
+REQUESTS_IN_FLIGHT = registry.gauge(
+    'mobility_requests_in_flight', 'Requests currently being handled.')
+STAGE_LATENCY = registry.histogram(
+    'mobility_stage_duration_seconds', 'Latency of request stages (load, filter, to_dict, stream, index, search, recommend, eta, plan).',
+    ('route', 'stage'))
+FILTER_ROWS = registry.histogram(
+    'mobility_filter_rows', 'Rows remaining after each filter step.', ('route', 'step'), buckets=ROW_BUCKETS)
+PERSIST_FLUSH_LATENCY = registry.histogram(
+    'mobility_persist_flush_duration_seconds', 'Latency of background table writes.', ('table',))
+PERSIST_ERRORS = registry.counter(
+    'mobility_persist_errors_total', 'Failed background table writes.', ('table',))
+
+
+@contextmanager
+def time_stage(route, stage):
+    """Context manager recording the wall time of a block as a stage of a route."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_LATENCY.observe(time.perf_counter() - start, route, stage)
+
+
+def observe_rows(route, step, rows):
+    FILTER_ROWS.observe(rows, route, step)
@@ -0,0 +1,189 @@
+"""
+Write-behind persistence of in-memory tables to CSV.
+
+Request handlers call ``mark_dirty('trucks')`` and return immediately. A
+background thread picks up dirty tables, waits at most ``interval`` seconds so
+bursts of changes coalesce into a single write, and then writes each table
+atomically (temporary file in the same directory plus ``os.replace``), so a
+crash mid-write never leaves a truncated CSV behind.
+
+Durability modes:
+    'async' - (default) writes happen in the background within `interval` seconds;
+              a crash can lose the changes of the last interval.
+    'sync'  - the table is written and fsynced before mark_dirty returns.
+    'off'   - nothing is written (benchmarks, throwaway sessions).
+
+Pending changes are always written on stop(), which is registered with atexit.
+"""
+import atexit
+import os
+import tempfile
+import threading
+import time
+
+DURABILITY_MODES = ('async', 'sync', 'off')
+
+
+class WriteBehindPersister:
+    def __init__(self, durability='async', interval=1.0, on_flush=None, on_error=None):
+        """
+        Args:
+            durability (str): One of 'async', 'sync' or 'off'.
+            interval (float): Upper bound in seconds between a change and its write in 'async' mode.
+            on_flush (callable, optional): Called as on_flush(table, seconds) after each successful write.
+            on_error (callable, optional): Called as on_error(table, exception) when a write fails.
+        """
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"durability must be one of {DURABILITY_MODES}, got '{durability}'.")
+        self.durability = durability
+        self.interval = interval
+        self.on_flush = on_flush
+        self.on_error = on_error
+
+        self._tables = {}
+        self._dirty = {}  # table name -> number of changes since the last write
+        self._first_dirty_at = None
+        self._condition = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._thread = None
+        self._stopping = False
+
+        self.last_flush_seconds = 0.0
+        self.last_flush_at = None
+        self.flush_count = 0
+        self.error_count = 0
+
+    def register(self, name, path, snapshot, writer=None):
+        """
+        Registers a table.
+
+        Args:
+            name (str): Name used with mark_dirty().
+            path (str): Target CSV file.
+            snapshot (callable): Returns the DataFrame to write, as a copy that nothing changes meanwhile;
+                taken under the lock the writers of the table hold, so it never has a change half applied.
+            writer (callable, optional): writer(frame, file_path) overriding the default to_csv(index=False).
+        """
+        self._tables[name] = (path, snapshot, writer)
+
+    def start(self):
+        if self.durability != 'async' or self._thread is not None:
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name='write-behind-persister', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        """Stops the background thread and writes everything still pending."""
+        thread = self._thread
+        if thread is not None:
+            with self._condition:
+                self._stopping = True
+                self._condition.notify_all()
+            thread.join()
+            self._thread = None
+        self.flush()
+
+    def mark_dirty(self, name):
+        if name not in self._tables:
+            raise KeyError(f"Unknown table '{name}'.")
+        if self.durability == 'off':
+            return
+        if self.durability == 'sync':
+            with self._condition:
+                self._dirty[name] = self._dirty.get(name, 0) + 1
+            self.flush([name])
+            return
+        with self._condition:
+            if not self._dirty:
+                self._first_dirty_at = time.monotonic()
+            self._dirty[name] = self._dirty.get(name, 0) + 1
+            self._condition.notify()
+
+    @property
+    def queue_depth(self):
+        """Number of changes marked but not yet written."""
+        return sum(self._dirty.values())
+
+    def stats(self):
+        return {
+            'durability': self.durability,
+            'interval': self.interval,
+            'queue_depth': self.queue_depth,
+            'dirty_tables': sorted(self._dirty),
+            'last_flush_seconds': self.last_flush_seconds,
+            'last_flush_at': self.last_flush_at,
+            'flush_count': self.flush_count,
+            'error_count': self.error_count,
+        }
+
+    def flush(self, names=None):
+        """Writes the given (default: all) dirty tables now, in the calling thread."""
+        with self._condition:
+            names = [n for n in (names or list(self._dirty)) if n in self._dirty]
+            for name in names:
+                del self._dirty[name]
+            if not self._dirty:
+                self._first_dirty_at = None
+        for name in names:
+            self._write(name)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._dirty and not self._stopping:
+                    self._condition.wait()
+                if self._stopping:
+                    return
+                # Coalesce: hold off until `interval` has passed since the first pending change.
+                # Later mark_dirty() calls notify as well, so keep waiting until the deadline.
+                deadline = self._first_dirty_at + self.interval
+                while not self._stopping:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                if self._stopping:
+                    return
+            self.flush()
+
+    def _write(self, name):
+        path, snapshot, writer = self._tables[name]
+        start = time.perf_counter()
+        try:
+            frame = snapshot()
+            directory = os.path.dirname(os.path.abspath(path))
+            with self._write_lock:
+                fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix='.tmp', dir=directory)
+                try:
+                    with os.fdopen(fd, 'w', newline='', encoding='utf-8') as f:
+                        if writer is not None:
+                            writer(frame, f)
+                        else:
+                            frame.to_csv(f, index=False)
+                        if self.durability == 'sync':
+                            f.flush()
+                            os.fsync(f.fileno())
+                    os.replace(tmp_path, path)
+                except BaseException:
+                    if os.path.exists(tmp_path):
+                        os.unlink(tmp_path)
+                    raise
+        except Exception as e:
+            self.error_count += 1
+            # Keep the change pending so the next flush retries it
+            with self._condition:
+                if not self._dirty:
+                    self._first_dirty_at = time.monotonic()
+                self._dirty[name] = self._dirty.get(name, 0) + 1
+            if self.on_error is not None:
+                self.on_error(name, e)
+            if self.durability == 'sync':
+                raise
+            return
+        self.last_flush_seconds = time.perf_counter() - start
+        self.last_flush_at = time.time()
+        self.flush_count += 1
+        if self.on_flush is not None:
+            self.on_flush(name, self.last_flush_seconds)
@@ -0,0 +1,158 @@
+"""
+Opt-in cProfile capture of live requests.
+
+A request is profiled when it asks for it (``X-Profile: 1`` header or
+``?profile=1`` query parameter) or when it is picked by the global sampling
+rate. Finished profiles are kept in a bounded ring buffer, so memory use stays
+fixed no matter how long the server runs; the oldest profile is dropped first.
+
+Configuration through environment variables:
+    MOBILITY_PROFILE_SAMPLE_RATE - fraction of requests profiled automatically (default 0)
+    MOBILITY_PROFILE_CAPACITY    - number of profiles kept in memory (default 50)
+"""
+import collections
+import cProfile
+import datetime
+import io
+import itertools
+import marshal
+import os
+import pstats
+import random
+import threading
+import time
+
+
+class ProfileRecord:
+    __slots__ = ('id', 'route', 'method', 'url', 'status', 'trigger', 'started', 'duration', 'stats')
+
+    def __init__(self, id, route, method, url, status, trigger, started, duration, stats):
+        self.id = id
+        self.route = route
+        self.method = method
+        self.url = url
+        self.status = status
+        self.trigger = trigger
+        self.started = started
+        self.duration = duration
+        self.stats = stats  # marshalled pstats data, loadable with pstats.Stats
+
+    def summary(self):
+        return {
+            'id': self.id,
+            'route': self.route,
+            'method': self.method,
+            'url': self.url,
+            'status': self.status,
+            'trigger': self.trigger,
+            'started': self.started.isoformat(timespec='seconds'),
+            'duration_ms': round(self.duration * 1000, 2),
+        }
+
+    def report(self, sort_by='cumulative', limit=60):
+        """Returns the pstats text report of this profile."""
+        stream = io.StringIO()
+        stats = pstats.Stats(_MarshalledStats(self.stats), stream=stream)
+        stats.strip_dirs().sort_stats(sort_by).print_stats(limit)
+        return stream.getvalue()
+
+
+class _MarshalledStats:
+    """Adapter letting pstats.Stats load from marshalled bytes instead of a file."""
+
+    def __init__(self, data):
+        self.stats = marshal.loads(data)
+
+    def create_stats(self):
+        pass
+
+
+class ActiveProfile:
+    __slots__ = ('id', 'profiler', 'trigger', 'started', 'start_time')
+
+    def __init__(self, trigger):
+        # Assigned when profiling starts, so a streamed response can name its profile up front
+        self.id = None
+        self.profiler = cProfile.Profile()
+        self.trigger = trigger
+        self.started = datetime.datetime.now()
+        self.start_time = time.perf_counter()
+
+
+class RequestProfiler:
+    """
+    Decides which requests to profile and stores the results.
+
+    Only one request is profiled at a time: Python allows a single active
+    profiler per interpreter on newer versions, and overlapping profiles would
+    mostly measure each other. A request that asks for a profile while another
+    one is running is simply served unprofiled.
+    """
+
+    def __init__(self, sample_rate=0.0, capacity=50):
+        self.sample_rate = sample_rate
+        self._records = collections.deque(maxlen=capacity)
+        self._ids = itertools.count(1)
+        self._running = threading.Lock()
+        self._lock = threading.Lock()
+
+    @property
+    def capacity(self):
+        return self._records.maxlen
+
+    def trigger_for(self, headers, args):
+        """Returns why a request should be profiled ('header', 'query', 'sample') or None."""
+        if headers.get('X-Profile', '').lower() in ('1', 'true', 'yes'):
+            return 'header'
+        if args.get('profile', '').lower() in ('1', 'true', 'yes'):
+            return 'query'
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return 'sample'
+        return None
+
+    def start(self, trigger):
+        if not self._running.acquire(blocking=False):
+            return None
+        active = ActiveProfile(trigger)
+        try:
+            active.profiler.enable()
+        except ValueError:
+            # Another profiler (e.g. a debugger or an outer cProfile run) is already active
+            self._running.release()
+            return None
+        active.id = next(self._ids)
+        return active
+
+    def stop(self, active, route, method, url, status):
+        try:
+            active.profiler.disable()
+        finally:
+            self._running.release()
+        duration = time.perf_counter() - active.start_time
+        active.profiler.create_stats()
+        record = ProfileRecord(active.id, route, method, url, status, active.trigger,
+                               active.started, duration, marshal.dumps(active.profiler.stats))
+        with self._lock:
+            self._records.append(record)
+        return record
+
+    def list(self):
+        with self._lock:
+            return [record.summary() for record in reversed(self._records)]
+
+    def get(self, profile_id):
+        with self._lock:
+            for record in self._records:
+                if record.id == profile_id:
+                    return record
+        return None
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+
+
+profiler = RequestProfiler(
+    sample_rate=float(os.environ.get('MOBILITY_PROFILE_SAMPLE_RATE', '0') or 0),
+    capacity=int(os.environ.get('MOBILITY_PROFILE_CAPACITY', '50') or 50),
+)
@@ -0,0 +1,115 @@
+"""
+Multi-day truck rotations.
+
+transfer_truck closes a transport and makes its truck available again at a
+new Date/Time; the next transport is then assigned by hand. plan() chains the
+Planning transports of a department onto its trucks for a whole horizon in
+one pass: every truck is tracked by where and when it becomes available, and
+each transport, earliest first, goes to the truck that reaches its first stop
+with the shortest empty drive without missing that stop's window. The truck
+then becomes available at the last stop of the transport, at its ETA (see
+eta.py), for the next one.
+
+The plan is a proposal. Only the next transport of each idle truck can be
+assigned, since a truck holds one transport at a time; the rest of the chain
+is picked up again after the truck's transfer.
+"""
+import datetime
+
+import eta
+
+
+def _first_earliest(transport):
+    for _, _, earliest, _ in transport['stops']:
+        if earliest is not None:
+            return earliest
+    return datetime.datetime.max
+
+
+def plan(model, trucks, transports):
+    """
+    Chains transports onto trucks.
+
+    Args:
+        model (eta.EtaModel): Drive and service times.
+        trucks (list): {'id', 'point', 'available'} per truck; 'available' is the datetime the
+            truck can leave from 'point', trucks without one only run the transports fixed on them.
+        transports (list): {'id', 'truck', 'stops'} per transport, with the stops as accepted by
+            eta.propagate(); transports with a 'truck' already run on that truck and are skipped
+            when that truck is not in `trucks`.
+
+    Returns:
+        dict: 'rotations' (truck ID -> list of legs in driving order), 'unscheduled' (IDs of the
+        transports no truck reaches in time) and 'trucks' (truck ID -> point and time it is
+        available after its last leg).
+    """
+    state = {truck['id']: (truck['point'], truck['available']) for truck in trucks}
+    rotations = {truck['id']: [] for truck in trucks}
+    unscheduled = []
+
+    def run(transport, truck_id, fixed):
+        timeline = eta.propagate(model, state[truck_id], transport['stops'])
+        last_point = next((stop[1] for stop in reversed(transport['stops']) if stop[1] is not None),
+                          state[truck_id][0])
+        rotations[truck_id].append({
+            'transport_id': transport['id'],
+            'fixed': fixed,
+            'empty_km': timeline.stops[0]['distance_km'] if timeline.stops else 0.0,
+            'first_arrival': timeline.stops[0]['arrival'] if timeline.stops else None,
+            **timeline.summary(),
+        })
+        if timeline.end is not None:
+            state[truck_id] = (last_point, timeline.end)
+
+    ordered = sorted(transports, key=_first_earliest)
+    # Transports already on a truck come first in its rotation
+    for transport in ordered:
+        if transport['truck'] in state:
+            run(transport, transport['truck'], True)
+
+    for transport in ordered:
+        # Transports on a truck outside the plan are left alone
+        if transport['truck']:
+            continue
+        if not transport['stops']:
+            unscheduled.append(transport['id'])
+            continue
+        _, first_point, earliest, latest = transport['stops'][0]
+        best = None
+        for truck_id, (point, available) in state.items():
+            if available is None:
+                continue
+            empty_km = model.distance_km(point, first_point)
+            arrival = available + datetime.timedelta(minutes=model.drive_minutes(empty_km))
+            if latest is not None and arrival > latest:
+                continue
+            # Least waiting time at the first stop breaks ties between equally close trucks
+            candidate = (empty_km, max(earliest - arrival, datetime.timedelta()) if earliest else datetime.timedelta(),
+                         str(truck_id))
+            if best is None or candidate < best[0]:
+                best = (candidate, truck_id)
+        if best is None:
+            unscheduled.append(transport['id'])
+        else:
+            run(transport, best[1], False)
+
+    return {
+        'rotations': rotations,
+        'unscheduled': unscheduled,
+        'trucks': {truck_id: {'point': point, 'available': available} for truck_id, (point, available) in state.items()},
+    }
+
+
+def calendar(rotations):
+    """
+    Truck ID -> {day: [Transport_IDs reaching their first stop that day]} from the rotations of
+    plan(); legs without a known arrival are listed under 'undated'.
+    """
+    days = {}
+    for truck_id, legs in rotations.items():
+        by_day = days.setdefault(truck_id, {})
+        for leg in legs:
+            arrival = leg['first_arrival']
+            by_day.setdefault(arrival.date().isoformat() if arrival is not None else 'undated', []).append(
+                leg['transport_id'])
+    return days
@@ -0,0 +1,196 @@
+"""
+What-if planning sandboxes with copy-on-write state.
+
+A sandbox never copies the planning state up front. Each table (shipments,
+transports, trucks) is wrapped in an Overlay: reads of untouched records fall
+through to the live state, and the first write to a record stores a private
+copy of it together with a snapshot of the base it was copied from. A session
+therefore costs memory proportional to the records it changed.
+
+The base snapshots double as optimistic concurrency control: on commit, every
+touched record is compared with the live state again, and the commit is
+refused when something changed underneath the sandbox.
+
+KPIs are kept as running totals. They are computed once from the live state
+when the sandbox is opened and afterwards only adjusted by the contribution of
+the record that changed, so reading them is O(1).
+"""
+import threading
+import time
+import uuid
+
+
+def _copy_record(record):
+    # Records are flat dicts; container fields (e.g. the shipment set of a transport) are copied one level deep
+    return {key: (value.copy() if isinstance(value, (dict, list, set)) else value) for key, value in record.items()}
+
+
+class Overlay:
+    """Copy-on-write view of one table, keyed by record ID."""
+
+    def __init__(self, load, on_change=None):
+        """
+        Args:
+            load (callable): load(key) returns the live record as a dict, or None if it does not exist.
+            on_change (callable, optional): Called as on_change(old, new) whenever a record is replaced;
+                old is None for created records.
+        """
+        self._load = load
+        self._on_change = on_change
+        self._changes = {}  # key -> record as changed in the sandbox
+        self._base = {}     # key -> live record when first touched (None for records created here)
+
+    def get(self, key):
+        if key in self._changes:
+            return self._changes[key]
+        return self._load(key)
+
+    def copy(self, key):
+        """Returns an editable copy of a record, to be written back with put()."""
+        record = self.get(key)
+        return None if record is None else _copy_record(record)
+
+    def put(self, key, record):
+        old = self.get(key)
+        if key not in self._base:
+            self._base[key] = None if old is None else _copy_record(old)
+        self._changes[key] = record
+        if self._on_change is not None:
+            self._on_change(old, record)
+
+    def __contains__(self, key):
+        return key in self._changes
+
+    def __len__(self):
+        return len(self._changes)
+
+    def changes(self):
+        """Yields (key, record, base) for every record changed in the sandbox."""
+        for key, record in self._changes.items():
+            yield key, record, self._base[key]
+
+    def conflicts(self):
+        """Returns the keys whose live record differs from the one the sandbox started from."""
+        return [key for key, base in self._base.items() if self._load(key) != base]
+
+
+class KpiAccumulator:
+    """Running totals, adjusted by the difference of the old and new contribution of a record."""
+
+    def __init__(self, totals):
+        self.totals = dict(totals)
+
+    def apply(self, removed, added):
+        for key, value in removed.items():
+            self.totals[key] = self.totals.get(key, 0) - value
+        for key, value in added.items():
+            self.totals[key] = self.totals.get(key, 0) + value
+
+
+class Sandbox:
+    def __init__(self, session_id, owner, scope, loaders, contribution, base_totals):
+        """
+        Args:
+            session_id (str): ID of the sandbox.
+            owner (str): User who opened the sandbox.
+            scope (str): Department the KPIs are computed for ('ALL' for all departments).
+            loaders (dict): Table name -> load(key) callable for the live records.
+            contribution (callable): contribution(table, record) -> dict of KPI amounts of a record;
+                must return {} for None.
+            base_totals (dict): KPI totals of the live state when the sandbox is opened.
+        """
+        self.id = session_id
+        self.owner = owner
+        self.scope = scope
+        self.created = time.time()
+        self.last_used = self.created
+        self.lock = threading.RLock()
+        self.kpis = KpiAccumulator(base_totals)
+        self.tables = {
+            name: Overlay(load, self._change_handler(name, contribution))
+            for name, load in loaders.items()
+        }
+        self._provisional_ids = 0
+
+    def _change_handler(self, table, contribution):
+        def on_change(old, new):
+            self.kpis.apply(contribution(table, old), contribution(table, new))
+        return on_change
+
+    def provisional_id(self, prefix='SANDBOX'):
+        """ID for a record created in the sandbox; the real ID is assigned on commit."""
+        self._provisional_ids += 1
+        return f"{prefix}-{self.id}-{self._provisional_ids}"
+
+    def is_provisional(self, key, prefix='SANDBOX'):
+        return isinstance(key, str) and key.startswith(f"{prefix}-{self.id}-")
+
+    def conflicts(self):
+        return {name: keys for name, keys in ((name, table.conflicts()) for name, table in self.tables.items()) if keys}
+
+    def size(self):
+        """Number of records held by the sandbox."""
+        return sum(len(table) for table in self.tables.values())
+
+    def touch(self):
+        self.last_used = time.time()
+
+    def summary(self):
+        return {
+            'id': self.id,
+            'owner': self.owner,
+            'scope': self.scope,
+            'created': self.created,
+            'last_used': self.last_used,
+            'changed_records': {name: len(table) for name, table in self.tables.items()},
+        }
+
+
+class SandboxStore:
+    """Open sandboxes, bounded in number; sandboxes idle for longer than `ttl` seconds are dropped."""
+
+    def __init__(self, capacity=100, ttl=3600.0):
+        self.capacity = capacity
+        self.ttl = ttl
+        self._sandboxes = {}
+        self._lock = threading.Lock()
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl
+        for session_id in [sid for sid, s in self._sandboxes.items() if s.last_used < cutoff]:
+            del self._sandboxes[session_id]
+
+    def open(self, factory):
+        """
+        Creates a sandbox with factory(session_id).
+
+        Raises:
+            RuntimeError: When `capacity` sandboxes are already open.
+        """
+        with self._lock:
+            self._expire()
+            if len(self._sandboxes) >= self.capacity:
+                raise RuntimeError(f"Too many open sandboxes (limit {self.capacity}).")
+            sandbox = factory(uuid.uuid4().hex[:12])
+            self._sandboxes[sandbox.id] = sandbox
+            return sandbox
+
+    def get(self, session_id):
+        with self._lock:
+            self._expire()
+            sandbox = self._sandboxes.get(session_id)
+        if sandbox is not None:
+            sandbox.touch()
+        return sandbox
+
+    def drop(self, session_id):
+        with self._lock:
+            return self._sandboxes.pop(session_id, None)
+
+    def list(self):
+        with self._lock:
+            self._expire()
+            return [sandbox.summary() for sandbox in self._sandboxes.values()]
+
+    def __len__(self):
+        return len(self._sandboxes)
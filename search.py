@@ -0,0 +1,200 @@
+"""
+Trigram index for type-ahead search over shipments and transports.
+
+Every document (a shipment or a transport) is a handful of text fields, e.g.
+Shipment_ID, Customer or Delivery_City. The index maps each lower-cased
+three-character substring (trigram) to the documents containing it. A query
+term of three or more characters can only occur in documents that contain all
+of its trigrams, so intersecting those posting sets (smallest first) gives a
+short candidate list, which is then checked with a real substring test.
+Terms of one or two characters have no trigram; as is usual for type-ahead
+they only match at the start of a word, and the index also keeps the one and
+two character word prefixes for them.
+
+Results are ranked by how the term matches a field (whole field, start of the
+field, start of a word, anywhere), then by the order of the fields (IDs before
+names before cities), then by the length of the matched text.
+"""
+import heapq
+import itertools
+import threading
+
+# Match classes, best first
+EXACT, PREFIX, WORD_PREFIX, SUBSTRING = range(4)
+MATCH_NAMES = ('exact', 'prefix', 'word', 'substring')
+
+
+def normalize(value):
+    """Lower-cased text of a field value; None and NaN become ''."""
+    if value is None or value != value:
+        return ''
+    return ' '.join(str(value).casefold().split())
+
+
+# Marks word-prefix keys in the posting table, so they cannot collide with trigrams
+WORD_START = '\x02'
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _keys(text):
+    """Posting keys of a text: its trigrams and the one and two character prefixes of its words."""
+    keys = trigrams(text)
+    for word in _words(text):
+        keys.add(WORD_START + word[:1])
+        keys.add(WORD_START + word[:2])
+    return keys
+
+
+def _words(text):
+    word = []
+    for char in text:
+        if char.isalnum():
+            word.append(char)
+        elif word:
+            yield ''.join(word)
+            word = []
+    if word:
+        yield ''.join(word)
+
+
+def _term_keys(term):
+    return trigrams(term) if len(term) >= 3 else {WORD_START + term}
+
+
+def _match_class(term, text):
+    if text == term:
+        return EXACT
+    if text.startswith(term):
+        return PREFIX
+    position = text.find(term)
+    if position < 0:
+        return None
+    while position >= 0:
+        if position == 0 or not text[position - 1].isalnum():
+            return WORD_PREFIX
+        position = text.find(term, position + 1)
+    return SUBSTRING
+
+
+class TrigramIndex:
+    def __init__(self):
+        self._postings = {}  # trigram -> set of document numbers
+        self._docs = {}      # document number -> (kind, key, group, {field: text})
+        self._numbers = {}   # (kind, key) -> document number
+        self._next = itertools.count()
+        self._lock = threading.RLock()
+
+    def add(self, kind, key, fields, group=None):
+        """
+        Adds or replaces a document.
+
+        Args:
+            kind (str): Document type, e.g. 'shipment'.
+            key (str): ID of the document within its kind.
+            fields (dict): Field name -> value, in ranking order (most important first).
+            group (str, optional): Value results can be filtered on, e.g. the Department.
+        """
+        texts = {field: normalize(value) for field, value in fields.items()}
+        with self._lock:
+            number = self._numbers.get((kind, key))
+            if number is not None:
+                old = self._docs[number]
+                if old[2] == group and old[3] == texts:
+                    return
+                self._unindex(number)
+            else:
+                number = self._numbers[(kind, key)] = next(self._next)
+            self._docs[number] = (kind, key, group, texts)
+            for key in self._doc_keys(texts):
+                self._postings.setdefault(key, set()).add(number)
+
+    def remove(self, kind, key):
+        with self._lock:
+            number = self._numbers.pop((kind, key), None)
+            if number is not None:
+                self._unindex(number)
+                del self._docs[number]
+
+    @staticmethod
+    def _doc_keys(texts):
+        keys = set()
+        for text in texts.values():
+            keys |= _keys(text)
+        return keys
+
+    def _unindex(self, number):
+        for key in self._doc_keys(self._docs[number][3]):
+            posting = self._postings.get(key)
+            if posting is not None:
+                posting.discard(number)
+                if not posting:
+                    del self._postings[key]
+
+    def _candidates(self, terms):
+        keys = set()
+        for term in terms:
+            keys |= _term_keys(term)
+        postings = sorted((self._postings.get(key, ()) for key in keys), key=len)
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            if not candidates:
+                break
+            candidates &= posting
+        return candidates
+
+    def search(self, query, limit=10, kinds=None, group=None):
+        """
+        Returns the best matches of a case-insensitive substring query.
+
+        Every whitespace-separated term of the query must occur in some field of a document.
+
+        Args:
+            query (str): Search text.
+            limit (int): Maximum number of results.
+            kinds (iterable, optional): Only return these document types.
+            group (str, optional): Only return documents of this group.
+
+        Returns:
+            list: Dicts with kind, id, group, the best matching field and how it matched.
+        """
+        terms = normalize(query).split()
+        if not terms:
+            return []
+        kinds = set(kinds) if kinds else None
+        ranked = []
+        with self._lock:
+            for number in self._candidates(terms):
+                kind, key, doc_group, texts = self._docs[number]
+                if (kinds is not None and kind not in kinds) or (group is not None and doc_group != group):
+                    continue
+                best = None
+                for term in terms:
+                    term_best = None
+                    for position, (field, text) in enumerate(texts.items()):
+                        match = _match_class(term, text)
+                        if match is not None and (match != SUBSTRING or len(term) >= 3):
+                            rank = (match, position, len(text), field)
+                            if term_best is None or rank < term_best:
+                                term_best = rank
+                    if term_best is None:
+                        break
+                    if best is None or term_best < best:
+                        best = term_best
+                else:
+                    ranked.append((best, kind, key, doc_group))
+        return [
+            {'kind': kind, 'id': key, 'group': doc_group, 'field': field, 'match': MATCH_NAMES[match]}
+            for (match, _, _, field), kind, key, doc_group in heapq.nsmallest(
+                limit, ranked, key=lambda item: (item[0], item[1], str(item[2])))
+        ]
+
+    def __len__(self):
+        return len(self._docs)
+
+    def stats(self):
+        with self._lock:
+            return {'documents': len(self._docs), 'trigrams': len(self._postings),
+                    'postings': sum(len(posting) for posting in self._postings.values())}
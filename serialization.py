@@ -0,0 +1,150 @@
+"""
+JSON encoding of API responses.
+
+Responses are encoded with orjson when it is installed and with the standard
+library otherwise. Both paths understand NumPy scalars and arrays, pandas
+timestamps and dates, so handlers can return values straight from DataFrame
+columns or domain objects without casting each field.
+
+Large lists can be sent in a columnar layout, where the field names appear
+once and each field is an array of values:
+
+    {"fields": ["Shipment_ID", "Weight"], "columns": [["A1", "B2"], [120.0, 80.5]]}
+
+Bodies above COMPRESS_MIN_BYTES are compressed with brotli (if installed) or
+gzip, depending on what the client accepts.
+"""
+import datetime
+import decimal
+import gzip
+import json
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:  # optional dependency, the standard library is used instead
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # optional dependency, gzip is used instead
+    brotli = None
+
+from flask.json.provider import DefaultJSONProvider
+
+# Responses smaller than this are sent uncompressed; compression would cost more than it saves
+COMPRESS_MIN_BYTES = 4096
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+
+
+def _default(value):
+    """Converts values neither encoder handles natively."""
+    if isinstance(value, np.generic):
+        value = value.item()
+        return None if isinstance(value, float) and value != value else value
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        # pandas.NaT is a datetime subclass but has no meaningful value
+        return None if value != value else value.isoformat()
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _option(sort_keys=False, indent=None):
+    option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+    if sort_keys:
+        option |= orjson.OPT_SORT_KEYS
+    if indent:
+        option |= orjson.OPT_INDENT_2
+    return option
+
+
+def dumps(obj, sort_keys=False, indent=None):
+    """Encodes an object to JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=_option(sort_keys, indent))
+    return json.dumps(obj, default=_default, sort_keys=sort_keys, indent=indent,
+                      separators=(',', ':') if indent is None else None, ensure_ascii=False).encode('utf-8')
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _column_values(values):
+    # Numeric arrays are passed through as arrays (orjson encodes them natively); object
+    # arrays (strings with missing values) become lists
+    if orjson is not None and values.dtype.kind in 'biuf':
+        return values
+    return values.tolist()
+
+
+def columnar(frame, fields=None):
+    """
+    Builds the columnar layout from DataFrame columns, without converting to records.
+
+    Args:
+        frame (DataFrame): Rows to encode.
+        fields (list, optional): Columns to include, default all.
+    """
+    fields = list(frame.columns if fields is None else fields)
+    return {'fields': fields, 'columns': [_column_values(frame[field].to_numpy()) for field in fields]}
+
+
+def columnar_objects(objs, fields):
+    """Builds the columnar layout from objects (e.g. slotted domain objects) by attribute."""
+    return {'fields': list(fields), 'columns': [[getattr(obj, field) for obj in objs] for field in fields]}
+
+
+def records(objs, fields):
+    """Builds one dict per object from the given attributes."""
+    return [{field: getattr(obj, field) for field in fields} for obj in objs]
+
+
+def iter_records(frame, fields=None):
+    """
+    Yields one dict per DataFrame row, built from the column arrays.
+
+    Unlike to_dict('records') the rows are produced lazily, so a streamed page can start
+    sending before all rows are converted.
+    """
+    fields = list(frame.columns if fields is None else fields)
+    columns = [frame[field].tolist() for field in fields]
+    for values in zip(*columns):
+        yield dict(zip(fields, values))
+
+
+def compress(body, accept_encoding):
+    """
+    Compresses a response body if it is large enough and the client accepts it.
+
+    Returns:
+        tuple: (body, content encoding or None)
+    """
+    if len(body) < COMPRESS_MIN_BYTES or not accept_encoding:
+        return body, None
+    accepted = {part.split(';')[0].strip().lower() for part in accept_encoding.split(',')}
+    if brotli is not None and 'br' in accepted:
+        return brotli.compress(body, quality=BROTLI_QUALITY), 'br'
+    if 'gzip' in accepted:
+        return gzip.compress(body, compresslevel=GZIP_LEVEL), 'gzip'
+    return body, None
+
+
+class JSONProvider(DefaultJSONProvider):
+    """Flask JSON provider using dumps() above, so jsonify() handles NumPy values natively."""
+
+    def dumps(self, obj, **kwargs):
+        return dumps(obj, sort_keys=kwargs.get('sort_keys', self.sort_keys),
+                     indent=kwargs.get('indent')).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return loads(s)
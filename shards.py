@@ -0,0 +1,266 @@
+"""
+Per-department partitions of the in-memory planning state.
+
+Almost every view and operation works on one department (NAESJ, KDEGR, KDEFR,
+KFRGR). The state stays in one DataFrame per table and one registry per object
+type; the shards here are indexes on top of them:
+
+- ShardedRegistry is the ID -> object registry that also keeps a dict per
+  department, so listing a department's transports does not scan the others.
+- FramePartition holds the row positions of each department in a DataFrame,
+  so a department's rows are taken directly instead of comparing the
+  Department column of every row.
+- ShardLocks hands out one lock per department, so operations on different
+  departments do not wait for each other.
+- DatePartition and DateIndex bucket the rows of a DataFrame and the objects
+  of a registry by day within each department, so a view limited to a date
+  window only touches the days inside it.
+
+Department values of records never change, which is what keeps the indexes
+valid without hooks on the mutation paths. The same holds for the Pickup_date
+column of the shipments table; a transport's Pickup_date does change, and
+DateIndex follows it through the registry listeners.
+"""
+import contextlib
+import datetime
+import itertools
+import threading
+import types
+
+import numpy as np
+import pandas as pd
+
+
+class ShardedRegistry(dict):
+    """ID -> object registry, additionally partitioned by an attribute of the objects."""
+
+    def __init__(self, attribute='Department'):
+        super().__init__()
+        self.attribute = attribute
+        self._shards = {}  # attribute value -> {ID: object}, in insertion order
+        self._listeners = []
+
+    def subscribe(self, listener):
+        """
+        Calls listener(key, obj) after every insert, replace or notify(), and listener(key, None)
+        after a removal.
+        """
+        self._listeners.append(listener)
+
+    def __setitem__(self, key, obj):
+        old = dict.get(self, key)
+        if old is not None:
+            self._shards.get(getattr(old, self.attribute), {}).pop(key, None)
+        super().__setitem__(key, obj)
+        self._shards.setdefault(getattr(obj, self.attribute), {})[key] = obj
+        for listener in self._listeners:
+            listener(key, obj)
+
+    def notify(self, key):
+        """Tells the listeners that a registered object has changed in place."""
+        obj = dict.get(self, key)
+        if obj is not None:
+            for listener in self._listeners:
+                listener(key, obj)
+
+    def __delitem__(self, key):
+        obj = self[key]
+        super().__delitem__(key)
+        self._shards.get(getattr(obj, self.attribute), {}).pop(key, None)
+        for listener in self._listeners:
+            listener(key, None)
+
+    def pop(self, key, *default):
+        if key in self:
+            obj = self[key]
+            del self[key]
+            return obj
+        return super().pop(key, *default)
+
+    def clear(self):
+        super().clear()
+        self._shards.clear()
+
+    def shard(self, value):
+        """Returns the objects of one department as a read-only view ({ID: object})."""
+        return types.MappingProxyType(self._shards.get(value, {}))
+
+    def shards(self):
+        return {value: len(objs) for value, objs in self._shards.items()}
+
+
+class FramePartition:
+    """Row positions per value of a DataFrame column, built once per DataFrame."""
+
+    def __init__(self, column='Department'):
+        self.column = column
+        self._frame = None
+        self._rows = 0
+        self._positions = {}
+        self._lock = threading.Lock()
+
+    def positions(self, frame):
+        """Returns value -> array of row positions; rebuilt when the frame is replaced or resized."""
+        with self._lock:
+            if self._frame is not frame or self._rows != len(frame):
+                self._positions = frame.groupby(self.column, sort=False).indices
+                self._frame = frame
+                self._rows = len(frame)
+            return self._positions
+
+    def shard(self, frame, value):
+        """Returns the rows of one department, in frame order (like frame[frame[column] == value])."""
+        positions = self.positions(frame).get(value)
+        if positions is None:
+            return frame.iloc[0:0]
+        return frame.take(positions)
+
+
+class DatePartition:
+    """
+    Row positions per (department, day) of a DataFrame date column, built once per DataFrame.
+
+    Rows whose date cannot be parsed belong to no day and are never part of a window.
+    """
+
+    def __init__(self, column='Pickup_date', group='Department'):
+        self.column = column
+        self.group = group
+        self._frame = None
+        self._rows = 0
+        self._buckets = {}  # (department, day) and (None, day) -> array of row positions
+        self._lock = threading.Lock()
+
+    def buckets(self, frame):
+        """Returns the day buckets of a frame; rebuilt when the frame is replaced or resized."""
+        with self._lock:
+            if self._frame is not frame or self._rows != len(frame):
+                days = pd.to_datetime(frame[self.column], errors='coerce').dt.date
+                buckets = {(None, day): positions for day, positions in days.groupby(days, sort=False).indices.items()}
+                buckets.update(days.groupby([frame[self.group], days], sort=False).indices)
+                self._buckets = buckets
+                self._frame = frame
+                self._rows = len(frame)
+            return self._buckets
+
+    def window(self, frame, group, start, end):
+        """
+        Returns the rows dated from `start` to `end` (inclusive), in frame order.
+
+        Args:
+            group: Department, or None for all departments.
+        """
+        buckets = self.buckets(frame)
+        parts = [buckets[(group, day)] for day in _days(start, end, buckets, lambda key: key[1])
+                 if (group, day) in buckets]
+        if not parts:
+            return frame.iloc[0:0]
+        return frame.take(np.sort(np.concatenate(parts)))
+
+
+class DateIndex:
+    """
+    Registry objects per day of a date attribute and department, kept up to date as a registry listener.
+
+    Windows are returned in registry order (insertion order), like listing the registry itself.
+    """
+
+    def __init__(self, attribute='Pickup_date', group='Department', day=None):
+        """
+        Args:
+            day (callable, optional): Converts an attribute value to a datetime.date; a value
+                it cannot convert puts the object on no day.
+        """
+        self.attribute = attribute
+        self.group = group
+        self._day = day or (lambda value: value)
+        self._buckets = {}  # day -> department -> {ID: object}
+        self._placed = {}   # ID -> (day, department, insertion number)
+        self._inserted = itertools.count()
+        self._lock = threading.Lock()
+
+    def __call__(self, key, obj):
+        with self._lock:
+            placed = self._placed.pop(key, None)
+            if placed is not None:
+                day, group, number = placed
+                objs = self._buckets[day][group]
+                del objs[key]
+                if not objs:
+                    del self._buckets[day][group]
+                    if not self._buckets[day]:
+                        del self._buckets[day]
+            if obj is None:
+                return
+            try:
+                day = self._day(getattr(obj, self.attribute))
+            except (ValueError, TypeError, AttributeError):
+                day = None
+            group = getattr(obj, self.group)
+            # A changed object keeps its place in the order, a (re-)inserted one goes last
+            number = placed[2] if placed is not None else next(self._inserted)
+            self._placed[key] = (day, group, number)
+            self._buckets.setdefault(day, {}).setdefault(group, {})[key] = obj
+
+    def window(self, group, start, end):
+        """
+        Returns the objects dated from `start` to `end` (inclusive).
+
+        Args:
+            group: Department, or None for all departments.
+        """
+        found = []
+        with self._lock:
+            for day in _days(start, end, self._buckets):
+                groups = self._buckets.get(day)
+                if not groups:
+                    continue
+                for objs in (groups.values() if group is None else [groups.get(group, {})]):
+                    found.extend((self._placed[key][2], obj) for key, obj in objs.items())
+        found.sort(key=lambda item: item[0])
+        return [obj for _, obj in found]
+
+    def days(self):
+        with self._lock:
+            return {str(day): sum(map(len, groups.values())) for day, groups in self._buckets.items()}
+
+
+def _days(start, end, known, day_of=lambda key: key):
+    """
+    Yields the days from `start` to `end`, or only those of the `known` bucket keys when the
+    window spans more days than there are buckets.
+    """
+    if (end - start).days >= len(known):
+        yield from sorted({day for day in map(day_of, known) if day is not None and start <= day <= end})
+        return
+    day = start
+    while day <= end:
+        yield day
+        day += datetime.timedelta(days=1)
+
+
+class ShardLocks:
+    """One re-entrant lock per department, created on first use."""
+
+    def __init__(self):
+        self._locks = {}
+        self._guard = threading.Lock()
+
+    def lock(self, value):
+        with self._guard:
+            lock = self._locks.get(value)
+            if lock is None:
+                lock = self._locks[value] = threading.RLock()
+            return lock
+
+    @contextlib.contextmanager
+    def hold(self, values):
+        """Holds the locks of several departments, acquired in a fixed order to avoid deadlocks."""
+        locks = [self.lock(value) for value in sorted(set(values), key=str)]
+        for lock in locks:
+            lock.acquire()
+        try:
+            yield
+        finally:
+            for lock in reversed(locks):
+                lock.release()
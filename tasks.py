@@ -0,0 +1,147 @@
+"""
+CPU-bound planning computations, run as background jobs (see jobs.py).
+
+Tasks run in worker processes and only see the snapshot they are given: plain
+dicts and lists built from the live state when the job was started. They
+return a result describing the changes to make; the web process applies it.
+"""
+import collections
+import os
+
+import constraints
+import geo
+import ingest
+
+
+def _route_km(points):
+    return sum(geo.distance_km(a, b) for a, b in zip(points, points[1:]) if a is not None and b is not None)
+
+
+def _precedence_ok(order, stops):
+    # Every pickup before the delivery of the same shipment
+    seen = set()
+    for stop_id in order:
+        stop = stops[stop_id]
+        if stop['type'] == 'D' and stop['pickup'] in stops and stop['pickup'] not in seen:
+            return False
+        seen.add(stop_id)
+    return True
+
+
+def _optimize_order(order, stops, max_rounds=50):
+    """
+    Shortens a stop order by moving single stops (relocate moves), keeping each pickup
+    before its delivery, until no move helps. Returns the best order found.
+    """
+    points = {stop_id: stops[stop_id]['point'] for stop_id in order}
+    best = list(order)
+    best_km = _route_km([points[s] for s in best])
+    for _ in range(max_rounds):
+        improved = False
+        for i in range(len(best)):
+            stop_id = best[i]
+            rest = best[:i] + best[i + 1:]
+            for j in range(len(rest) + 1):
+                if j == i:
+                    continue
+                candidate = rest[:j] + [stop_id] + rest[j:]
+                km = _route_km([points[s] for s in candidate])
+                if km < best_km - 1e-9 and _precedence_ok(candidate, stops):
+                    best, best_km = candidate, km
+                    improved = True
+                    break
+            if improved:
+                break
+        if not improved:
+            break
+    return best, best_km
+
+
+def optimize_stops(params, snapshot, progress):
+    """
+    Re-sequences the stops of every transport in the snapshot to shorten its route.
+
+    Snapshot: list of {'transport_id', 'stops': [{'id', 'type', 'pickup', 'point'}]} in the
+    current order, where 'id' is the stop key (see keys.py) and 'pickup' the key of the
+    shipment's pickup.
+
+    Returns:
+        dict: 'changes' lists {'transport_id', 'before', 'after', 'before_km', 'after_km'} for
+        transports whose route got shorter.
+    """
+    changes = []
+    for done, transport in enumerate(snapshot):
+        progress(done, len(snapshot), f"Optimizing {transport['transport_id']}")
+        stops = {stop['id']: stop for stop in transport['stops']}
+        order = [stop['id'] for stop in transport['stops']]
+        before_km = _route_km([stops[s]['point'] for s in order])
+        after, after_km = _optimize_order(order, stops, params.get('max_rounds', 50))
+        if after != order and after_km < before_km - 1e-6:
+            changes.append({'transport_id': transport['transport_id'], 'before': order, 'after': after,
+                            'before_km': round(before_km, 1), 'after_km': round(after_km, 1)})
+    progress(len(snapshot), len(snapshot), 'Done')
+    return {'transports': len(snapshot), 'changes': changes}
+
+
+def consolidate(params, snapshot, progress):
+    """
+    Groups unassigned shipments into new transports.
+
+    Shipments with the same pickup date and delivery region are packed, largest loading meters
+    first, into groups that fit at least one trailer type (first fit decreasing). Groups of a
+    single shipment are not proposed.
+
+    Snapshot: list of {'id', 'pickup_date', 'delivery_point', 'Weight', 'Ldm', 'Volume',
+    'Hazardous', 'min_temperature', 'max_temperature'} of unassigned shipments.
+
+    Returns:
+        dict: 'groups' is a list of shipment ID lists, one per proposed transport.
+    """
+    cell_degrees = params.get('region_degrees', 1.0)
+    buckets = collections.defaultdict(list)
+    for shipment in snapshot:
+        point = shipment['delivery_point']
+        region = None if point is None else (int(point[0] // cell_degrees), int(point[1] // cell_degrees))
+        buckets[(shipment['pickup_date'], region)].append(shipment)
+
+    groups = []
+    for done, shipments in enumerate(buckets.values()):
+        progress(done, len(buckets), 'Packing shipments')
+        bins = []  # list of shipment lists
+        for shipment in sorted(shipments, key=lambda s: (-s['Ldm'], s['id'])):
+            for members in bins:
+                candidate = members + [shipment]
+                columns = {name: [s[name] for s in candidate] for name in constraints.COLUMNS}
+                if not constraints.engine.check(columns):
+                    members.append(shipment)
+                    break
+            else:
+                bins.append([shipment])
+        groups.extend([s['id'] for s in members] for members in bins if len(members) > 1)
+    progress(len(buckets), len(buckets), 'Done')
+    return {'groups': groups, 'shipments': len(snapshot)}
+
+
+def ingest_dumps(params, snapshot, progress):
+    """
+    Parses shipment dump files and merges their shipments into df_shipments.csv (see ingest.py).
+
+    Snapshot: {'paths': dump files in priority order, 'data_dir': directory of df_shipments.csv}.
+    All shipments get params['department'].
+
+    Returns:
+        dict: The ingest report: per-file results under 'files' and the numbers of complete,
+        added, already stored and quarantined shipments.
+    """
+    paths = snapshot['paths']
+    parsed = []
+
+    def on_file(report):
+        parsed.append(report)
+        progress(len(parsed), len(paths) + 1, f"Parsed {os.path.basename(report['path'])}")
+
+    # This already is a worker process; the files are parsed one after the other in it
+    report = ingest.ingest(paths, snapshot['data_dir'], workers=1, department=params.get('department'),
+                           on_file=on_file)
+    progress(1, 1, 'Done')
+    return report
@@ -0,0 +1,158 @@
+"""
+Schema validation of the shipment table when it is loaded.
+
+All rules are evaluated on whole columns at once: every rule produces a
+boolean mask over the rows, and the masks are combined into one row x rule
+table. Rows failing an error rule are quarantined, i.e. taken out of the table
+before any Shipment object is created, and listed with the rules they broke in
+a report. This replaces finding bad rows one object at a time (a duplicate
+Shipment_ID used to overwrite the registry entry of the first one, and its
+stops were only noticed by a warning in Stop.__init__).
+
+Rules with severity 'warning' are reported but the rows are kept, unless
+validation runs in strict mode. Delivery dates before the pickup date are a
+warning: the planning export contains such rows and planners still need to
+see those shipments.
+"""
+import collections
+
+import numpy as np
+import pandas as pd
+
+ERROR, WARNING = 'error', 'warning'
+
+Rule = collections.namedtuple('Rule', 'name severity description')
+
+SHIPMENT_RULES = (
+    Rule('missing_id', ERROR, 'Shipment_ID is empty'),
+    Rule('duplicate_id', ERROR, 'Shipment_ID already used by an earlier row'),
+    Rule('missing_department', ERROR, 'Department is empty'),
+    Rule('invalid_number', ERROR, 'Weight, Volume, Ldm, Units, Cost or a temperature is not a number'),
+    Rule('invalid_date', ERROR, 'Pickup_date or Delivery_date is not a YYYY-MM-DD date'),
+    Rule('invalid_hazardous', ERROR, 'Hazardous is not True or False'),
+    Rule('negative_quantity', ERROR, 'Weight, Volume, Ldm or Units is negative'),
+    Rule('temperature_range', ERROR, 'min_temperature is above max_temperature'),
+    Rule('date_order', WARNING, 'Delivery_date is before Pickup_date'),
+)
+
+REQUIRED_COLUMNS = ('Shipment_ID', 'Department', 'Pickup_date', 'Delivery_date', 'Weight', 'Volume', 'Ldm')
+NUMERIC_COLUMNS = ('Weight', 'Volume', 'Ldm', 'Units', 'Cost', 'min_temperature', 'max_temperature')
+NON_NEGATIVE_COLUMNS = ('Weight', 'Volume', 'Ldm', 'Units')
+BOOLEAN_VALUES = {True, False, 'True', 'False', 'true', 'false', 1, 0}
+
+# Quarantined rows listed in a report; the counts always cover all of them
+MAX_REPORTED_ROWS = 1000
+
+
+def _blank(column):
+    return column.isna() | (column.astype('string').str.strip() == '')
+
+
+def _numbers(frame, name):
+    """Column as floats and the mask of values that are present but not numeric."""
+    if name not in frame.columns:
+        return None, np.zeros(len(frame), dtype=bool)
+    values = pd.to_numeric(frame[name], errors='coerce')
+    return values, (values.isna() & ~_blank(frame[name])).to_numpy()
+
+
+def _dates(frame, name):
+    values = pd.to_datetime(frame[name], format='%Y-%m-%d', errors='coerce')
+    return values, values.isna().to_numpy()
+
+
+def shipment_masks(frame):
+    """
+    Evaluates SHIPMENT_RULES on a shipment table.
+
+    Returns:
+        DataFrame: One boolean column per rule, True where a row breaks the rule.
+    """
+    missing = [name for name in REQUIRED_COLUMNS if name not in frame.columns]
+    if missing:
+        raise ValueError(f"Shipment table is missing the columns {missing}.")
+
+    ids = frame['Shipment_ID']
+    masks = {
+        'missing_id': _blank(ids).to_numpy(),
+        'duplicate_id': (ids.duplicated(keep='first') & ids.notna()).to_numpy(),
+        'missing_department': _blank(frame['Department']).to_numpy(),
+    }
+
+    numbers, invalid_number = {}, np.zeros(len(frame), dtype=bool)
+    for name in NUMERIC_COLUMNS:
+        numbers[name], invalid = _numbers(frame, name)
+        invalid_number |= invalid
+    masks['invalid_number'] = invalid_number
+
+    pickup, invalid_pickup = _dates(frame, 'Pickup_date')
+    delivery, invalid_delivery = _dates(frame, 'Delivery_date')
+    masks['invalid_date'] = invalid_pickup | invalid_delivery
+
+    if 'Hazardous' in frame.columns:
+        hazardous = frame['Hazardous']
+        masks['invalid_hazardous'] = (~hazardous.isin(BOOLEAN_VALUES) & hazardous.notna()).to_numpy()
+    else:
+        masks['invalid_hazardous'] = np.zeros(len(frame), dtype=bool)
+
+    negative = np.zeros(len(frame), dtype=bool)
+    for name in NON_NEGATIVE_COLUMNS:
+        if numbers[name] is not None:
+            negative |= (numbers[name] < 0).to_numpy()
+    masks['negative_quantity'] = negative
+
+    low, high = numbers['min_temperature'], numbers['max_temperature']
+    masks['temperature_range'] = (
+        (low > high).to_numpy() if low is not None and high is not None else np.zeros(len(frame), dtype=bool))
+    # NaT compares as False, so rows with an invalid date are not also reported here
+    masks['date_order'] = (delivery < pickup).to_numpy()
+    return pd.DataFrame(masks, index=frame.index)[[rule.name for rule in SHIPMENT_RULES]]
+
+
+def validate_shipments(frame, strict=False):
+    """
+    Splits a shipment table into the rows to load and the quarantined rows.
+
+    Args:
+        frame (DataFrame): The table as read from df_shipments.csv.
+        strict (bool): Also quarantine rows that only break warning rules.
+
+    Returns:
+        tuple: (valid rows, unchanged and in file order; report dict)
+    """
+    masks = shipment_masks(frame)
+    severities = {rule.name: rule.severity for rule in SHIPMENT_RULES}
+    blocking = [name for name in masks.columns if strict or severities[name] == ERROR]
+    quarantined = masks[blocking].to_numpy().any(axis=1)
+    flagged = masks.to_numpy().any(axis=1)
+
+    rows = []
+    names = np.array(masks.columns)
+    for position in np.flatnonzero(flagged)[:MAX_REPORTED_ROWS]:
+        broken = names[masks.iloc[position].to_numpy()]
+        rows.append({
+            # Line in the CSV file: the header is line 1
+            'line': int(position) + 2,
+            'Shipment_ID': _text(frame['Shipment_ID'].iat[position]),
+            'rules': broken.tolist(),
+            'quarantined': bool(quarantined[position]),
+        })
+
+    report = {
+        'table': 'shipments',
+        'checked': len(frame),
+        'loaded': int((~quarantined).sum()),
+        'quarantined': int(quarantined.sum()),
+        'warnings': int((flagged & ~quarantined).sum()),
+        'strict': strict,
+        'rules': [dict(rule._asdict(), rows=int(masks[rule.name].sum())) for rule in SHIPMENT_RULES],
+        'rows': rows,
+        'rows_truncated': int(flagged.sum()) > len(rows),
+    }
+    if quarantined.any():
+        frame = frame[~quarantined].reset_index(drop=True)
+    return frame, report
+
+
+def _text(value):
+    return None if value is None or value != value else str(value)